@@ -0,0 +1,99 @@
+"""Benchmark of the alert pipeline against a slow, flaky local webhook.
+
+Collection threads raise alerts for random instances of a simulated fleet while the AlertDispatcher
+delivers digests to a WebhookStandIn (see fleet_standins.py) with the given latency and failure rate.
+Reports how long submit() takes in the collection threads, which must not depend on the webhook, what
+the dedup and cooldown rules made of the alerts, and the digests the webhook received. Also checks that
+no alert key reached the webhook twice within the cooldown.
+
+Usage: python benchmarks/bench_alerts.py [--alerts 20000] [--threads 32] [--instances 1000]
+                                         [--webhook-latency 0.5] [--webhook-failure-rate 0.2]
+                                         [--batch-seconds 1] [--cooldown 3] [--rounds 3]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fleet_standins
+from check_bot import instrumentation
+from check_bot.alerts import Alert, AlertDispatcher, WebhookSink
+
+
+KINDS = ('utilization', 'stalled', 'unreachable', 'outlier', 'drop', 'below_group')
+
+
+def raise_alerts(dispatcher, count, instances, seed, latencies):
+    rng = random.Random(seed)
+    for _ in range(count):
+        instance_id = rng.randrange(instances)
+        alert = Alert(rng.choice(KINDS), instance_id, f"Synthetic problem of instance {instance_id}")
+        started = time.perf_counter()
+        dispatcher.submit(alert)
+        latencies.append(time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the alert pipeline against a local webhook stand-in.")
+    parser.add_argument('--alerts', type=int, default=20000, help="Alerts raised per round (default: 20000)")
+    parser.add_argument('--threads', type=int, default=32, help="Collection threads raising them (default: 32)")
+    parser.add_argument('--instances', type=int, default=1000, help="Instances the alerts are spread over (default: 1000)")
+    parser.add_argument('--webhook-latency', type=float, default=0.5, help="Mean webhook response latency in seconds (default: 0.5)")
+    parser.add_argument('--webhook-failure-rate', type=float, default=0.2, help="Fraction of webhook requests answered with 503 (default: 0.2)")
+    parser.add_argument('--batch-seconds', type=float, default=1.0, help="Digest batching window (default: 1)")
+    parser.add_argument('--cooldown', type=float, default=3.0, help="Cooldown per alert key (default: 3)")
+    parser.add_argument('--rounds', type=int, default=3, help="Rounds of alerts, one second apart (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic alerts (default: 0)")
+    args = parser.parse_args(argv)
+
+    with fleet_standins.WebhookStandIn(latency=args.webhook_latency, failure_rate=args.webhook_failure_rate, seed=args.seed) as webhook:
+        dispatcher = AlertDispatcher([WebhookSink(webhook.url, timeout=10, max_retries=5, backoff_base=0.1)], cooldown=args.cooldown,
+                                     batch_seconds=args.batch_seconds, max_batch=10 ** 6, max_queued=10 ** 6)
+        latencies = []
+        started = time.perf_counter()
+        for round_number in range(args.rounds):
+            threads = [threading.Thread(target=raise_alerts, args=(dispatcher, args.alerts // args.threads, args.instances,
+                                                                   args.seed + round_number * args.threads + number, latencies))
+                       for number in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            time.sleep(1)
+        raising_seconds = time.perf_counter() - started
+        dispatcher.close(timeout=120)
+        total_seconds = time.perf_counter() - started
+
+    latencies_us = np.array(latencies) * 1e6
+    print(f"{len(latencies)} alerts from {args.threads} threads in {args.rounds} rounds, raised in {raising_seconds:.2f} s, "
+          f"all delivered after {total_seconds:.2f} s")
+    print(f"submit() latency: p50 {np.percentile(latencies_us, 50):.1f} us, p99 {np.percentile(latencies_us, 99):.1f} us, "
+          f"max {latencies_us.max():.1f} us")
+    outcomes = {}
+    for labels, value in instrumentation.ALERTS._items():
+        outcomes[labels[1]] = outcomes.get(labels[1], 0) + value.value
+    print("Alerts by outcome: " + ", ".join(f"{outcome} {count:.0f}" for outcome, count in sorted(outcomes.items())))
+
+    delivered = [(arrived, alert) for arrived, body in webhook.bodies for alert in body['alerts']]
+    print(f"Webhook: {webhook.requests} requests, {len(webhook.bodies)} digests accepted with {len(delivered)} alerts")
+    last_delivery = {}
+    violations = 0
+    for arrived, alert in sorted(delivered, key=lambda item: item[0]):
+        key = (alert['kind'], alert['instance_id'])
+        # Retries make a digest arrive later than it was sent, so allow one batch window of slack
+        if key in last_delivery and arrived - last_delivery[key] < args.cooldown - args.batch_seconds:
+            violations += 1
+        last_delivery[key] = arrived
+    print(f"Keys delivered again within the cooldown: {violations}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Benchmark of the cost-efficiency engine over a synthetic metrics history.
+
+Writes --days of samples of --instances instances into a temporary MetricsStore, --samples-per-hour per
+instance, with a known price, hash rate and block rate per GPU type, a few instances that find no
+blocks, restarted miners and a deposit. The balance goes down at the listed DPH plus --overhead.
+Then times MetricsStore.hourly_rollup() and efficiency.analyze() twice: cold, when the rollup of every
+past day is computed and cached, and warm, when only today's samples are read. Compares the USD/Block
+per GPU type and the observed spend rate with the values the history was generated from.
+--engine-instances additionally times analyze() alone on a generated rollup of that many instances
+over the same days, without SQLite.
+
+Usage: python benchmarks/bench_efficiency.py [--instances 1000] [--days 14] [--samples-per-hour 2]
+                                             [--engine-instances 5000] [--overhead 0.03]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_bot import efficiency
+from check_bot.metrics_store import NUMERIC_COLUMNS, MetricsStore
+
+
+# (name, USD/h per GPU, blocks/h per GPU, H/s per GPU)
+GPU_TYPES = (('RTX 3090', 0.20, 2.0, 1500.0), ('RTX 4090', 0.40, 4.4, 3200.0), ('A100 PCIE', 0.90, 6.0, 4500.0), ('RTX 3060', 0.08, 0.7, 600.0))
+
+
+def synthetic_instances(count, rng):
+    types = rng.integers(0, len(GPU_TYPES), count)
+    num_gpus = rng.choice([1, 2, 4, 8], count)
+    # A few hosts that cost money and find nothing
+    broken = rng.random(count) < 0.02
+    return types, num_gpus, broken
+
+
+def write_history(store, count, days, samples_per_hour, overhead, rng):
+    types, num_gpus, broken = synthetic_instances(count, rng)
+    dph = np.array([GPU_TYPES[t][1] for t in types]) * num_gpus
+    blocks_per_hour = np.where(broken, 0.0, np.array([GPU_TYPES[t][2] for t in types]) * num_gpus)
+    hash_rate = np.where(broken, 0.0, np.array([GPU_TYPES[t][3] for t in types]) * num_gpus)
+    end = int(time.time()) // 3600 * 3600
+    start = end - days * 86400
+    timestamps = np.arange(start, end, 3600 // samples_per_hour)
+    hours = (timestamps - start) / 3600
+    # The balance drops at the listed DPH plus the overhead, with one deposit half way
+    burn = dph.sum() * (1 + overhead)
+    balance = 5000 - burn * hours + np.where(hours >= days * 12, 1000, 0)
+    restart_hour = days * 24 // 3
+    for instance in range(count):
+        blocks = np.floor(blocks_per_hour[instance] * np.where(hours >= restart_hour, hours - restart_hour, hours) * rng.uniform(0.95, 1.05))
+        values = np.full((timestamps.size, len(NUMERIC_COLUMNS)), np.nan)
+        values[:, NUMERIC_COLUMNS.index('num_gpus')] = num_gpus[instance]
+        values[:, NUMERIC_COLUMNS.index('dph_total')] = dph[instance]
+        values[:, NUMERIC_COLUMNS.index('hash_rate')] = hash_rate[instance] * rng.uniform(0.97, 1.03, timestamps.size)
+        values[:, NUMERIC_COLUMNS.index('normal_blocks')] = blocks
+        values[:, NUMERIC_COLUMNS.index('balance')] = balance
+        rows = [(int(ts), *(None if value != value else value for value in row)) for ts, row in zip(timestamps.tolist(), values.tolist())]
+        store.append_history(10_000_000 + instance, GPU_TYPES[types[instance]][0], f"rig-{instance % 7}", rows)
+    return start, end, burn
+
+
+def synthetic_rollup(count, days, rng):
+    types, num_gpus, broken = synthetic_instances(count, rng)
+    hours = np.arange(days * 24)
+    instance_ids = np.repeat(np.arange(count, dtype=np.int64), hours.size)
+    entry_types = np.repeat(types, hours.size)
+    entry_gpus = np.repeat(num_gpus, hours.size).astype(np.float64)
+    blocks_per_hour = np.where(np.repeat(broken, hours.size), 0.0, np.array([GPU_TYPES[t][2] for t in entry_types]) * entry_gpus)
+    return {'instance_id': instance_ids, 'hour': np.tile(hours * 3600, count).astype(np.int64),
+            'gpu_name': np.array([name for name, _, _, _ in GPU_TYPES], dtype=object)[entry_types],
+            'label': np.full(instance_ids.size, None, dtype=object), 'samples': np.ones(instance_ids.size, dtype=np.int64),
+            'num_gpus': entry_gpus, 'dph_total': np.array([GPU_TYPES[t][1] for t in entry_types]) * entry_gpus,
+            'hash_rate': np.array([GPU_TYPES[t][3] for t in entry_types]) * entry_gpus,
+            'normal_blocks': np.floor(blocks_per_hour * np.tile(hours, count))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cost-efficiency engine over a synthetic metrics history.")
+    parser.add_argument('--instances', type=int, default=1000, help="Instances in the stored history (default: 1000)")
+    parser.add_argument('--days', type=int, default=14, help="Days of history (default: 14)")
+    parser.add_argument('--samples-per-hour', type=int, default=2, help="Samples per instance and hour (default: 2)")
+    parser.add_argument('--engine-instances', type=int, default=5000, help="Instances of the generated rollup for analyze() alone, 0 to skip (default: 5000)")
+    parser.add_argument('--overhead', type=float, default=0.03, help="Spend beyond the listed DPH, as a fraction (default: 0.03)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic history (default: 0)")
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = MetricsStore(directory, retention_days=None, compress_after_days=None)
+        started = time.perf_counter()
+        since, until, burn = write_history(store, args.instances, args.days, args.samples_per_hour, args.overhead, rng)
+        store.close()
+        print(f"Wrote {args.instances * args.days * 24 * args.samples_per_hour} samples ({args.instances} instances, {args.days} days) "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        store = MetricsStore(directory, retention_days=None, compress_after_days=None)
+        # The first query computes and caches the rollup of every past day, later ones only read today's samples
+        for run in ('cold', 'warm'):
+            started = time.perf_counter()
+            rollup = store.hourly_rollup(since, until, with_balance=True)
+            rollup_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            result = efficiency.analyze(rollup, rollup['balance_ts'], rollup['balance'])
+            analyze_seconds = time.perf_counter() - started
+            print(f"{run}: hourly_rollup() {rollup_seconds * 1000:.0f} ms for {rollup['instance_id'].size} instance-hours, "
+                  f"analyze() {analyze_seconds * 1000:.0f} ms")
+        store.close()
+
+    print(f"{'GPU Name':<12} {'USD/Block':>10} {'expected':>10}")
+    for index, name in enumerate(result['gpu_types'].tolist()):
+        _, usd_per_gpu_hour, blocks_per_gpu_hour, _ = next(gpu_type for gpu_type in GPU_TYPES if gpu_type[0] == name)
+        print(f"{name:<12} {result['by_type']['usd_per_block'][index]:>10.4f} {usd_per_gpu_hour / blocks_per_gpu_hour:>10.4f}  "
+              f"(broken hosts included in the measured value)")
+    runway = result['runway']
+    print(f"Observed spend {runway['usd_per_hour']:.4f} $/h, generated {burn:.4f} $/h, deposits left out ${runway['deposits']:.2f}")
+    ranked = result['ranking']['order']
+    no_blocks = int(np.sum(result['instances']['blocks'][ranked] == 0))
+    print(f"{ranked.size} active instances ranked, the first {no_blocks} found no blocks")
+
+    if args.engine_instances:
+        rollup = synthetic_rollup(args.engine_instances, args.days, rng)
+        started = time.perf_counter()
+        efficiency.analyze(rollup, np.zeros(0, dtype=np.int64), np.zeros(0))
+        print(f"analyze() alone: {(time.perf_counter() - started) * 1000:.0f} ms for {rollup['instance_id'].size} instance-hours "
+              f"({args.engine_instances} instances, {args.days} days)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""End-to-end benchmark of a collection cycle against a simulated fleet.
+
+Starts the local stand-ins from fleet_standins.py for each fleet size and drives the collector like a
+watch-mode run: instance_list(), the balance, collect_log_info() with incremental LogTails (or the remote
+agent with --remote-agent) over the SSH connection pool, build_table_data(), the anomaly
+detectors, print_table() and report_outliers(). Between cycles every log grows by --append-lines lines.
+The first cycle connects to every host (cold), later cycles reuse the pooled connections (warm).
+
+The simulated hosts all share this machine, so every remote agent's python3 start competes for the
+same CPUs as the collector; on a real fleet each host runs its agent on its own CPU.
+
+Reports the wall time of all cycles, latency percentiles per phase and per request (every API request
+and every get_log_info() call), the bytes read over SSH, failed log reads and the peak RSS. Each fleet size runs in its own
+process, so the peak RSS belongs to that size alone. Table output goes to a buffer, not the terminal.
+
+Usage: python benchmarks/bench_fleet.py [--instances 10,1000,10000] [--cycles 3] [--ssh-latency 0.02]
+                                       [--ssh-failure-rate 0.01] [--api-latency 0.1] [--remote-agent]
+                                       [--json results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fleet_standins
+from check_bot import collector, config, instances, instrumentation, report
+from check_bot.anomaly import AnomalyTracker
+from check_bot.ssh_pool import SSHConnectionPool
+from check_bot.vast_api import VastClient
+
+
+PHASES = ['instance_list', 'balance', 'collect_log_info', 'build_table_data', 'anomaly_detection', 'print_table', 'report_outliers', 'cycle',
+          'api_request', 'get_log_info']
+
+
+class Timings:
+    """Durations in seconds per (phase, cold or warm), safe to record from several threads."""
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+        self.cold = True
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.durations.setdefault(f"{phase} {'cold' if self.cold else 'warm'}", []).append(seconds)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def timed(self, name, function):
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def run_fleet(size, args):
+    """Run the benchmark for one fleet size and return its results as a dict."""
+    timings = Timings()
+    failed_log_reads = 0
+    config.remote_agent = args.remote_agent
+    with tempfile.TemporaryDirectory() as directory:
+        key_path = os.path.join(directory, 'id_ed25519')
+        fleet_standins.write_key(key_path)
+        setup_started = time.perf_counter()
+        fleet = fleet_standins.SyntheticFleet(size, os.path.join(directory, 'logs'), log_lines=args.log_lines, seed=args.seed)
+        setup_seconds = time.perf_counter() - setup_started
+
+        with fleet_standins.FleetStandIns(fleet, key_path, api_latency=args.api_latency, api_failure_rate=args.api_failure_rate,
+                                          ssh_latency=args.ssh_latency, ssh_failure_rate=args.ssh_failure_rate,
+                                          ssh_processes=args.ssh_processes, seed=args.seed) as standins:
+            api_client = VastClient('benchmark', base_url=standins.api_url, backoff_base=0.1)
+            api_client.get = timings.timed('api_request', api_client.get)
+            collector.get_log_info = timings.timed('get_log_info', collector.get_log_info)
+            ssh_pool = SSHConnectionPool(key_path, max_connections=args.pool_size or config.ssh_pool_max_connections,
+                                         connect_timeout=config.ssh_connect_timeout)
+            log_tails = {}
+            anomaly_tracker = AnomalyTracker(group_slack=config.threshold)
+            output = io.StringIO()
+
+            started = time.perf_counter()
+            try:
+                for cycle in range(args.cycles):
+                    timings.cold = cycle == 0
+                    if cycle:
+                        fleet.append(args.append_lines)
+                    with timings.phase('cycle'):
+                        with timings.phase('instance_list'):
+                            ssh_info_list, total_dph_running_machines, total_gpus_running = instances.instance_list(api_client)
+                        with timings.phase('balance'):
+                            balance = instances.get_vastai_balance(api_client)
+                        for ssh_info in ssh_info_list:
+                            if ssh_info['instance_id'] not in log_tails:
+                                log_tails[ssh_info['instance_id']] = collector.make_log_tail(window_seconds=config.rate_window_minutes * 60)
+                        with timings.phase('collect_log_info'):
+                            log_info_list = collector.collect_log_info(ssh_info_list, 'root', ssh_pool,
+                                                                       max_workers=args.workers or config.max_concurrent_connections,
+                                                                       command_timeout=config.ssh_command_timeout, log_tails=log_tails)
+                        failed_log_reads += sum(log_info[4] is None for log_info in log_info_list)
+                        with timings.phase('build_table_data'):
+                            fleet_data = report.build_table_data(ssh_info_list, log_info_list, log_tails)
+                        with timings.phase('anomaly_detection'):
+                            anomaly_tracker.update_fleet(fleet_data['fleet'], fleet_data['gpu_types'], log_tails)
+                        output.seek(0)
+                        output.truncate()
+                        with contextlib.redirect_stdout(output):
+                            instances.print_vastai_balance(balance, total_dph_running_machines)
+                            with timings.phase('print_table'):
+                                report.print_table(fleet_data['table_data'], fleet_data['mean_difficulty'],
+                                                   fleet_data['average_dollars_per_normal_block'], total_dph_running_machines,
+                                                   fleet_data['usd_per_gpu'], fleet_data['hash_rate_per_gpu'], fleet_data['hash_rate_per_usd'],
+                                                   fleet_data['label'], fleet_data['sum_normal_block_per_hour'], fleet_data['total_hash_rate'],
+                                                   total_gpus_running)
+                            with timings.phase('report_outliers'):
+                                report.report_outliers(fleet_data['fleet'], fleet_data['gpu_types'], fleet_data['gpu_util_warnings_set'])
+                wall_seconds = time.perf_counter() - started
+            finally:
+                ssh_pool.close_all()
+                api_client.close()
+
+    return {
+        'instances': size,
+        'cycles': args.cycles,
+        'setup_seconds': setup_seconds,
+        'wall_seconds': wall_seconds,
+        'failed_log_reads': failed_log_reads,
+        'ssh_bytes_read': instrumentation.SSH_BYTES_READ.get(),
+        'rows_last_cycle': len(fleet_data['table_data']),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'latency_ms': {name: {'count': len(values), 'p50': float(np.percentile(values, 50)) * 1000, 'p90': float(np.percentile(values, 90)) * 1000,
+                              'p99': float(np.percentile(values, 99)) * 1000, 'max': max(values) * 1000}
+                       for name, values in timings.durations.items()},
+    }
+
+
+def _run_in_process(size, args, results):
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    results.put(run_fleet(size, args))
+
+
+def print_results(result):
+    print(f"\n{result['instances']} instances, {result['cycles']} cycles: wall time {result['wall_seconds']:.3f} s, "
+          f"peak RSS {result['peak_rss_mib']:.1f} MiB, {result['ssh_bytes_read'] / 1024:.0f} KiB read over SSH, "
+          f"{result['failed_log_reads']} failed log reads, "
+          f"{result['rows_last_cycle']} table rows (setup {result['setup_seconds']:.1f} s)")
+    print(f"{'Phase':<26}{'Count':>8}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for phase in PHASES:
+        for temperature in ('cold', 'warm'):
+            stats = result['latency_ms'].get(f"{phase} {temperature}")
+            if stats:
+                print(f"{phase + ' ' + temperature:<26}{stats['count']:>8}{stats['p50']:>11.2f}{stats['p90']:>11.2f}"
+                      f"{stats['p99']:>11.2f}{stats['max']:>11.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark collection cycles against a simulated fleet.")
+    parser.add_argument('--instances', default='10,1000', help="Comma-separated fleet sizes, e.g. 10,1000,10000 (default: 10,1000)")
+    parser.add_argument('--cycles', type=int, default=3, help="Collection cycles per fleet size (default: 3)")
+    parser.add_argument('--log-lines', type=int, default=200, help="'Mining:' lines in each log before the first cycle (default: 200)")
+    parser.add_argument('--append-lines', type=int, default=30, help="Lines appended to each log between cycles (default: 30)")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Mean API response latency in seconds (default: 0)")
+    parser.add_argument('--api-failure-rate', type=float, default=0.0, help="Fraction of API requests answered with 503 (default: 0)")
+    parser.add_argument('--ssh-latency', type=float, default=0.0, help="Mean SSH handshake and command latency in seconds (default: 0)")
+    parser.add_argument('--ssh-failure-rate', type=float, default=0.0, help="Fraction of SSH commands that drop the connection (default: 0)")
+    parser.add_argument('--ssh-processes', type=int, default=1, help="Processes serving SSH (default: 1)")
+    parser.add_argument('--workers', type=int, help="Concurrent SSH connections (default: max_concurrent_connections of check_bot/config.py)")
+    parser.add_argument('--pool-size', type=int, help="SSH connection pool size (default: ssh_pool_max_connections of check_bot/config.py)")
+    parser.add_argument('--remote-agent', action='store_true', help="Run the remote agent on the hosts instead of tailing the logs")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic fleet (default: 0)")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results to PATH as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show the collector's log output")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    all_results = []
+    for size in [int(size) for size in args.instances.split(',')]:
+        results = context.Queue()
+        process = context.Process(target=_run_in_process, args=(size, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print_results(result)
+        all_results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Benchmark for log_parser on synthetic XENGPUMiner logs.
+
+Reports lines/sec of log_parser.parse_buffer() next to the previous line-by-line approach
+(clean ANSI codes and run the 'Mining:' regex per line), with and without ANSI colour codes, and
+checks that both return the same values.
+
+Usage: python benchmarks/bench_log_parser.py [--lines 1000000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_bot import log_parser
+
+
+def synthetic_log(num_lines, ansi, seed=0):
+    """Return miner.log content with num_lines lines, roughly 9 in 10 of them 'Mining:' progress lines."""
+    rng = random.Random(seed)
+    green, reset = ('\x1b[32m', '\x1b[0m') if ansi else ('', '')
+    lines = []
+    runtime = 0
+    normal = 0
+    for _ in range(num_lines):
+        runtime += rng.randint(1, 5)
+        if rng.random() < 0.1:
+            lines.append(f"{green}INFO{reset} Submitting block to the pool, response: 200")
+            continue
+        normal += rng.random() < 0.05
+        hours, remainder = divmod(runtime, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        if rng.random() < 0.02:
+            details = f"xuni:{rng.randint(0, 5)}"
+        else:
+            details = f"super:{rng.randint(0, 2)} normal:{normal}"
+        lines.append(f"{green}Mining: {normal} Blocks [{hours:02d}:{minutes:02d}:{seconds:02d}.{rng.randint(0, 99):02d}, "
+                     f"Details={details}, HashRate:{rng.uniform(900, 5000):.2f}, Difficulty={rng.randint(1500, 2500)}]{reset}")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def parse_line_by_line(buffer):
+    """The approach used before log_parser: decode, clean and match one line at a time."""
+    rows = []
+    for line in buffer.decode().split('\n'):
+        line = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]', re.IGNORECASE).sub('', line)
+        match = re.compile(log_parser.MINING_PATTERN.pattern.decode()).search(line)
+        if match:
+            rows.append(match.groups())
+    return rows
+
+
+def best_time(function, buffer, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(buffer)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the batch 'Mining:' log parser.")
+    parser.add_argument('--lines', type=int, default=1000000, help="Number of synthetic log lines (default: 1000000)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, the best one is reported (default: 3)")
+    args = parser.parse_args(argv)
+
+    print(f"{'Input':<12}{'Parser':<16}{'Lines/sec':>14}{'Seconds':>10}{'Matches':>10}")
+    for ansi in (False, True):
+        buffer = synthetic_log(args.lines, ansi)
+        label = "with ANSI" if ansi else "plain"
+        batch_seconds, columns = best_time(log_parser.parse_buffer, buffer, args.repeat)
+        line_seconds, rows = best_time(parse_line_by_line, buffer, args.repeat)
+        if len(rows) != len(columns.runtime_seconds):
+            print(f"Mismatch: line-by-line found {len(rows)} matches, batch parser {len(columns.runtime_seconds)}")
+            return 1
+        expected = [(int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds), int(super_blocks or 0), int(normal_blocks or 0),
+                     int(xuni_blocks or 0), float(hash_rate), int(difficulty))
+                    for hours, minutes, seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty in rows]
+        if list(log_parser.iter_rows(columns)) != expected:
+            print("Mismatch: the batch parser's values differ from line-by-line")
+            return 1
+        print(f"{label:<12}{'batch':<16}{args.lines / batch_seconds:>14,.0f}{batch_seconds:>10.3f}{len(rows):>10}")
+        print(f"{label:<12}{'line-by-line':<16}{args.lines / line_seconds:>14,.0f}{line_seconds:>10.3f}{len(rows):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Startup-time budget of the check_bot commands.
+
+Runs each command in a fresh interpreter and reports the median wall time over --repeat runs, next to
+a bare `python -c pass`. list and balance talk to the local API stand-in from fleet_standins.py,
+report and efficiency read an empty metrics directory. Fails (exit code 1) when a command exceeds its
+budget over the bare interpreter, or when it loads a heavy module it does not need.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fleet_standins
+
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds over a bare interpreter. list and balance include importing requests and two local API requests.
+BUDGET_MS = {'--help': 60, 'list': 250, 'balance': 250, 'report': 250, 'efficiency': 300}
+
+# Modules each command must not import
+FORBIDDEN = {
+    '--help': ['numpy', 'paramiko', 'prettytable', 'requests'],
+    'list': ['numpy', 'paramiko', 'prettytable'],
+    'balance': ['numpy', 'paramiko', 'prettytable'],
+    'report': ['paramiko', 'prettytable', 'requests'],
+    'efficiency': ['paramiko', 'prettytable'],
+}
+
+# Runs one command with the configuration pointed at the stand-ins and prints the heavy modules it loaded
+RUNNER = """
+import json, sys
+from check_bot import config
+config.api_base_url, config.API_KEY_FILE, config.metrics_directory = sys.argv[1:4]
+from check_bot import cli
+try:
+    code = cli.main(sys.argv[4:])
+except SystemExit as e:
+    code = e.code
+print('LOADED ' + json.dumps([name for name in ('numpy', 'paramiko', 'prettytable', 'requests') if name in sys.modules]), file=sys.stderr)
+sys.exit(code)
+"""
+
+
+def timed_run(command, cwd):
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+    return time.perf_counter() - started, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the startup time of the check_bot commands against a budget.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per command, the median is reported (default: 5)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        key_path = os.path.join(directory, 'id_ed25519')
+        fleet_standins.write_key(key_path)
+        api_key_path = os.path.join(directory, 'api_key.txt')
+        with open(api_key_path, 'w') as f:
+            f.write('benchmark')
+        fleet = fleet_standins.SyntheticFleet(10, os.path.join(directory, 'logs'))
+        with fleet_standins.FleetStandIns(fleet, key_path) as standins:
+            baseline = statistics.median(timed_run([sys.executable, '-c', 'pass'], directory)[0] for _ in range(args.repeat))
+            print(f"{'Command':<12}{'Median ms':>11}{'Over bare':>11}{'Budget':>9}  Heavy modules loaded")
+            print(f"{'(bare)':<12}{baseline * 1000:>11.1f}")
+            for command, budget_ms in BUDGET_MS.items():
+                env = os.environ.copy()
+                env['PYTHONPATH'] = REPO + os.pathsep + env.get('PYTHONPATH', '')
+                arguments = [sys.executable, '-c', RUNNER, standins.api_url, api_key_path, os.path.join(directory, 'metrics'), command]
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    result = subprocess.run(arguments, cwd=directory, env=env, capture_output=True, text=True)
+                    timings.append(time.perf_counter() - started)
+                    if result.returncode != 0:
+                        failures.append(f"{command} exited with {result.returncode}: {result.stderr.strip()[-500:]}")
+                        break
+                loaded = json.loads(result.stderr.rsplit('LOADED ', 1)[1]) if 'LOADED ' in result.stderr else []
+                over_ms = (statistics.median(timings) - baseline) * 1000
+                print(f"{command:<12}{statistics.median(timings) * 1000:>11.1f}{over_ms:>11.1f}{budget_ms:>9}  {', '.join(loaded) or '-'}")
+                if over_ms > budget_ms:
+                    failures.append(f"{command} takes {over_ms:.0f} ms over a bare interpreter, the budget is {budget_ms} ms")
+                unexpected = sorted(set(loaded) & set(FORBIDDEN[command]))
+                if unexpected:
+                    failures.append(f"{command} loads {', '.join(unexpected)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
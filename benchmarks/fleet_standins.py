@@ -0,0 +1,370 @@
+"""Local stand-ins for the Vast.ai API and the SSH servers of a synthetic fleet, for benchmarks.
+
+SyntheticFleet describes N instances and writes a synthetic miner.log for each of them to a local
+directory. FleetStandIns serves that fleet from separate processes:
+
+- an HTTP server answering /api/v0/, /api/v0/instances/ and /api/v0/users/current like the Vast.ai API,
+  including ETag/If-None-Match on the instance list;
+- an SSH server on one port that accepts any key. Every instance gets its own loopback address
+  (127.x.y.z), so the collector sees one host per instance, and the address a connection arrived on
+  selects the instance. Commands run in a local shell with the miner.log path replaced by the
+  instance's synthetic log, and SFTP serves that log read-only under the miner.log path.
+
+Both have a configurable latency (mean seconds, uniformly jittered by +/-50%) and failure rate. A failed
+API request is answered with 503, a failed SSH command drops the connection.
+
+WebhookStandIn is an HTTP server in a thread of the calling process that records the JSON bodies POSTed
+to it, with the same latency and failure rate options, for the alert sinks.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paramiko
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_bot.collector import MINER_LOG_PATH
+
+
+# (GPU name, USD per hour per GPU, hash rate per GPU)
+GPU_TYPES = [
+    ('RTX 4090', 0.45, 5200.0),
+    ('RTX 3090', 0.25, 2900.0),
+    ('RTX A6000', 0.50, 3300.0),
+    ('A100 PCIE', 0.90, 4100.0),
+]
+
+# Seconds of miner runtime between two 'Mining:' lines
+SECONDS_PER_LINE = 10
+
+
+def write_key(path):
+    """Write a new unencrypted Ed25519 private key in OpenSSH format, as used by SSHConnectionPool."""
+    key = ed25519.Ed25519PrivateKey.generate()
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.OpenSSH, serialization.NoEncryption()))
+    os.chmod(path, 0o600)
+
+
+def instance_address(index):
+    """Loopback address of the index-th instance, skipping 127.0.0.0 and 127.0.0.1."""
+    number = index + 2
+    return f"127.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"
+
+
+def _jittered(seconds, rng):
+    return seconds * rng.uniform(0.5, 1.5) if seconds > 0 else 0.0
+
+
+class SyntheticFleet:
+    """size instances with miner logs in directory.
+
+    degraded_fraction of the running instances hash 40% slower than their GPU type and run at low GPU
+    utilization, stopped_fraction of the instances are not running and refuse SSH connections.
+    """
+
+    def __init__(self, size, directory, log_lines=200, degraded_fraction=0.05, stopped_fraction=0.02, seed=0):
+        self.directory = directory
+        self.instances = []
+        self._state = []  # per instance: [runtime seconds, normal blocks, hash rate, random generator]
+        rng = random.Random(seed)
+        os.makedirs(directory, exist_ok=True)
+        for index in range(size):
+            gpu_name, usd_per_gpu, gpu_hash_rate = rng.choice(GPU_TYPES)
+            num_gpus = rng.choice((1, 1, 2, 4, 8))
+            running = rng.random() >= stopped_fraction
+            degraded = running and rng.random() < degraded_fraction
+            self.instances.append({
+                'id': 10000000 + index,
+                'gpu_name': gpu_name,
+                'dph_total': round(usd_per_gpu * num_gpus * rng.uniform(0.9, 1.1), 4),
+                'ssh_host': instance_address(index),
+                'ssh_port': None,  # filled in by FleetStandIns
+                'num_gpus': num_gpus,
+                'gpu_util': round(rng.uniform(40, 70) if degraded else rng.uniform(95, 100), 1),
+                'label': rng.choice((None, 'farm-a', 'farm-b')),
+                'actual_status': 'running' if running else 'exited',
+            })
+            hash_rate = gpu_hash_rate * num_gpus * (0.6 if degraded else 1.0) * rng.uniform(0.97, 1.03)
+            self._state.append([0, 0, hash_rate, random.Random(seed * 1000003 + index)])
+        self.address_index = {instance['ssh_host']: index for index, instance in enumerate(self.instances)}
+        self.append(log_lines)
+
+    def log_path(self, index):
+        return os.path.join(self.directory, f"{index}.log")
+
+    def running(self, index):
+        return self.instances[index]['actual_status'] == 'running'
+
+    def _lines(self, index, count):
+        state = self._state[index]
+        rng = state[3]
+        lines = []
+        for _ in range(count):
+            state[0] += SECONDS_PER_LINE
+            state[1] += rng.random() < min(0.5, state[2] / 100000)
+            hours, remainder = divmod(state[0], 3600)
+            minutes, seconds = divmod(remainder, 60)
+            lines.append(f"\x1b[32mMining: {state[1]} Blocks [{hours:02d}:{minutes:02d}:{seconds:02d}.{rng.randint(0, 99):02d}, "
+                         f"Details=super:0 normal:{state[1]}, HashRate:{state[2] * rng.uniform(0.98, 1.02):.2f}, "
+                         f"Difficulty=1727]\x1b[0m\n")
+        return ''.join(lines)
+
+    def append(self, lines):
+        """Append lines 'Mining:' lines to the log of every running instance."""
+        for index in range(len(self.instances)):
+            if self.running(index):
+                with open(self.log_path(index), 'a') as f:
+                    f.write(self._lines(index, lines))
+
+
+class _SSHServer(paramiko.ServerInterface):
+    def __init__(self, transport, log_path, latency, failure_rate, rng):
+        self.transport = transport
+        self.log_path = log_path
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._exec, args=(channel, command), daemon=True).start()
+        return True
+
+    def _exec(self, channel, command):
+        # The short minimum delay lets paramiko send the exec reply before the channel is closed
+        time.sleep(max(0.01, _jittered(self.latency, self.rng)))
+        if self.rng.random() < self.failure_rate:
+            self.transport.close()
+            return
+        result = subprocess.run(['sh', '-c', command.decode().replace(MINER_LOG_PATH, self.log_path)], capture_output=True)
+        try:
+            channel.sendall(result.stdout)
+            channel.send_exit_status(result.returncode)
+            channel.close()
+        except (EOFError, OSError, paramiko.SSHException):
+            pass
+
+
+class _LogHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _LogSFTP(paramiko.SFTPServerInterface):
+    """Read-only SFTP access to one instance's synthetic log, under the miner.log path."""
+
+    def __init__(self, server, log_path):
+        super().__init__(server)
+        self.log_path = log_path
+
+    def stat(self, path):
+        if path != MINER_LOG_PATH:
+            return paramiko.SFTP_NO_SUCH_FILE
+        return paramiko.SFTPAttributes.from_stat(os.stat(self.log_path))
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        if path != MINER_LOG_PATH:
+            return paramiko.SFTP_NO_SUCH_FILE
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_PERMISSION_DENIED
+        handle = _LogHandle(flags)
+        handle.filename = self.log_path
+        handle.readfile = open(self.log_path, 'rb')
+        return handle
+
+
+def _serve_ssh(listener, fleet, host_key_path, latency, failure_rate, seed):
+    host_key = paramiko.Ed25519Key(filename=host_key_path)
+    rng = random.Random(seed)
+
+    def handle(connection, index):
+        time.sleep(_jittered(latency, rng))
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _LogSFTP, fleet.log_path(index))
+        try:
+            transport.start_server(server=_SSHServer(transport, fleet.log_path(index), latency, failure_rate, rng))
+        except (EOFError, OSError, paramiko.SSHException):
+            transport.close()
+
+    while True:
+        connection, peer = listener.accept()
+        index = fleet.address_index.get(connection.getsockname()[0])
+        # Only loopback clients, and only instances that are running
+        if not peer[0].startswith('127.') or index is None or not fleet.running(index):
+            connection.close()
+            continue
+        threading.Thread(target=handle, args=(connection, index), daemon=True).start()
+
+
+def _api_handler(instances_body, latency, failure_rate, seed):
+    etag = '"' + hashlib.sha1(instances_body).hexdigest() + '"'
+    rng = random.Random(seed)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=b'', headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(_jittered(latency, rng))
+            path = self.path.split('?', 1)[0]
+            if rng.random() < failure_rate:
+                self._send(503, b'{"error": "service unavailable"}')
+            elif path == '/api/v0/instances/':
+                if self.headers.get('If-None-Match') == etag:
+                    self._send(304, headers={'ETag': etag})
+                else:
+                    self._send(200, instances_body, {'ETag': etag})
+            elif path == '/api/v0/users/current':
+                self._send(200, b'{"credit": 1234.56}')
+            elif path == '/api/v0/':
+                self._send(200, b'{}')
+            else:
+                self._send(404, b'{"error": "not found"}')
+
+    return Handler
+
+
+def _serve_api(listener, instances_body, latency, failure_rate, seed):
+    server = ThreadingHTTPServer(listener.getsockname(), _api_handler(instances_body, latency, failure_rate, seed), bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+class FleetStandIns:
+    """Serves a SyntheticFleet over HTTP and SSH from forked processes while used as a context manager."""
+
+    def __init__(self, fleet, host_key_path, api_latency=0.0, api_failure_rate=0.0, ssh_latency=0.0, ssh_failure_rate=0.0,
+                 ssh_processes=1, seed=0):
+        self.fleet = fleet
+        self.host_key_path = host_key_path
+        self.api_latency = api_latency
+        self.api_failure_rate = api_failure_rate
+        self.ssh_latency = ssh_latency
+        self.ssh_failure_rate = ssh_failure_rate
+        self.ssh_processes = ssh_processes
+        self.seed = seed
+        self.api_url = None
+        self.ssh_port = None
+        self._processes = []
+
+    def __enter__(self):
+        # The SSH server listens on all addresses so that every 127.x.y.z reaches it, and drops non-loopback peers
+        ssh_listener = socket.socket()
+        ssh_listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        ssh_listener.bind(('0.0.0.0', 0))
+        ssh_listener.listen(1024)
+        self.ssh_port = ssh_listener.getsockname()[1]
+        for instance in self.fleet.instances:
+            instance['ssh_port'] = self.ssh_port
+
+        api_listener = socket.socket()
+        api_listener.bind(('127.0.0.1', 0))
+        api_listener.listen(128)
+        self.api_url = f"http://127.0.0.1:{api_listener.getsockname()[1]}/api/v0"
+        instances_body = json.dumps({'instances': self.fleet.instances}).encode()
+
+        context = multiprocessing.get_context('fork')
+        # All SSH server processes accept connections from the same listening socket
+        targets = [(_serve_ssh, (ssh_listener, self.fleet, self.host_key_path, self.ssh_latency, self.ssh_failure_rate, self.seed + number))
+                   for number in range(self.ssh_processes)]
+        targets.append((_serve_api, (api_listener, instances_body, self.api_latency, self.api_failure_rate, self.seed)))
+        for target, args in targets:
+            process = context.Process(target=target, args=args, daemon=True)
+            process.start()
+            self._processes.append(process)
+        ssh_listener.close()
+        api_listener.close()
+        return self
+
+    def close(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class WebhookStandIn:
+    """Records the JSON bodies POSTed to url while used as a context manager. Failed requests get a 503."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.bodies = []   # (time.monotonic() of arrival, decoded body) of the accepted requests
+        self.requests = 0
+        self.url = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with standin._lock:
+                    standin.requests += 1
+                    delay = _jittered(standin.latency, standin.rng)
+                    failed = standin.rng.random() < standin.failure_rate
+                time.sleep(delay)
+                if not failed:
+                    with standin._lock:
+                        standin.bodies.append((time.monotonic(), json.loads(body)))
+                self.send_response(503 if failed else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/hook"
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,5 @@
+"""Monitor XENGPUMiner performance on Vast.ai instances.
+
+Run it with `python -m check_bot` (see check_bot/cli.py for the commands) after editing
+check_bot/config.py. Submodules are not imported here, so importing the package stays cheap.
+"""
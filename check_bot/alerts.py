@@ -0,0 +1,243 @@
+"""Alerts, delivered from a background thread as soon as a problem is seen.
+
+Alerts are raised while a cycle runs: a host whose poll shows low GPU utilization, a stalled
+miner.log or that stopped answering is reported from the collection thread that polled it, the
+moment the poll ends. Hash rate outliers and the streaming anomaly detectors follow when the cycle
+has the whole fleet. AlertDispatcher.submit() only puts the alert on a bounded queue, so delivery
+never holds up collection; when the queue is full the alert is dropped and counted.
+
+The dispatcher thread applies these rules per alert key (kind and instance):
+- dedup: the same key raised again before its digest went out is merged into one line with a count;
+- cooldown: a key that was delivered is not delivered again for cooldown seconds;
+- batching: alerts are collected into one digest for batch_seconds after the first one, or until
+  max_batch keys are pending, then the digest goes to every sink.
+
+Sinks are objects with a name and a deliver(digest) method: StdoutSink, FileSink (JSON lines) and
+WebhookSink (JSON POST, retried with backoff). A sink that fails is logged and counted, the others
+still get the digest.
+"""
+import datetime
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+from . import config, instrumentation
+
+
+class Alert:
+    """One problem of one instance (or of the fleet when instance_id is None)."""
+
+    __slots__ = ('kind', 'instance_id', 'message', 'raised_at')
+
+    def __init__(self, kind, instance_id, message, raised_at=None):
+        self.kind = kind
+        self.instance_id = instance_id
+        self.message = message
+        self.raised_at = time.time() if raised_at is None else raised_at
+
+    @property
+    def key(self):
+        return self.kind, self.instance_id
+
+
+# Function to return the alerts raised by one poll of an instance. failures is the number of failed polls
+# in a row including this one, an instance is reported once when it reaches failure_threshold.
+def poll_alerts(ssh_info, log_info, log_tail=None, failures=0, failure_threshold=3, stalled_polls=2, util_threshold=85):
+    instance_id = ssh_info['instance_id']
+    if log_info is None or str(ssh_info['actual_status']).lower() != 'running':
+        return []
+    if log_info[4] is None:
+        if failures == failure_threshold:
+            return [Alert('unreachable', instance_id, f"Instance {instance_id} has not returned a readable miner.log for {failures} polls in a row")]
+        return []
+    alerts = []
+    gpu_util = log_tail.gpu_util() if log_tail is not None else None
+    if gpu_util is None:
+        try:
+            gpu_util = float(ssh_info['gpu_util'])
+        except (TypeError, ValueError):
+            gpu_util = None
+    if gpu_util is not None and gpu_util < util_threshold:
+        alerts.append(Alert('utilization', instance_id, f"GPU Utilization for instance {instance_id} is at {gpu_util:.2f}% - Make sure XENGPUMiner is working!"))
+    if log_tail is not None and log_tail.stalled_polls >= stalled_polls:
+        alerts.append(Alert('stalled', instance_id, f"miner.log of instance {instance_id} has not advanced for {log_tail.stalled_polls} polls - Make sure XENGPUMiner is working!"))
+    return alerts
+
+
+class Digest:
+    """The alerts delivered together: (alert, times raised) pairs in the order they were first raised."""
+
+    def __init__(self, entries, created_at=None):
+        self.entries = entries
+        self.created_at = time.time() if created_at is None else created_at
+
+    def text(self):
+        lines = [f"check_bot: {len(self.entries)} alert{'s' if len(self.entries) != 1 else ''} at "
+                 f"{datetime.datetime.fromtimestamp(self.created_at):%Y-%m-%d %H:%M:%S}"]
+        for alert, count in self.entries:
+            lines.append(f"- [{alert.kind}] {alert.message}" + (f" (x{count})" if count > 1 else ""))
+        return "\n".join(lines)
+
+    def records(self):
+        return [{'kind': alert.kind, 'instance_id': alert.instance_id, 'message': alert.message, 'raised_at': alert.raised_at,
+                 'count': count} for alert, count in self.entries]
+
+
+class StdoutSink:
+    name = 'stdout'
+
+    def deliver(self, digest):
+        print(digest.text(), flush=True)
+
+
+class FileSink:
+    """Appends one JSON line per alert."""
+
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def deliver(self, digest):
+        with open(self.path, 'a') as f:
+            for record in digest.records():
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+class WebhookSink:
+    """POSTs {"text": ..., "alerts": [...]} to url, the shape Slack and Mattermost incoming webhooks accept.
+
+    Connection errors and 429/5xx answers are retried with exponential backoff and full jitter.
+    """
+
+    name = 'webhook'
+
+    def __init__(self, url, timeout=10, max_retries=3, backoff_base=1.0):
+        # Imported here so that the other sinks work without loading requests
+        import requests
+        self._requests = requests
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.session = requests.Session()
+
+    def deliver(self, digest):
+        body = {'text': digest.text(), 'alerts': digest.records()}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=body, timeout=self.timeout)
+                if response.status_code < 400:
+                    return
+                if response.status_code != 429 and response.status_code < 500 or attempt == self.max_retries:
+                    response.raise_for_status()
+            except (self._requests.ConnectionError, self._requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            time.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+
+
+class AlertDispatcher:
+    """Dedups, rate limits and batches alerts on a background thread and delivers the digests to the sinks."""
+
+    def __init__(self, sinks, cooldown=900, batch_seconds=30, max_batch=50, max_queued=10000):
+        self.sinks = list(sinks)
+        self.cooldown = cooldown
+        self.batch_seconds = batch_seconds
+        self.max_batch = max_batch
+        self._queue = queue.Queue(max_queued)
+        self._pending = {}    # key -> [alert, count], in the order first raised
+        self._batch_started = None
+        self._last_sent = {}  # key -> time.monotonic() of its last delivery
+        self._thread = threading.Thread(target=self._run, name='alerts', daemon=True)
+        self._thread.start()
+
+    def submit(self, alert):
+        """Queue an alert. Never blocks."""
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            instrumentation.ALERTS.labels(alert.kind, 'dropped').inc()
+            return
+        instrumentation.ALERTS.labels(alert.kind, 'raised').inc()
+
+    def _add(self, alert, now):
+        entry = self._pending.get(alert.key)
+        if entry is not None:
+            # Keep the latest message, it has the current numbers
+            entry[0] = alert
+            entry[1] += 1
+            instrumentation.ALERTS.labels(alert.kind, 'merged').inc()
+            return
+        last_sent = self._last_sent.get(alert.key)
+        if last_sent is not None and now - last_sent < self.cooldown:
+            instrumentation.ALERTS.labels(alert.kind, 'cooling_down').inc()
+            return
+        if not self._pending:
+            self._batch_started = now
+        self._pending[alert.key] = [alert, 1]
+
+    def _flush(self, now):
+        digest = Digest([(alert, count) for alert, count in self._pending.values()])
+        for key in self._pending:
+            self._last_sent[key] = now
+        self._pending = {}
+        self._batch_started = None
+        # Keys whose cooldown has passed are not needed anymore
+        for key in [key for key, sent_at in self._last_sent.items() if now - sent_at >= self.cooldown]:
+            del self._last_sent[key]
+        for sink in self.sinks:
+            started = time.perf_counter()
+            try:
+                sink.deliver(digest)
+            except Exception as e:
+                logging.error("Failed to deliver %d alerts to the %s sink: %s", len(digest.entries), sink.name, e)
+                instrumentation.ALERT_DELIVERIES.labels(sink.name, 'failed').inc()
+            else:
+                instrumentation.ALERT_DELIVERIES.labels(sink.name, 'delivered').inc()
+            instrumentation.ALERT_DELIVERY_SECONDS.labels(sink.name).observe(time.perf_counter() - started)
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._batch_started is not None:
+                timeout = max(0.0, self._batch_started + self.batch_seconds - time.monotonic())
+            try:
+                alert = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                alert = False
+            now = time.monotonic()
+            if alert is None:
+                # close(): deliver what is pending and stop
+                if self._pending:
+                    self._flush(now)
+                return
+            if alert:
+                self._add(alert, now)
+            if self._pending and (len(self._pending) >= self.max_batch or now - self._batch_started >= self.batch_seconds):
+                self._flush(now)
+
+    def close(self, timeout=10):
+        """Deliver the pending alerts, waiting at most timeout seconds, and stop the thread."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+# Function to create the dispatcher for the alert options of the configuration, or None when no sink is configured
+def dispatcher_from_config(stdout=True):
+    sinks = []
+    if config.alert_stdout and stdout:
+        sinks.append(StdoutSink())
+    if config.alert_file:
+        sinks.append(FileSink(config.alert_file))
+    if config.alert_webhook_url:
+        sinks.append(WebhookSink(config.alert_webhook_url, timeout=config.alert_webhook_timeout))
+    if not sinks:
+        return None
+    return AlertDispatcher(sinks, cooldown=config.alert_cooldown, batch_seconds=config.alert_batch_seconds, max_batch=config.alert_max_batch)
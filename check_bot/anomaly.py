@@ -0,0 +1,212 @@
+"""Streaming anomaly detection for watch mode.
+
+Every detector here is updated in O(1) per new sample, so nothing rescans history:
+
+- Welford keeps the running mean and variance of per-GPU hash rates for each (GPU type, difficulty),
+  weighted towards recent samples, and only from instances that are not in alarm.
+- Each instance has an EWMA baseline of its own per-GPU hash rate and GPU utilization.
+- Two one-sided CUSUM change-point detectors per instance accumulate evidence of a sustained drop,
+  one against the instance's own baseline and one against the Welford statistics of its GPU type.
+  A large drop raises an alarm after one or two samples, a small persistent one after a few more.
+"""
+import math
+
+import numpy as np
+
+
+class Welford:
+    """Running mean and sample variance.
+
+    With a decay below 1 the weight of every earlier sample is multiplied by decay on each update, so the
+    statistics follow roughly the last 1 / (1 - decay) samples. With decay=1 they are exact over all samples.
+    """
+
+    __slots__ = ('decay', 'count', 'mean', '_m2', '_weight', '_weight2')
+
+    def __init__(self, decay=1.0):
+        self.decay = decay
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._weight = 0.0    # sum of the sample weights
+        self._weight2 = 0.0   # sum of their squares, for the unbiased variance
+
+    def update(self, value):
+        self.count += 1
+        self._weight = self._weight * self.decay + 1
+        self._weight2 = self._weight2 * self.decay * self.decay + 1
+        delta = value - self.mean
+        self.mean += delta / self._weight
+        self._m2 = self._m2 * self.decay + delta * (value - self.mean)
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(0.0, self._m2 / (self._weight - self._weight2 / self._weight)))
+
+
+class EWMA:
+    """Exponentially weighted moving average."""
+
+    __slots__ = ('alpha', 'value', 'count')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+        self.count = 0
+
+    def update(self, value):
+        self.value = value if self.value is None else self.value + self.alpha * (value - self.value)
+        self.count += 1
+        return self.value
+
+
+class LowerCUSUM:
+    """One-sided CUSUM that accumulates deviations below the target beyond a slack and alarms above a limit."""
+
+    __slots__ = ('slack', 'limit', 'score')
+
+    def __init__(self, slack, limit):
+        self.slack = slack
+        self.limit = limit
+        self.score = 0.0
+
+    def update(self, shortfall):
+        """Add one sample's shortfall (positive when below target) and return True while in alarm."""
+        self.score = max(0.0, self.score + shortfall - self.slack)
+        return self.score > self.limit
+
+
+class InstanceDetector:
+    """Per-instance detector state."""
+
+    __slots__ = ('baseline', 'utilization', 'drop', 'below_group', 'low_util_polls')
+
+    def __init__(self, baseline_alpha, util_alpha, drop_tolerance, drop_limit, group_slack, group_limit):
+        self.baseline = EWMA(baseline_alpha)
+        self.utilization = EWMA(util_alpha)
+        self.drop = LowerCUSUM(drop_tolerance, drop_limit)
+        self.below_group = LowerCUSUM(group_slack, group_limit)
+        self.low_util_polls = 0
+
+
+class AnomalyTracker:
+    """Feeds one sample per instance and poll into the detectors and reports sustained regressions.
+
+    drop_tolerance/drop_limit: relative shortfall against the instance's own baseline that is ignored per
+    sample, and accumulated shortfall that raises an alarm (0.05/0.25: a 30% drop alarms on the second
+    sample, a 10% drop on the sixth).
+    group_slack/group_limit: the same in Z-Score units against the GPU type's running statistics. With a slack
+    of 1 only samples more than one standard deviation below the average add up.
+    group_window: number of recent samples the GPU type's statistics roughly follow.
+    """
+
+    def __init__(self, drop_tolerance=0.05, drop_limit=0.25, group_slack=1.0, group_limit=4.0, warmup_samples=3,
+                 baseline_alpha=0.1, util_threshold=85, util_polls=3, stalled_polls=2, group_window=500):
+        self.drop_tolerance = drop_tolerance
+        self.drop_limit = drop_limit
+        self.group_slack = group_slack
+        self.group_limit = group_limit
+        self.warmup_samples = warmup_samples
+        self.baseline_alpha = baseline_alpha
+        self.util_threshold = util_threshold
+        self.util_polls = util_polls
+        self.stalled_polls = stalled_polls
+        self.group_decay = 1 - 1 / group_window
+        self.type_stats = {}  # (gpu_type, difficulty) -> Welford of per-GPU hash rates
+        self.instances = {}   # instance_id -> InstanceDetector
+        self.cycle = 0
+        self._stats_last_cycle = {}  # (gpu_type, difficulty) -> cycle in which it was last updated
+
+    def _detector(self, instance_id):
+        detector = self.instances.get(instance_id)
+        if detector is None:
+            detector = InstanceDetector(self.baseline_alpha, 2 / (self.util_polls + 1), self.drop_tolerance, self.drop_limit,
+                                        self.group_slack, self.group_limit)
+            self.instances[instance_id] = detector
+        return detector
+
+    def update(self, instance_id, gpu_type, hash_rate_per_gpu, difficulty, gpu_util, running=True, stalled_polls=0):
+        """Feed the latest values of one instance. Returns a list of (kind, message) for the anomalies it is in.
+
+        kind is 'utilization', 'stalled', 'drop' or 'below_group'. NaN or None values are skipped.
+        """
+        detector = self._detector(instance_id)
+        anomalies = []
+
+        if running and gpu_util is not None and not math.isnan(gpu_util):
+            detector.utilization.update(gpu_util)
+            detector.low_util_polls = detector.low_util_polls + 1 if gpu_util < self.util_threshold else 0
+            if detector.low_util_polls >= self.util_polls:
+                anomalies.append(('utilization', f"GPU Utilization for instance {instance_id} has been below {self.util_threshold}% for "
+                                                 f"{detector.low_util_polls} polls (average {detector.utilization.value:.2f}%) - Make sure XENGPUMiner is working!"))
+
+        if running and stalled_polls >= self.stalled_polls:
+            anomalies.append(('stalled', f"miner.log of instance {instance_id} has not advanced for {stalled_polls} polls - Make sure XENGPUMiner is working!"))
+
+        if hash_rate_per_gpu is None or math.isnan(hash_rate_per_gpu):
+            return anomalies
+
+        # Against the instance's own history. The baseline only follows the instance while it is not in alarm,
+        # so a regression keeps being reported until the hash rate recovers.
+        baseline = detector.baseline.value
+        in_alarm = False
+        if baseline and detector.baseline.count >= self.warmup_samples:
+            if detector.drop.update((baseline - hash_rate_per_gpu) / baseline):
+                in_alarm = True
+                anomalies.append(('drop', f"Hash rate of instance {instance_id} is {(baseline - hash_rate_per_gpu) / baseline * 100:.2f}% "
+                                          f"below its recent baseline of {baseline:.2f} H/s per GPU"))
+            elif detector.drop.score == 0:
+                detector.baseline.update(hash_rate_per_gpu)
+        else:
+            detector.baseline.update(hash_rate_per_gpu)
+
+        # Against all instances with the same GPU type, scored before this sample joins the statistics.
+        # A difficulty change shifts hash rates, so statistics are kept per difficulty. Like the baseline, the
+        # statistics only take samples of instances that are not in alarm, so regressed instances do not drag
+        # the average down to themselves.
+        stats = self.type_stats.get((gpu_type, difficulty))
+        if stats is None:
+            stats = self.type_stats[(gpu_type, difficulty)] = Welford(self.group_decay)
+        self._stats_last_cycle[(gpu_type, difficulty)] = self.cycle
+        if stats.count >= self.warmup_samples and stats.std > 0:
+            z_score = (hash_rate_per_gpu - stats.mean) / stats.std
+            if detector.below_group.update(-z_score):
+                in_alarm = True
+                anomalies.append(('below_group', f"Hash rate of instance {instance_id} has been below the {gpu_type} average of "
+                                                 f"{stats.mean:.2f} H/s for several polls (now {hash_rate_per_gpu:.2f} H/s, {z_score:.2f} Z-Score)"))
+        if not in_alarm:
+            stats.update(hash_rate_per_gpu)
+        return anomalies
+
+    def update_fleet(self, fleet, gpu_types, log_tails=None, stats_ttl_cycles=10, polled=None):
+        """Feed one cycle of a fleet_analytics fleet array. Returns a list of (instance_id, gpu_code, kind, message).
+
+        If polled is a set of instance IDs, only those are fed; the others were not polled in this cycle and
+        their values would be counted twice.
+        """
+        self.cycle += 1
+        anomalies = []
+        if polled is not None:
+            fleet = fleet[np.isin(fleet['instance_id'], np.fromiter(polled, np.int64, len(polled)))]
+        for instance_id, gpu_code, hash_rate_per_gpu, difficulty, gpu_util, running, parsed in zip(
+                fleet['instance_id'].tolist(), fleet['gpu_type'].tolist(), fleet['hash_rate_per_gpu'].tolist(),
+                fleet['difficulty'].tolist(), fleet['gpu_util'].tolist(), fleet['running'].tolist(), fleet['parsed'].tolist()):
+            log_tail = log_tails.get(instance_id) if log_tails else None
+            for kind, message in self.update(instance_id, gpu_types[gpu_code], hash_rate_per_gpu if parsed else None, difficulty, gpu_util,
+                                             running=running, stalled_polls=log_tail.stalled_polls if log_tail is not None else 0):
+                anomalies.append((instance_id, gpu_code, kind, message))
+
+        # Statistics of difficulties no instance reported for a while are not needed anymore
+        for key, last_cycle in list(self._stats_last_cycle.items()):
+            if self.cycle - last_cycle > stats_ttl_cycles:
+                del self._stats_last_cycle[key]
+                del self.type_stats[key]
+        return anomalies
+
+    def forget(self, current_instance_ids):
+        """Drop detectors of instances that are no longer in the instance list."""
+        for instance_id in list(self.instances):
+            if instance_id not in current_instance_ids:
+                del self.instances[instance_id]
@@ -0,0 +1,288 @@
+"""Backfill of the metrics history from the whole miner.log of each instance.
+
+Each log is streamed over SFTP on a compressed SSH connection, from the end of the file towards its
+start, in chunks of chunk_bytes. Every chunk is parsed and stored before the next one is read, so
+memory use does not depend on the size of the log. Several instances are read in parallel, and their
+chunks are written to the metrics history by the calling thread.
+
+'Mining:' lines carry the miner's runtime, not the time of day. The last line of the log is dated by
+the log's modification time, earlier lines of the same miner run by the difference in runtime. Where
+the runtime jumps up while reading backwards the miner was restarted, and the earlier run is assumed
+to have ended when the later one started. One sample per resolution seconds is kept and stored with
+the instance's current GPU count and price. Samples already in the history are not replaced.
+
+Progress is checkpointed per instance after every stored chunk, so an interrupted backfill resumes
+where it stopped. A log whose beginning changed since (it was rotated) is backfilled from its end again.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import instrumentation, log_parser
+from .collector import MINER_LOG_PATH
+from .metrics_store import NUMERIC_COLUMNS
+
+
+CHECKPOINT_VERSION = 1
+
+# Bytes at the start of a log that identify it across runs; SFTP does not report inode numbers
+HEAD_BYTES = 4096
+
+
+class HostProgress:
+    """Backfill progress of one instance's miner.log, as saved in the checkpoint file."""
+
+    FIELDS = ('head', 'size', 'mtime', 'position', 'anchor_time', 'anchor_runtime', 'previous_time', 'previous_runtime',
+              'last_bucket', 'samples', 'done')
+
+    def __init__(self, head, size, mtime):
+        self.head = head          # SHA-1 of the first HEAD_BYTES of the log
+        self.size = size
+        self.mtime = mtime
+        self.position = size      # everything from here to size has been stored
+        self.anchor_time = None   # Unix time of the sample with runtime anchor_runtime
+        self.anchor_runtime = None
+        self.previous_time = None     # time and runtime of the earliest sample read so far
+        self.previous_runtime = None
+        self.last_bucket = None   # resolution bucket of the last stored sample
+        self.samples = 0
+        self.done = False
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        progress = cls(data['head'], data['size'], data['mtime'])
+        for field in cls.FIELDS:
+            setattr(progress, field, data[field])
+        return progress
+
+
+def load_checkpoint(path):
+    """Return {instance_id: HostProgress.to_dict()} from the checkpoint file, or {} if there is none."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('v') != CHECKPOINT_VERSION:
+            raise ValueError(f"unknown version {data.get('v')!r}")
+        # Stored as a list because JSON object keys would turn the instance IDs into strings
+        return {instance_id: HostProgress.from_dict(progress).to_dict() for instance_id, progress in data['instances']}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning("Ignoring the backfill checkpoint %s: %s", path, e)
+        return {}
+
+
+def save_checkpoint(path, progress_by_instance):
+    """Write the checkpoint file, replacing it atomically."""
+    data = {'v': CHECKPOINT_VERSION, 'instances': [[instance_id, progress] for instance_id, progress in progress_by_instance.items()]}
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.' + os.path.basename(path), delete=False) as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(f.name, path)
+
+
+def date_samples(progress, runtimes):
+    """Return the Unix times of samples with these runtimes (in log order, preceding those read so far).
+
+    Updates the anchor in progress, which carries the dating over to the chunk read next.
+    """
+    runtimes = np.asarray(runtimes, dtype=np.float64)[::-1]  # latest first
+    times = np.empty(len(runtimes))
+    if not len(runtimes):
+        return times
+    if progress.anchor_time is None:
+        # The last line of the log was written at its modification time
+        progress.anchor_time, progress.anchor_runtime = progress.mtime, float(runtimes[0])
+        progress.previous_time, progress.previous_runtime = progress.mtime, float(runtimes[0])
+    # Reading backwards, the runtime goes up where the miner was restarted
+    later_runtimes = np.concatenate(([progress.previous_runtime], runtimes[:-1]))
+    restarts = np.flatnonzero(runtimes > later_runtimes).tolist()
+    starts = [0] + [index for index in restarts if index > 0]
+    for start, end in zip(starts, starts[1:] + [len(runtimes)]):
+        if start in restarts:
+            # The earlier run ended when the later one started
+            progress.anchor_time = progress.previous_time - progress.previous_runtime
+            progress.anchor_runtime = float(runtimes[start])
+        times[start:end] = progress.anchor_time - (progress.anchor_runtime - runtimes[start:end])
+        progress.previous_time, progress.previous_runtime = float(times[end - 1]), float(runtimes[end - 1])
+    return times[::-1]
+
+
+def sample_rows(progress, columns, times, resolution, num_gpus, dph_total):
+    """Return metrics store rows for the samples of one chunk, keeping the latest sample per resolution bucket."""
+    if not len(times):
+        return []
+    order = np.arange(len(times))[::-1]  # latest first
+    buckets = (times[order] // resolution).astype(np.int64)
+    previous = np.concatenate(([progress.last_bucket if progress.last_bucket is not None else -1], buckets[:-1]))
+    keep = order[buckets != previous]
+    progress.last_bucket = int(buckets[-1])
+    num_gpus, dph_total = np.float64(num_gpus), np.float64(dph_total)
+
+    hash_rate = columns.hash_rate[keep]
+    normal_blocks = columns.normal_blocks[keep].astype(np.float64)
+    runtime_hours = columns.runtime_seconds[keep] / 3600
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normal_block_per_hour = np.where(runtime_hours > 0, normal_blocks / runtime_hours, 0.0)
+        values = {
+            'num_gpus': np.full(len(keep), num_gpus),
+            'gpu_util': np.full(len(keep), np.nan),
+            'dph_total': np.full(len(keep), dph_total),
+            'usd_per_gpu': np.full(len(keep), dph_total / num_gpus),
+            'hash_rate': hash_rate,
+            'hash_rate_per_gpu': np.where(hash_rate > 0, hash_rate / num_gpus, np.nan),
+            'normal_blocks': normal_blocks,
+            'runtime_hours': runtime_hours,
+            'normal_block_per_hour': normal_block_per_hour,
+            'hash_rate_per_usd': hash_rate / dph_total,
+            'dollars_per_normal_block': np.where(normal_block_per_hour > 0, dph_total / normal_block_per_hour, 0.0),
+            'difficulty': columns.difficulty[keep].astype(np.float64),
+            'balance': np.full(len(keep), np.nan),
+        }
+    rows = []
+    for row in zip(times[keep].tolist(), *(values[column].tolist() for column in NUMERIC_COLUMNS)):
+        # SQLite stores NaN as NULL only when it is passed as None
+        rows.append(tuple(None if value != value else value for value in row))
+    return rows
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def backfill_host(ssh_info, username, ssh_pool, progress, put, stop, chunk_bytes=1048576, resolution=60, since=None):
+    """Stream one instance's miner.log backwards and put ('rows', instance_id, (rows, progress dict)) per chunk.
+
+    progress is the instance's HostProgress from the checkpoint or None. Returns when the start of the
+    log or the since cutoff (a Unix time) is reached, or when stop is set. Returns False without reading
+    anything if the checkpoint says the log was backfilled completely and its beginning is unchanged.
+    """
+    instance_id = ssh_info['instance_id']
+    num_gpus = _float(ssh_info['num_gpus'])
+    dph_total = _float(ssh_info['dph_total'])
+    with ssh_pool.sftp(ssh_info['ssh_host'], ssh_info['ssh_port'], username) as sftp:
+        with sftp.open(MINER_LOG_PATH, 'rb') as f:
+            stat = f.stat()
+            head = hashlib.sha1(b''.join(f.readv([(0, min(HEAD_BYTES, stat.st_size))]))).hexdigest()
+            if progress is None or progress.head != head or progress.size > stat.st_size:
+                if progress is not None:
+                    logging.info("miner.log of instance %s was rotated since the last backfill, starting from its end.", instance_id)
+                progress = HostProgress(head, stat.st_size, stat.st_mtime)
+            elif progress.done:
+                return False
+            elif progress.position < progress.size:
+                logging.info("Resuming the backfill of instance %s at %.0f%%.", instance_id, 100 - progress.position / progress.size * 100)
+
+            while not progress.done and not stop.is_set():
+                start = max(0, progress.position - chunk_bytes)
+                # readv() pipelines the SFTP read requests of the chunk instead of waiting for each
+                data = b''.join(f.readv([(start, progress.position - start)])) if progress.position > start else b''
+                instrumentation.SSH_BYTES_READ.inc(len(data))
+                data = data.replace(b'\r', b'\n')
+                # Only complete lines: the first one may have started before the chunk, the last one (at the end of
+                # the log) may still be being written. Both are read again with the next chunk or backfill.
+                first = data.find(b'\n') + 1 if start > 0 else 0
+                end = data.rfind(b'\n') + 1
+                if end <= first:
+                    # No complete line in the chunk; a line longer than chunk_bytes is skipped
+                    progress.position = start
+                    progress.done = start == 0
+                    continue
+
+                columns = log_parser.parse_buffer(data[first:end])
+                times = date_samples(progress, columns.runtime_seconds)
+                if since is not None and len(times) and times[0] < since:
+                    keep = times >= since
+                    columns = log_parser.MiningColumns(*(column[keep] for column in columns))
+                    times = times[keep]
+                    progress.done = True
+                rows = sample_rows(progress, columns, times, resolution, num_gpus, dph_total)
+                progress.samples += len(rows)
+                progress.position = start + first
+                progress.done = progress.done or progress.position == 0
+                put(('rows', instance_id, (rows, progress.to_dict())))
+    return True
+
+
+def run_backfill(ssh_info_list, username, ssh_pool, metrics_store, checkpoint_path, workers=4, chunk_bytes=1048576, resolution=60,
+                 since=None, restart=False):
+    """Backfill the metrics history from the logs of the instances in ssh_info_list. Returns the number of failed instances."""
+    checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+    # Instances checkpointed as done are read too: their log is compared with the checkpoint before it is skipped
+    todo = list(ssh_info_list)
+    if not todo:
+        return 0
+
+    # Bounded, so that readers wait for the writer instead of piling up chunks in memory
+    results = queue.Queue(maxsize=2 * workers)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def read(ssh_info):
+        progress = checkpoint.get(ssh_info['instance_id'])
+        try:
+            if not backfill_host(ssh_info, username, ssh_pool, HostProgress.from_dict(progress) if progress else None, put, stop,
+                                 chunk_bytes=chunk_bytes, resolution=resolution, since=since):
+                put(('unchanged', ssh_info['instance_id'], None))
+        except Exception as e:
+            put(('error', ssh_info['instance_id'], e))
+        put(('finished', ssh_info['instance_id'], None))
+
+    by_id = {ssh_info['instance_id']: ssh_info for ssh_info in todo}
+    failed = 0
+    unchanged = 0
+    finished = 0
+    last_report = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo))))
+    try:
+        for ssh_info in todo:
+            executor.submit(read, ssh_info)
+        while finished < len(todo):
+            kind, instance_id, payload = results.get()
+            if kind == 'rows':
+                rows, progress = payload
+                ssh_info = by_id[instance_id]
+                metrics_store.append_history(instance_id, ssh_info['gpu_name'], ssh_info['label'], rows)
+                checkpoint[instance_id] = progress
+                save_checkpoint(checkpoint_path, checkpoint)
+                if progress['done']:
+                    logging.info("Backfilled instance %s: %d samples from %.1f MiB of log.", instance_id, progress['samples'],
+                                 progress['size'] / 1048576)
+                elif time.monotonic() - last_report > 10:
+                    logging.info("Instance %s: %.0f%% of %.1f MiB", instance_id, 100 - progress['position'] / max(1, progress['size']) * 100,
+                                 progress['size'] / 1048576)
+                    last_report = time.monotonic()
+            elif kind == 'error':
+                failed += 1
+                logging.error("Backfill of instance %s failed: %s", instance_id, payload)
+            elif kind == 'unchanged':
+                unchanged += 1
+            else:
+                finished += 1
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+    if unchanged:
+        logging.info("%d instances were already backfilled.", unchanged)
+    return failed
@@ -0,0 +1,480 @@
+"""Command line interface.
+
+    python -m check_bot [collect] [--watch INTERVAL]        performance table of all instances (default)
+    python -m check_bot collect --dashboard [--watch 60]    live dashboard of the same table
+    python -m check_bot collect --coordinator HOST:PORT     worker polling --shard I/N of --account NAME for the coordinator
+    python -m check_bot collect --profile                   CPU and allocation profile of every phase of the cycles
+    python -m check_bot coordinator [--watch 60]            merged table of all workers
+    python -m check_bot list                                instances and their SSH commands
+    python -m check_bot balance                             account balance and how long it lasts
+    python -m check_bot report [--hours 24] [--instance ID] history from the metrics store
+    python -m check_bot backfill [--instance ID]            metrics history from the whole miner.log of each instance
+    python -m check_bot efficiency [--hours 168] [--top 10] USD/Block per GPU type, runway and costliest instances from the history
+
+Only argparse, logging and the configuration are imported up front. Each command imports what it
+needs when it runs, so list and balance never load numpy, paramiko or prettytable.
+"""
+import argparse
+import logging
+import os
+import sys
+
+from . import config
+
+
+COMMANDS = ('collect', 'list', 'balance', 'report', 'backfill', 'coordinator', 'efficiency')
+
+
+# Function to configure logging to script_output.log and, unless console is False, to the console
+def setup_logging(level=logging.INFO, console=True):
+    handlers = [logging.FileHandler("script_output.log")]
+    if console:
+        handlers.append(logging.StreamHandler())
+    logging.basicConfig(level=level,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=handlers)
+
+
+# Function to load the API key
+def load_api_key(api_key_file=None):
+    api_key_file = api_key_file or config.API_KEY_FILE
+    try:
+        with open(api_key_file, 'r') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        logging.error(f"API key file '{api_key_file}' not found.")
+        sys.exit(1)
+    except Exception as e:
+        logging.error(f"Error reading API key: {e}")
+        sys.exit(1)
+
+
+def _api_client(account=None):
+    from .vast_api import VastClient
+    if account is not None and account not in config.api_key_files:
+        logging.error(f"Unknown account '{account}', add it to api_key_files in the configuration.")
+        sys.exit(1)
+    api_key = load_api_key(config.api_key_files[account] if account is not None else None)
+    return VastClient(api_key, base_url=config.api_base_url, connect_timeout=config.api_connect_timeout,
+                      read_timeout=config.api_read_timeout, max_retries=config.api_max_retries)
+
+
+def cmd_collect(args):
+    import time
+
+    from . import instrumentation, profiling
+    from .alerts import dispatcher_from_config
+    from .instances import test_api_connection
+    from .metrics_store import MetricsStore
+    from .monitor import MonitorState, cached_report, run_cycle, warm_start
+    from .shard import ShardClient, parse_address, parse_shard
+    from .ssh_pool import SSHConnectionPool
+    from .state_cache import StateCache
+
+    if args.dashboard and not args.watch:
+        args.watch = 60
+    profiler = None
+    if args.profile or args.profile_baseline:
+        # Started before anything else so that the first cycle, with its connection setup, is included
+        profiler = profiling.Profiler(top_n=config.profile_top_n)
+        profiler.start()
+    # Log lines would scroll the dashboard away, they only go to script_output.log
+    setup_logging(console=not args.dashboard)
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+        coordinator_address = parse_address(args.coordinator, config.coordinator_port) if args.coordinator else None
+    except ValueError as e:
+        logging.error(e)
+        return 1
+    api_client = _api_client(args.account)
+
+    if config.instrumentation_http_port is not None:
+        instrumentation.start_http_server(config.instrumentation_http_port, config.instrumentation_http_address)
+
+    # A worker streams its results to the coordinator instead of printing them
+    shard_client = ShardClient(coordinator_address, args.account, shard, token=config.shard_token) if coordinator_address else None
+    state_cache_file = config.state_cache_file
+    if state_cache_file and (args.account or shard):
+        # Workers on the same machine keep separate caches
+        root, extension = os.path.splitext(state_cache_file)
+        state_cache_file = f"{root}.{args.account or 'default'}.{shard[0] if shard else 0}of{shard[1] if shard else 1}{extension}"
+    # Printed alerts would end up in the middle of the dashboard
+    alerts = dispatcher_from_config(stdout=not args.dashboard)
+    state = MonitorState(rate_window_seconds=config.rate_window_minutes * 60,
+                         cache=StateCache(state_cache_file, ttl=config.state_cache_ttl), shard=shard,
+                         on_log_info=shard_client.send_log_info if shard_client is not None else None, alerts=alerts)
+    # In watch mode the cached table is shown until the first cycle has finished
+    warm_started = warm_start(state, print_cached=bool(args.watch) and not args.dashboard and shard_client is None)
+
+    # Test API Connection
+    with instrumentation.PHASE_SECONDS.labels('test_api_connection').time(), profiling.phase('api'):
+        test_api_connection(api_client)
+
+    ssh_pool = SSHConnectionPool(config.private_key_path, config.passphrase,
+                                 max_connections=config.ssh_pool_max_connections,
+                                 idle_ttl=config.ssh_pool_idle_ttl,
+                                 keepalive_interval=config.ssh_keepalive_interval,
+                                 connect_timeout=config.ssh_connect_timeout)
+    metrics_store = MetricsStore(config.metrics_directory, retention_days=config.metrics_retention_days,
+                                 compress_after_days=config.metrics_compress_after_days) if config.metrics_directory and not shard_client else None
+    collection_deadline = config.collection_deadline
+    if collection_deadline is None and args.watch:
+        collection_deadline = args.watch * 0.75
+
+    def watch(screen=None):
+        warm = warm_started
+        dashboard = None
+        if screen is not None:
+            from .dashboard import Dashboard
+            dashboard = Dashboard(screen, top_n=config.dashboard_top_n, interval=args.watch)
+            if warm and state.ssh_info_list:
+                dashboard.update(cached_report(state))
+            else:
+                dashboard.draw()
+        while True:
+            cycle_started = time.monotonic()
+            if args.watch and dashboard is None and shard_client is None and sys.stdout.isatty() and not warm:
+                # Redraw from the top of the terminal on every refresh, but keep a cached table until fresh data replaces it
+                print("\033[2J\033[H", end="")
+            with instrumentation.PHASE_SECONDS.labels('cycle').time():
+                report = run_cycle(state, api_client, ssh_pool, metrics_store=metrics_store,
+                                   deadline=cycle_started + collection_deadline if collection_deadline else None,
+                                   quiet=dashboard is not None or shard_client is not None)
+            instrumentation.LAST_CYCLE_TIMESTAMP.set(time.time())
+            if profiler is not None:
+                profiler.cycles += 1
+            warm = False
+            if shard_client is not None:
+                shard_client.send_instances(state)
+                shard_client.send_cycle(report)
+            if dashboard is not None:
+                with instrumentation.PHASE_SECONDS.labels('dashboard').time(), profiling.phase('render'):
+                    dashboard.update(report)
+            if config.instrumentation_textfile:
+                try:
+                    instrumentation.write_textfile(config.instrumentation_textfile)
+                except OSError as e:
+                    logging.error("Failed to write instrumentation metrics to %s: %s", config.instrumentation_textfile, e)
+            if not args.watch:
+                break
+            remaining = max(0, args.watch - (time.monotonic() - cycle_started))
+            if dashboard is None:
+                time.sleep(remaining)
+            elif not dashboard.wait(remaining):
+                break
+
+    try:
+        if args.dashboard:
+            import curses
+            curses.wrapper(watch)
+        else:
+            watch()
+    except KeyboardInterrupt:
+        logging.info("Watch mode stopped.")
+    finally:
+        # Close pooled SSH and API connections and the metrics history
+        ssh_pool.close_all()
+        api_client.close()
+        if metrics_store is not None:
+            metrics_store.close()
+        if shard_client is not None:
+            shard_client.close()
+        if alerts is not None:
+            alerts.close()
+        if profiler is not None:
+            write_profile(profiler, args.profile_baseline)
+    return 0
+
+
+# Function to stop the profiler of collect --profile, write its report and compare it with the baseline file if given
+def write_profile(profiler, baseline_path=None):
+    import json
+
+    from .profiling import compare
+
+    profiler.stop()
+    text_path, json_path = profiler.write(config.profile_directory)
+    print(profiler.text())
+    print(f"\nProfile written to {text_path} and {json_path}")
+    if baseline_path:
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read the profile baseline {baseline_path}: {e}")
+            return
+        regressions = compare(baseline, profiler.data())
+        print(f"\nCompared with {baseline_path}: " + ("no phase or function got slower." if not regressions else f"{len(regressions)} slower:"))
+        for line in regressions:
+            print(f"  {line}")
+
+
+def cmd_coordinator(args):
+    import time
+
+    from . import instrumentation
+    from .instances import print_vastai_balance
+    from .metrics_store import MetricsStore
+    from .monitor import cached_log_infos, print_fleet_table
+    from .report import build_table_data, report_outliers
+    from .shard import Coordinator, parse_address, start_coordinator_server
+
+    setup_logging()
+    host, port = parse_address(args.listen, config.coordinator_port) if args.listen else (config.coordinator_address, config.coordinator_port)
+    if host not in ('127.0.0.1', 'localhost', '::1') and config.shard_token is None:
+        logging.warning("The coordinator listens on %s without a shard_token, anyone who can reach it can send it data.", host)
+    coordinator = Coordinator(ttl=config.state_cache_ttl, token=config.shard_token)
+    server = start_coordinator_server(coordinator, port, host)
+    if config.instrumentation_http_port is not None:
+        instrumentation.start_http_server(config.instrumentation_http_port, config.instrumentation_http_address)
+    # The coordinator keeps the metrics history of the whole fleet, the workers do not
+    metrics_store = MetricsStore(config.metrics_directory, retention_days=config.metrics_retention_days,
+                                 compress_after_days=config.metrics_compress_after_days) if config.metrics_directory else None
+    try:
+        while True:
+            cycle_started = time.monotonic()
+            fresh, accounts, warnings, regressions = coordinator.merge()
+            if not coordinator.ssh_info_list:
+                print(f"Waiting for workers on {host}:{server.server_address[1]}...")
+            else:
+                if sys.stdout.isatty():
+                    print("\033[2J\033[H", end="")
+                log_info_list, ages = cached_log_infos(coordinator, fresh)
+                fleet = build_table_data(coordinator.ssh_info_list, log_info_list, coordinator.rates)
+                if config.print_balance_check:
+                    print("\n" + "-" * 60 + "\n")
+                    for account, (balance, total_dph) in sorted(accounts.items(), key=lambda item: str(item[0])):
+                        print(f"Account {account or 'default'}:")
+                        print_vastai_balance(balance, total_dph)
+                    balances = [balance for balance, _ in accounts.values()]
+                    if len(accounts) > 1 and None not in balances:
+                        print("All accounts:")
+                        print_vastai_balance(sum(balances), coordinator.total_dph_running_machines)
+                    print("\n" + "-" * 60)
+                print_fleet_table(coordinator, fleet, ages)
+                if metrics_store is not None:
+                    balances = [balance for balance, _ in accounts.values() if balance is not None]
+                    try:
+                        metrics_store.append(time.time(), [row for row in fleet['table_data'] if row[0] in fresh], fleet['difficulty_by_instance'],
+                                             sum(balances) if balances else None)
+                    except Exception as e:
+                        logging.error("Failed to store metrics: %s", e)
+                gpu_codes = {gpu_type: gpu_code for gpu_code, gpu_type in enumerate(fleet['gpu_types'])}
+                report_outliers(fleet['fleet'], fleet['gpu_types'], warnings | fleet['gpu_util_warnings_set'],
+                                {gpu_codes[gpu_name]: messages for gpu_name, messages in regressions.items() if gpu_name in gpu_codes})
+            instrumentation.LAST_CYCLE_TIMESTAMP.set(time.time())
+            time.sleep(max(0, args.watch - (time.monotonic() - cycle_started)))
+    except KeyboardInterrupt:
+        logging.info("Coordinator stopped.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        if metrics_store is not None:
+            metrics_store.close()
+    return 0
+
+
+def cmd_list(args):
+    from .instances import instance_list
+
+    setup_logging(logging.WARNING)
+    api_client = _api_client()
+    try:
+        ssh_info_list, total_dph_running_machines, total_gpus_running = instance_list(api_client)
+    finally:
+        api_client.close()
+
+    for ssh_info in ssh_info_list:
+        print(f"{ssh_info['instance_id']!s:>10}  {ssh_info['actual_status']!s:<10}  {ssh_info['num_gpus']}x {ssh_info['gpu_name']!s:<14}  "
+              f"{ssh_info['dph_total']}$/h  ssh -p {ssh_info['ssh_port']} root@{ssh_info['ssh_host']}  {ssh_info['label'] or ''}")
+    print(f"{len(ssh_info_list)} instances, {total_gpus_running} GPUs running, Total DPH: {total_dph_running_machines:.4f}$")
+    return 0
+
+
+def cmd_balance(args):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .instances import get_vastai_balance, instance_list, print_vastai_balance
+
+    setup_logging(logging.WARNING)
+    api_client = _api_client()
+    try:
+        # The spend rate comes from the instance list, fetched while the balance is requested
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            balance_future = executor.submit(get_vastai_balance, api_client)
+            _, total_dph_running_machines, _ = instance_list(api_client)
+            balance = balance_future.result()
+    finally:
+        api_client.close()
+    print_vastai_balance(balance, total_dph_running_machines)
+    return 0 if balance is not None else 1
+
+
+def cmd_report(args):
+    import datetime
+    import time
+
+    import numpy as np
+
+    from .metrics_store import MetricsStore
+
+    setup_logging(logging.WARNING)
+    if not config.metrics_directory:
+        logging.error("The metrics history is disabled (metrics_directory is None).")
+        return 1
+    until = time.time()
+    since = until - args.hours * 3600
+    store = MetricsStore(config.metrics_directory, retention_days=config.metrics_retention_days,
+                         compress_after_days=config.metrics_compress_after_days)
+    try:
+        if args.instance is not None:
+            timestamps, values = store.series(args.column, args.instance, since, until)
+            title = f"{args.column} of instance {args.instance}, hourly mean"
+        else:
+            timestamps, values = store.fleet_usd_per_block_hourly(since, until)
+            title = "Fleet USD/Block per hour"
+    except ValueError as e:
+        logging.error(e)
+        return 1
+    finally:
+        store.close()
+
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    if not timestamps.size:
+        print(f"No data in the last {args.hours:g} hours.")
+        return 0
+    hours, inverse = np.unique(timestamps // 3600 * 3600, return_inverse=True)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=values) / counts
+    print(title)
+    for hour, mean, count in zip(hours.tolist(), means.tolist(), counts.tolist()):
+        print(f"{datetime.datetime.fromtimestamp(hour):%Y-%m-%d %H:%M}  {mean:>14.4f}  ({count} samples)")
+    return 0
+
+
+def cmd_backfill(args):
+    import time
+
+    from .backfill import run_backfill
+    from .instances import instance_list
+    from .metrics_store import MetricsStore
+    from .ssh_pool import SSHConnectionPool
+
+    setup_logging()
+    if not config.metrics_directory:
+        logging.error("The metrics history is disabled (metrics_directory is None).")
+        return 1
+    api_client = _api_client()
+    try:
+        ssh_info_list, _, _ = instance_list(api_client)
+    finally:
+        api_client.close()
+    ssh_info_list = [ssh_info for ssh_info in ssh_info_list if str(ssh_info['actual_status']).lower() == 'running'
+                     and (not args.instance or ssh_info['instance_id'] in args.instance)]
+    if not ssh_info_list:
+        logging.error("No running instances to backfill.")
+        return 1
+
+    # Compression pays off for whole logs, unlike for the small outputs of a collection cycle
+    ssh_pool = SSHConnectionPool(config.private_key_path, config.passphrase, max_connections=config.backfill_workers,
+                                 keepalive_interval=config.ssh_keepalive_interval, connect_timeout=config.ssh_connect_timeout, compress=True)
+    store = MetricsStore(config.metrics_directory, retention_days=config.metrics_retention_days,
+                         compress_after_days=config.metrics_compress_after_days)
+    since = time.time() - config.metrics_retention_days * 86400 if config.metrics_retention_days is not None else None
+    try:
+        failed = run_backfill(ssh_info_list, 'root', ssh_pool, store, config.backfill_checkpoint_file, workers=config.backfill_workers,
+                              chunk_bytes=config.backfill_chunk_bytes, resolution=config.backfill_resolution, since=since,
+                              restart=args.restart)
+    except KeyboardInterrupt:
+        logging.info("Backfill interrupted, run it again to resume.")
+        return 1
+    finally:
+        ssh_pool.close_all()
+        # Day segments that were decompressed for the backfill are compressed again
+        store.rotate()
+        store.close()
+    return 1 if failed else 0
+
+
+def cmd_efficiency(args):
+    import time
+
+    from .efficiency import analyze, print_efficiency
+    from .metrics_store import MetricsStore
+
+    setup_logging(logging.WARNING)
+    if not config.metrics_directory:
+        logging.error("The metrics history is disabled (metrics_directory is None).")
+        return 1
+    until = time.time()
+    since = until - args.hours * 3600
+    store = MetricsStore(config.metrics_directory, retention_days=config.metrics_retention_days,
+                         compress_after_days=config.metrics_compress_after_days)
+    try:
+        rollup = store.hourly_rollup(since, until, with_balance=True)
+    finally:
+        store.close()
+    if not rollup['instance_id'].size:
+        print(f"No data in the last {args.hours:g} hours.")
+        return 0
+    print_efficiency(analyze(rollup, rollup['balance_ts'], rollup['balance'], recent_hours=args.recent), args.hours, recent_hours=args.recent, top=args.top)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='check_bot', description="Check XENGPUMiner performance on your Vast.ai instances.")
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    collect = subparsers.add_parser('collect', help="Read the miner logs and print the performance table (default).")
+    collect.add_argument('--watch', type=float, metavar='INTERVAL',
+                         help="Keep running and refresh the report every INTERVAL seconds instead of exiting after one pass.")
+    collect.add_argument('--dashboard', action='store_true',
+                         help="Show a live dashboard that redraws only what changed instead of printing the table (refreshes every 60 seconds "
+                              "unless --watch is given).")
+    collect.add_argument('--coordinator', metavar='HOST:PORT',
+                         help="Run as a worker: stream the results to the coordinator at HOST:PORT instead of printing them.")
+    collect.add_argument('--account', metavar='NAME', help="Use the API key of this account of api_key_files in the configuration.")
+    collect.add_argument('--shard', metavar='INDEX/COUNT',
+                         help="Only poll the instances whose ID modulo COUNT is INDEX, e.g. 0/2 and 1/2 for two workers.")
+    collect.add_argument('--profile', action='store_true',
+                         help="Profile CPU time and allocations of every phase until the run ends and write a report to profile_directory.")
+    collect.add_argument('--profile-baseline', metavar='FILE',
+                         help="Profile like --profile and list what got slower than in FILE, the .json report of an earlier run.")
+    collect.set_defaults(handler=cmd_collect)
+
+    subparsers.add_parser('list', help="List the instances and their SSH commands.").set_defaults(handler=cmd_list)
+    subparsers.add_parser('balance', help="Print the account balance and how long it lasts.").set_defaults(handler=cmd_balance)
+
+    report = subparsers.add_parser('report', help="Print hourly values from the metrics history.")
+    report.add_argument('--hours', type=float, default=24, help="How far back to report (default: 24)")
+    report.add_argument('--instance', type=int, metavar='ID', help="Report one column of one instance instead of the fleet USD/Block")
+    report.add_argument('--column', default='hash_rate', help="Column reported with --instance (default: hash_rate)")
+    report.set_defaults(handler=cmd_report)
+
+    backfill = subparsers.add_parser('backfill', help="Fill the metrics history from the whole miner.log of each running instance.")
+    backfill.add_argument('--instance', type=int, action='append', metavar='ID', help="Only backfill this instance (can be repeated)")
+    backfill.add_argument('--restart', action='store_true', help="Ignore the checkpoint of a previous backfill and start over")
+    backfill.set_defaults(handler=cmd_backfill)
+
+    efficiency = subparsers.add_parser('efficiency', help="Print USD/Block per GPU type, the balance runway and the costliest instances from the metrics history.")
+    efficiency.add_argument('--hours', type=float, default=168, help="How far back to look (default: 168)")
+    efficiency.add_argument('--recent', type=float, default=24, help="Hours of the trailing USD/Block column (default: 24)")
+    efficiency.add_argument('--top', type=int, default=10, help="Number of instances ranked by their cost per block (default: 10)")
+    efficiency.set_defaults(handler=cmd_efficiency)
+
+    coordinator = subparsers.add_parser('coordinator', help="Merge the results of collect --coordinator workers and print the fleet table.")
+    coordinator.add_argument('--listen', metavar='HOST:PORT',
+                             help="Address to receive the workers on (default: coordinator_address and coordinator_port of the configuration)")
+    coordinator.add_argument('--watch', type=float, default=60, metavar='INTERVAL', help="Print the merged report every INTERVAL seconds (default: 60)")
+    coordinator.set_defaults(handler=cmd_coordinator)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Without a command the table is collected, as check_bot_1.py always did (e.g. `check_bot_1.py --watch 60`)
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv = ['collect'] + argv
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
@@ -0,0 +1,286 @@
+"""Reading miner.log from the instances over SSH."""
+import base64
+import functools
+import json
+import logging
+import os
+import re
+import shlex
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import paramiko
+
+from . import config, instrumentation, log_parser, profiling
+
+
+# Function to remove ANSI escape codes
+ANSI_ESCAPE_PATTERN = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]', re.IGNORECASE)
+
+def clean_ansi_codes(input_string):
+    return ANSI_ESCAPE_PATTERN.sub('', input_string)
+
+
+MINER_LOG_PATH = '/root/XENGPUMiner/miner.log'
+
+
+class LogTail:
+    """Incremental reader of one host's miner.log.
+
+    Remembers the inode and byte offset reached by the previous poll so that only appended bytes are
+    transferred, starts over when the log was rotated or truncated, and keeps the parsed 'Mining:'
+    samples of the last window_seconds of miner runtime.
+    """
+
+    def __init__(self, window_seconds=3600, maxlen=4096):
+        self.window_seconds = window_seconds
+        self.inode = None
+        self.offset = None
+        self.stalled_polls = 0  # consecutive polls without a new 'Mining:' line
+        # (runtime_seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty), oldest first
+        self.samples = deque(maxlen=maxlen)
+
+    def command(self, initial_bytes=65536, max_bytes=1048576):
+        """Shell command printing '<inode> <start offset>' followed by the log bytes from that offset on."""
+        if self.inode is None:
+            # First poll: only read the end of the log
+            start = f'$(( $2 > {initial_bytes} ? $2 - {initial_bytes} : 0 ))'
+        else:
+            # Continue where the previous poll stopped, or start over if the log was rotated or truncated
+            start = f'$(( $1 == {self.inode} && $2 >= {self.offset} ? {self.offset} : 0 ))'
+        return (f"set -- $(stat -c '%i %s' {MINER_LOG_PATH}) && start={start} && echo \"$1 $start\" && "
+                f"tail -c +$((start + 1)) {MINER_LOG_PATH} | head -c {max_bytes}")
+
+    def feed(self, output):
+        """Consume the output of command() and return the number of new samples."""
+        header, _, data = output.partition(b'\n')
+        if not header:
+            raise ValueError(f"{MINER_LOG_PATH} does not exist or cannot be read")
+        try:
+            inode, start = (int(field) for field in header.split())
+        except ValueError:
+            raise ValueError(f"Unexpected output while reading {MINER_LOG_PATH}: {header[:200]!r}")
+
+        if start == 0 and self.inode is not None and (inode != self.inode or self.offset):
+            logging.info("miner.log was rotated or truncated, reading it from the start.")
+            self.samples.clear()
+        # Only consume complete lines; a partially written last line is read again on the next poll
+        end = max(data.rfind(b'\n'), data.rfind(b'\r')) + 1
+        complete = data[:end]
+        if start > 0 and self.inode is None:
+            # The first read starts in the middle of a line, skip it
+            first_break = min(position for position in (complete.find(b'\n'), complete.find(b'\r'), len(complete)) if position >= 0)
+            complete = complete[first_break + 1:]
+        self.inode = inode
+        self.offset = start + end
+
+        new_samples = 0
+        for sample in log_parser.iter_rows(log_parser.parse_buffer(complete)):
+            if self.samples and sample[0] < self.samples[-1][0]:
+                # Runtime went backwards, the miner was restarted and its counters start from zero
+                self.samples.clear()
+            self.samples.append(sample)
+            new_samples += 1
+
+        self.stalled_polls = 0 if new_samples else self.stalled_polls + 1
+
+        # Drop samples that fell out of the rate window
+        if self.samples:
+            window_start = self.samples[-1][0] - self.window_seconds
+            while self.samples[0][0] < window_start:
+                self.samples.popleft()
+        return new_samples
+
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def rates(self):
+        """Return (mean hash rate, normal blocks per hour) over the window, or None with fewer than two samples."""
+        if len(self.samples) < 2:
+            return None
+        first, last = self.samples[0], self.samples[-1]
+        elapsed_hours = (last[0] - first[0]) / 3600
+        if elapsed_hours <= 0:
+            return None
+        mean_hash_rate = sum(sample[4] for sample in self.samples) / len(self.samples)
+        return mean_hash_rate, (last[2] - first[2]) / elapsed_hours
+
+    def gpu_util(self):
+        """The log holds no GPU readings; the utilization from the instance list is used instead."""
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _agent_bootstrap():
+    # remote_agent.py travels compressed inside the command line, which keeps it to one exec round trip
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remote_agent.py'), 'rb') as f:
+        payload = base64.b64encode(zlib.compress(f.read(), 9)).decode()
+    return f"import base64,zlib;exec(compile(zlib.decompress(base64.b64decode('{payload}')),'remote_agent','exec'))"
+
+
+def agent_command(log_path, window_seconds, scan_bytes):
+    """Shell command running remote_agent.py on the host, or printing a 'no_python' record if python3 is missing."""
+    return (f"if command -v python3 >/dev/null 2>&1; then python3 -c \"{_agent_bootstrap()}\" "
+            f"{shlex.quote(log_path)} {int(window_seconds)} {int(scan_bytes)}; "
+            f"else echo '{{\"v\": 1, \"error\": \"python3 not found\", \"no_python\": true}}'; fi")
+
+
+class RemoteSummary:
+    """Latest state of one host as summarized by remote_agent.py on the host itself.
+
+    Each poll returns one small JSON record with the latest 'Mining:' sample, the rates over the last
+    window_seconds of miner runtime and nvidia-smi readings, instead of the log bytes LogTail transfers.
+    Has the same interface as LogTail. no_python is set when the host has no python3, and the caller
+    then falls back to a LogTail.
+    """
+
+    def __init__(self, window_seconds=3600, scan_bytes=4194304):
+        self.window_seconds = window_seconds
+        self.scan_bytes = scan_bytes
+        self.inode = None
+        self.stalled_polls = 0  # consecutive polls without a new 'Mining:' line
+        self.sample = None
+        self.window = None  # (mean hash rate, normal blocks per hour, covered seconds, samples)
+        self.gpus = None    # per GPU: (index, utilization %, power W, SM clock MHz, memory clock MHz, temperature C)
+        self.no_python = False
+
+    def command(self, initial_bytes=None, max_bytes=None):
+        """Shell command running the agent. The LogTail byte limits do not apply, the agent parses the last scan_bytes."""
+        return agent_command(MINER_LOG_PATH, self.window_seconds, self.scan_bytes)
+
+    def feed(self, output):
+        """Consume the output of command() and return 1 if it holds a new sample, else 0."""
+        try:
+            record = json.loads(output)
+        except ValueError:
+            raise ValueError(f"Unexpected output from the remote agent: {output[:200]!r}")
+        if record.get('no_python'):
+            self.no_python = True
+        if record.get('error'):
+            raise ValueError(record['error'])
+
+        sample = tuple(record['latest']) if record.get('latest') else None
+        new_sample = sample is not None and (sample != self.sample or record.get('inode') != self.inode)
+        self.inode = record.get('inode')
+        self.sample = sample
+        self.window = tuple(record['window']) if record.get('window') else None
+        self.gpus = [tuple(gpu) for gpu in record['gpus']] if record.get('gpus') is not None else None
+        self.stalled_polls = 0 if new_sample else self.stalled_polls + 1
+        return int(new_sample)
+
+    def latest(self):
+        return self.sample
+
+    def rates(self):
+        """Return (mean hash rate, normal blocks per hour) over the window, or None with fewer than two samples."""
+        return self.window[:2] if self.window is not None else None
+
+    def gpu_util(self):
+        """Mean GPU utilization reported by nvidia-smi, or None without readings."""
+        readings = [gpu[1] for gpu in self.gpus or () if gpu[1] is not None]
+        return sum(readings) / len(readings) if readings else None
+
+
+def make_log_tail(window_seconds=3600):
+    """Per-host log reader for the configured collection method."""
+    if config.remote_agent:
+        return RemoteSummary(window_seconds, scan_bytes=config.remote_agent_scan_bytes)
+    return LogTail(window_seconds)
+
+
+def get_log_info(ssh_host, ssh_port, username, ssh_pool, command_timeout=None, log_tail=None):
+    try:
+        # Execute the command to get the log information over a pooled connection.
+        # With a LogTail only the part of the log appended since the previous poll is read,
+        # with a RemoteSummary the host sends a summary of its log instead.
+        if log_tail is not None:
+            command = log_tail.command(initial_bytes=config.log_initial_bytes, max_bytes=config.log_max_bytes_per_poll)
+        else:
+            command = f'tail -n 1 {MINER_LOG_PATH}'
+        try:
+            with profiling.phase('ssh'):
+                output = ssh_pool.exec_command(ssh_host, ssh_port, username, command, timeout=command_timeout)
+        except paramiko.ssh_exception.PasswordRequiredException:
+            logging.error("Private key file is encrypted and requires a passphrase.")
+            return None, None, None, None, None, None, None, None
+
+        if log_tail is not None:
+            try:
+                with instrumentation.LOG_PARSE_SECONDS.time(), profiling.phase('parse'):
+                    new_samples = log_tail.feed(output)
+            except ValueError:
+                instrumentation.LOG_PARSE_FAILURES.inc()
+                raise
+            logging.info("Read %d bytes from %s:%s, %d new Mining samples", len(output), ssh_host, ssh_port, new_samples)
+            sample = log_tail.latest()
+            if sample is None:
+                instrumentation.LOG_PARSE_FAILURES.inc()
+                logging.error("No Mining line found in the log of %s:%s", ssh_host, ssh_port)
+                return None, None, None, None, None, None, None, None
+        else:
+            last_line = output.decode(errors='replace').strip()
+            logging.info("Raw log line: %s", last_line)
+
+            # Parse the last line to get the required information
+            with instrumentation.LOG_PARSE_SECONDS.time(), profiling.phase('parse'):
+                samples = list(log_parser.iter_rows(log_parser.parse_buffer(output)))
+            if not samples:
+                instrumentation.LOG_PARSE_FAILURES.inc()
+                logging.error("Failed to parse the log line: %s", clean_ansi_codes(last_line))
+                return None, None, None, None, None, None, None, None
+            sample = samples[-1]
+
+        # Extracting the running time and blocks information
+        runtime_seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty = sample
+        hours, remainder = divmod(runtime_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return hours, minutes, seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty
+
+    except Exception as e:
+        logging.error("Failed to connect or retrieve log info: %s", e)
+        return None, None, None, None, None, None, None, None
+
+
+# Function to fetch log information for many instances concurrently
+def collect_log_info(ssh_info_list, username, ssh_pool, max_workers=32, command_timeout=None, log_tails=None, deadline=None,
+                     on_result=None):
+    """Run get_log_info() for every instance with at most max_workers connections in flight.
+
+    Results are returned in the same order as ssh_info_list, so callers can zip them back together.
+    If log_tails maps instance IDs to LogTail or RemoteSummary objects, logs are read incrementally or
+    summarized on the host. Hosts without python3 are switched from RemoteSummary to LogTail.
+
+    With a deadline (a time.monotonic() value) the call returns by then. Instances that have not answered
+    yet get None instead of a result: those not started are cancelled, the others finish in the background.
+    on_result(ssh_info, log_info) is called from the worker threads as each instance answers, including
+    after the deadline, and with log_info None for cancelled ones.
+    """
+    def fetch(ssh_info):
+        logging.info("Fetching log info for instance ID: %s", ssh_info['instance_id'])
+        log_tail = log_tails.get(ssh_info['instance_id']) if log_tails is not None else None
+        log_info = get_log_info(ssh_info['ssh_host'], ssh_info['ssh_port'], username, ssh_pool,
+                                command_timeout=command_timeout, log_tail=log_tail)
+        if getattr(log_tail, 'no_python', False):
+            logging.warning("Instance %s has no python3, reading its log with tail instead.", ssh_info['instance_id'])
+            log_tail = log_tails[ssh_info['instance_id']] = LogTail(window_seconds=log_tail.window_seconds)
+            log_info = get_log_info(ssh_info['ssh_host'], ssh_info['ssh_port'], username, ssh_pool,
+                                    command_timeout=command_timeout, log_tail=log_tail)
+        return log_info
+
+    if not ssh_info_list:
+        return []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ssh_info_list))))
+    futures = []
+    for ssh_info in ssh_info_list:
+        future = executor.submit(fetch, ssh_info)
+        if on_result is not None:
+            future.add_done_callback(lambda future, ssh_info=ssh_info: on_result(ssh_info, None if future.cancelled() else future.result()))
+        futures.append(future)
+    _, not_done = wait(futures, timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+    executor.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        instrumentation.POLLS_PAST_DEADLINE.inc(len(not_done))
+        logging.warning("%d of %d instances had not answered by the cycle deadline.", len(not_done), len(futures))
+    return [future.result() if future.done() and not future.cancelled() else None for future in futures]
@@ -0,0 +1,272 @@
+"""User configuration of check_bot.
+
+Edit the values below to match your setup. They are read when a command runs, so they can also be
+changed from Python before calling check_bot.cli.main().
+"""
+
+####### User configuration ####### 
+
+# Path to your API key. 
+# Default: 'api_key.txt' (Assumes the API key file is located in the folder you run the script from).
+# Update this path if your API key file is located elsewhere.
+API_KEY_FILE = 'api_key.txt'
+
+# SSH Key Configuration:
+# In order to securely connect to Vast.ai instances, you need to generate an SSH key pair.
+# Follow these steps:
+#   1. Open a terminal (Linux/Mac) or Command Prompt/Powershell (Windows).
+#   2. Run the following command to generate a new SSH key pair:
+#      ssh-keygen -t ed25519
+#   3. When prompted, press Enter to save the key pair into the default directory. If you prefer a different location, provide the path.
+#   4. If you wish, provide a passphrase for additional security when prompted; otherwise, press Enter to skip.
+#   5. Once generated, your private key will be saved to a file (by default, it's id_ed25519 in your ~/.ssh/ directory).
+#   6. Your public key will be saved to a file with the same name but with .pub extension (by default, it's id_ed25519.pub).
+#   7. Open the public key file with a text editor, copy its content, and paste it into the SSH Keys section on https://cloud.vast.ai/account/.
+#      The content of the public key should look something like this example:
+#      "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIK0wmN/Cr3JXqmLW7u+g9pTh+wyqDHpSQEIQczXkVx9q"
+#   8. Ensure that you keep your private key secure and do not share it.
+
+# Now, set the path to your private SSH key here. 
+# Instructions: 
+#   - Windows: Use a raw string (prefix the string with 'r') to ensure backslashes are treated literally, not as escape characters.
+#   - Linux/Mac: Use a standard string with forward slashes.
+# Example for Windows: r"C:/Users/your_username/.ssh/id_ed25519"
+# Example for Linux: "/home/your_username/.ssh/id_ed25519"
+# Example for Mac: "/Users/your_username/.ssh/id_ed25519"
+private_key_path = r"C:/Users/your_username/.ssh/id_ed25519"
+
+# If your private SSH key is protected by a passphrase, provide it here.
+# If not, leave this as an empty string ("").
+# Example: passphrase = "your_passphrase"
+passphrase = ""
+
+####### Table printout configuration ####### 
+
+# Column index by which the table should be sorted.
+# Note: Column indices start at 0. So, for example, to sort by the first column, set this value to 0.
+# Default: 12 (Assumes "USD/Block" to sort by.)
+sort_column_index = 11
+
+# Order in which the table should be sorted.
+# Options: 
+#   - 'ascending': Sort from smallest to largest.
+#   - 'descending': Sort from largest to smallest.
+# Default: 'ascending'
+sort_order = 'ascending'
+
+####### Outliers configuration ####### 
+
+# Think of the Z-Score as a "performance alert" level for your GPUs.
+# It helps you spot GPUs that aren't performing as well as you expect, compared to the group average.
+# The Z-Score measures how far a GPU's performance is from the average, in terms of group's standard deviation.
+# Setting a lower threshold means you're tightening the criteria and will get alerts for smaller deviations from the average.
+# A default threshold of 1 indicates GPUs that performing 2x standard deviations below the group average
+# It's a way to catch the biggest concerns without too many false alarms. Adjust the threshold to find the best balance for your monitoring needs.
+threshold = 1
+
+# Statistics used for the Z-Score of each GPU type.
+# Options:
+#   - 'mean': Average and standard deviation of the group.
+#   - 'median': Median and median absolute deviation of the group. A few dead or broken instances barely move these,
+#               so they do not hide other underperforming instances.
+# Default: 'mean'
+outlier_statistics = 'mean'
+
+####### Streaming anomaly detection configuration ####### 
+
+# In watch mode every poll also feeds per-instance detectors that flag sustained regressions (see anomaly.py).
+# 'anomaly_drop_tolerance': Relative hash rate shortfall against an instance's own recent baseline that is ignored. Default: 0.05 (5%)
+# 'anomaly_drop_limit': Accumulated shortfall beyond the tolerance that raises an alert. Default: 0.25
+#                       (a 30% drop is reported on the second poll, a 10% drop on the sixth)
+# 'anomaly_group_limit': Accumulated Z-Score beyond 'threshold' below the GPU type average that raises an alert. Default: 4.0
+# 'anomaly_util_polls': Consecutive polls with GPU utilization below 85% before it is reported as sustained. Default: 3
+# 'anomaly_stalled_polls': Consecutive polls without new lines in miner.log before the miner is reported as stalled. Default: 2
+anomaly_drop_tolerance = 0.05
+anomaly_drop_limit = 0.25
+anomaly_group_limit = 4.0
+anomaly_util_polls = 3
+anomaly_stalled_polls = 2
+
+####### Current balance printout for Vast.ai account ####### 
+
+# Set 'print_balance_check' to 'False' if you do not wish to print your balance information.
+# When set to 'True', the script will display the current balance from your Vast.ai account.
+print_balance_check = True
+
+####### Vast.ai API configuration ####### 
+
+# 'api_base_url': Address of the Vast.ai API. Default: 'https://console.vast.ai/api/v0'
+# 'api_connect_timeout' / 'api_read_timeout': Seconds to wait for the API to accept the connection and to answer. Default: 10 / 30
+# 'api_max_retries': Retries after rate limiting (429), server errors and network errors, with exponential backoff. Default: 4
+api_base_url = 'https://console.vast.ai/api/v0'
+api_connect_timeout = 10
+api_read_timeout = 30
+api_max_retries = 4
+
+####### SSH collection configuration ####### 
+
+# Maximum number of instances polled over SSH at the same time.
+# Higher values finish a pass over a large fleet faster but open more simultaneous connections.
+# Default: 32
+max_concurrent_connections = 32
+
+# Seconds to wait for the TCP connection, SSH banner and authentication of a single host.
+# Default: 10
+ssh_connect_timeout = 10
+
+# Seconds to wait for the remote log command of a single host to return its output.
+# Default: 15
+ssh_command_timeout = 15
+
+# SSH connections are kept open between polls and reused. These settings control the connection pool.
+# 'ssh_pool_max_connections': Upper bound of open connections; the least recently used one is closed first. Default: 1000
+# 'ssh_pool_idle_ttl': Seconds after which an unused connection is closed. Default: 900
+# 'ssh_keepalive_interval': Seconds between keepalive packets on open connections (0 disables them). Default: 30
+ssh_pool_max_connections = 1000
+ssh_pool_idle_ttl = 900
+ssh_keepalive_interval = 30
+
+####### Log tailing configuration ####### 
+
+# After the first poll only the bytes appended to miner.log since the previous poll are transferred.
+# 'log_initial_bytes': How much of the end of miner.log is read the first time a host is polled. Default: 65536
+# 'log_max_bytes_per_poll': Upper bound of new log data read per host and poll. A host that fell behind catches up over several polls. Default: 1048576
+# 'rate_window_minutes': Hash rate, Block/h and USD/Block are computed over this many minutes of miner runtime. Default: 60
+log_initial_bytes = 65536
+log_max_bytes_per_poll = 1048576
+rate_window_minutes = 60
+
+# 'remote_agent': Instead of transferring log bytes, run a small collector on each host (check_bot/remote_agent.py, needs
+#                 python3 there) that returns the latest stats, the rates over the window and nvidia-smi GPU readings
+#                 as one small JSON record per poll. GPU utilization then comes from the host instead of the often stale
+#                 API value. Hosts without python3 are tailed as described above. Each poll starts python3 on the host
+#                 and parses remote_agent_scan_bytes of log there, which makes a poll several times slower than tailing
+#                 only the new bytes. Default: False
+# 'remote_agent_scan_bytes': How much of the end of miner.log the collector parses on the host each poll. It should
+#                            cover rate_window_minutes of log. Default: 4194304
+remote_agent = False
+remote_agent_scan_bytes = 4194304
+
+####### Metrics history configuration ####### 
+
+# Every cycle the table rows, difficulty and balance are stored in a queryable history (see metrics_store.py).
+# 'metrics_directory': Folder for the history, one SQLite file per day. Set to None to disable it. Default: 'metrics'
+# 'metrics_retention_days': Days of history to keep. Default: 90
+# 'metrics_compress_after_days': Days after which a day file is gzip-compressed. Default: 7
+metrics_directory = 'metrics'
+metrics_retention_days = 90
+metrics_compress_after_days = 7
+
+# `python -m check_bot backfill` fills the metrics history from the whole miner.log of each running instance
+# (see backfill.py), going back as far as 'metrics_retention_days'.
+# 'backfill_workers': Instances read at the same time. Default: 4
+# 'backfill_chunk_bytes': Bytes of log read, parsed and stored at a time per instance. Default: 1048576
+# 'backfill_resolution': Seconds between the stored samples. Default: 60
+# 'backfill_checkpoint_file': Progress of each instance, to resume an interrupted backfill. Default: 'backfill_checkpoint.json'
+backfill_workers = 4
+backfill_chunk_bytes = 1048576
+backfill_resolution = 60
+backfill_checkpoint_file = 'backfill_checkpoint.json'
+
+# The last instance list and the last good values of every instance are kept in this file (see state_cache.py).
+# An instance that fails to answer is shown with its cached values and their age instead of leaving the table,
+# and after a restart in watch mode the cached table is printed right away while fresh data is collected.
+# 'state_cache_file': Set to None to keep the cache in memory only. Default: 'state_cache.json'
+# 'state_cache_ttl': Seconds after which cached values are dropped. Default: 3600
+state_cache_file = 'state_cache.json'
+state_cache_ttl = 3600
+
+# The text rendering of each table used to be appended to 'table_output.txt' on every run.
+# Set this to a file name to keep doing so, or leave it as None to rely on the metrics history.
+# Default: None
+table_output_file = None
+
+####### Watch mode configuration ####### 
+
+# With --watch INTERVAL the script keeps running and redraws the report every INTERVAL seconds.
+# The instance list (including GPU utilization and DPH) is refreshed from the API at most this often, in seconds.
+# Set to 0 to refresh it on every cycle.
+# Default: 300
+instance_list_refresh_interval = 300
+
+# Which instances are polled in each cycle (see scheduler.py). Instances that are not running are never polled.
+# 'poll_steady_interval': Seconds between polls of an instance whose hash rate is steady. Default: 300
+# 'poll_hot_seconds': An instance that raised an anomaly or whose hash rate changed by more than 'poll_change_tolerance'
+#                     (relative) is polled on every cycle for this many seconds. Default: 900 / 0.05
+# 'poll_backoff_base' / 'poll_backoff_max': After the n-th failed poll of an instance in a row it is left alone for
+#                                           base * 2^(n-1) seconds, at most max. Default: 30 / 600
+# 'poll_failure_threshold': Failed polls in a row after which an instance is only tried every 'poll_backoff_max'
+#                           seconds until it answers again. Default: 3
+# 'collection_deadline': Seconds the collection of a cycle may take before the table is printed with the newest data
+#                        at hand; instances still being polled then are shown with their previous values.
+#                        None: three quarters of the --watch interval, and no limit without --watch. Default: None
+poll_steady_interval = 300
+poll_hot_seconds = 900
+poll_change_tolerance = 0.05
+poll_backoff_base = 30
+poll_backoff_max = 600
+poll_failure_threshold = 3
+collection_deadline = None
+
+# With --dashboard the table is drawn as a live terminal dashboard instead of being printed on every refresh
+# (see dashboard.py). Only the cells that changed since the last refresh are redrawn; the keys are listed at the bottom.
+# 'dashboard_top_n': Rows shown in the top-N view ('t'), in the current sort order. Default: 20
+dashboard_top_n = 20
+
+####### Alerts configuration #######
+
+# Problems are sent as alerts as soon as they are seen, from a background thread that never holds up collection
+# (see alerts.py): low GPU utilization, a stalled miner.log and instances that stop answering right after their poll,
+# hash rate outliers and sustained regressions at the end of the cycle. Without a sink no alerts are raised.
+# 'alert_stdout': Print the alert digests (not with --dashboard). Default: False
+# 'alert_file': Append every alert to this file as a JSON line. Default: None
+# 'alert_webhook_url': POST the digests as JSON ({"text": ..., "alerts": [...]}), e.g. to a Slack incoming webhook. Default: None
+# 'alert_webhook_timeout': Seconds to wait for the webhook to answer. Default: 10
+# 'alert_cooldown': Seconds before the same alert of the same instance is sent again. Default: 900
+# 'alert_batch_seconds' / 'alert_max_batch': Alerts are collected into one digest for this many seconds after the
+#                                            first one, or until this many are pending. Default: 30 / 50
+alert_stdout = False
+alert_file = None
+alert_webhook_url = None
+alert_webhook_timeout = 10
+alert_cooldown = 900
+alert_batch_seconds = 30
+alert_max_batch = 50
+
+####### Sharded mode configuration #######
+
+# Several workers, as local processes or on other machines, can each poll a part of the instances of one or more
+# accounts and stream their results to one coordinator, which prints the merged table, fleet totals, per-GPU-type
+# stats and the balance and runway of every account (see shard.py):
+#   python -m check_bot coordinator --watch 60
+#   python -m check_bot collect --watch 60 --coordinator HOST:PORT --account main --shard 0/2
+# 'api_key_files': Account name -> API key file, e.g. {'main': 'api_key.txt', 'second': 'api_key_second.txt'}.
+#                  A worker started with --account NAME uses that key. Default: {}
+# 'coordinator_address' / 'coordinator_port': Where the coordinator listens and the workers connect to by default.
+#                                             Use '0.0.0.0' for workers on other machines. Default: '127.0.0.1' / 9470
+# 'shard_token': Secret the workers must send to the coordinator. Set one when it listens beyond this machine. Default: None
+api_key_files = {}
+coordinator_address = '127.0.0.1'
+coordinator_port = 9470
+shard_token = None
+
+####### Instrumentation configuration #######
+
+# Timings of every phase, SSH connect/exec latency, bytes read, parse failures and API retries are recorded
+# as Prometheus histograms and counters (see instrumentation.py). They can be exposed in two ways:
+# 'instrumentation_http_port': Serve them on http://<instrumentation_http_address>:<port>/metrics. Default: None (off)
+# 'instrumentation_http_address': Address to listen on. Default: '127.0.0.1' (this machine only)
+# 'instrumentation_textfile': Write them to this file after every cycle, e.g. for the node_exporter textfile
+#                             collector ('/var/lib/node_exporter/textfile/checkbot.prom'). Default: None (off)
+instrumentation_http_port = None
+instrumentation_http_address = '127.0.0.1'
+instrumentation_textfile = None
+
+# With collect --profile every phase of the cycles (api, ssh, parse, analytics, render, store) is profiled with cProfile
+# and its memory allocations are traced with tracemalloc until the run ends (see profiling.py). This slows collection
+# down, use it to find out where a cycle spends its time. A short report is printed and, together with a JSON file
+# that collect --profile-baseline FILE compares a later run with, written to 'profile_directory'.
+# 'profile_directory': Folder for the reports, one .txt and one .json per run. Default: 'profiles'
+# 'profile_top_n': Functions and allocation sites listed per phase. Default: 15
+profile_directory = 'profiles'
+profile_top_n = 15
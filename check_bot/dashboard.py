@@ -0,0 +1,294 @@
+"""Live terminal dashboard for watch mode (collect --dashboard).
+
+Instead of printing the whole table on every refresh, the dashboard keeps the frame it drew last: the
+text and attribute of every cell on screen. A refresh formats only the rows that fit on the screen and
+writes only the cells that differ from the last frame, so its cost depends on the screen size and on
+how much changed, not on the size of the fleet. The rows are sorted once per refresh, and only when the
+sort chosen on the dashboard differs from the one build_table_data() already applied.
+
+Views: the top N rows ('t'), rows of one GPU type ('g') or label ('l'), and outliers only ('o'): rows
+whose hash rate is below their GPU type (Z), whose GPU utilization is low (U) or that the streaming
+anomaly detectors reported (A). The flags are shown in the last column.
+"""
+import curses
+import datetime
+import time
+
+from . import config, fleet_analytics, instrumentation
+from .report import format_age, is_missing, sort_rows
+
+
+# (title, width, right aligned) of the columns of the table rows built by build_table_data()
+COLUMNS = (
+    ("Instance ID", 11, True), ("GPU Name", 14, False), ("GPU's", 5, True), ("Util.%", 6, True), ("USD/h", 7, True),
+    ("USD/GPU", 7, True), ("Inst.H/s", 9, True), ("GPU H/s", 8, True), ("XNM Blocks", 10, True), ("Runtime", 7, True),
+    ("Block/h", 7, True), ("H/s/USD", 8, True), ("USD/Block", 9, True), ("Label", 12, False),
+)
+AGE_COLUMN = ("Age", 4, True)
+FLAGS_COLUMN = ("Flags", 5, False)
+
+# Title, totals and view lines above the column titles
+HEADER_LINES = 3
+KEY_HELP = "s/S sort  r reverse  t top-N  g GPU  l label  o outliers  arrows/PgUp/PgDn scroll  q quit"
+
+
+def _cell(value, width, right):
+    text = 'N/A' if is_missing(value) else str(value)
+    if len(text) > width:
+        text = text[:width - 1] + '~'
+    return text.rjust(width) if right else text.ljust(width)
+
+
+class Dashboard:
+    """Draws the report of each cycle on a curses screen and handles the keys between cycles."""
+
+    def __init__(self, screen, top_n=20, interval=None):
+        self.screen = screen
+        self.top_n = top_n
+        self.interval = interval
+        self.sort_column = config.sort_column_index
+        self.descending = config.sort_order == 'descending'
+        self.show_top = False
+        self.gpu_filter = None
+        self.label_filter = None
+        self.outliers_only = False
+        self.scroll = 0
+
+        self.report = None
+        self.updated_at = None
+        self.rows = []   # table rows in the sort order of the dashboard
+        self.view = []   # rows that pass the filters of the current view
+        self.flags = {}  # instance_id -> flags string
+        # Screen line -> tuple of (x, text, attribute) cells, as last written
+        self._frame = {}
+
+        curses.curs_set(0)
+        self.screen.keypad(True)
+        self.flagged_attr = curses.A_BOLD
+        self.cached_attr = curses.A_DIM
+        if curses.has_colors():
+            curses.use_default_colors()
+            curses.init_pair(1, curses.COLOR_RED, -1)
+            self.flagged_attr |= curses.color_pair(1)
+
+    def update(self, report):
+        """Show the report of a new cycle (see monitor.run_cycle())."""
+        self.report = report
+        self.updated_at = datetime.datetime.now()
+        fleet_data = report['fleet']
+        self.rows = list(fleet_data['table_data'])
+        if (self.sort_column, self.descending) != (config.sort_column_index, config.sort_order == 'descending'):
+            sort_rows(self.rows, self.sort_column, self.descending)
+
+        fleet, gpu_types = fleet_data['fleet'], fleet_data['gpu_types']
+        _, _, _, z_scores = fleet_analytics.find_outliers(fleet, len(gpu_types), config.threshold,
+                                                          robust=config.outlier_statistics == 'median')
+        self.flags = {}
+        for instance_id in fleet['instance_id'][z_scores < -config.threshold].tolist():
+            self.flags[instance_id] = 'Z'
+        for instance_id in fleet['instance_id'][fleet['running'] & (fleet['gpu_util'] < 85)].tolist():
+            self.flags[instance_id] = self.flags.get(instance_id, '') + 'U'
+        for instance_id in report['anomalous']:
+            self.flags[instance_id] = self.flags.get(instance_id, '') + 'A'
+
+        self._filter()
+        self.draw()
+
+    def _filter(self):
+        view = self.rows
+        if self.gpu_filter is not None:
+            view = [row for row in view if row[1] == self.gpu_filter]
+        if self.label_filter is not None:
+            view = [row for row in view if row[13] == self.label_filter]
+        if self.outliers_only:
+            view = [row for row in view if row[0] in self.flags]
+        self.view = view[:self.top_n] if self.show_top else view
+
+    def _columns(self):
+        columns = list(COLUMNS)
+        if self.report is not None and self.report['ages']:
+            columns.append(AGE_COLUMN)
+        columns.append(FLAGS_COLUMN)
+        return columns
+
+    def _body_height(self):
+        height, _ = self.screen.getmaxyx()
+        # Header lines, column titles and the key help line
+        return max(0, height - HEADER_LINES - 2)
+
+    def _put_line(self, y, cells):
+        """Write the cells of screen line y that differ from the last frame."""
+        previous = self._frame.get(y, ())
+        if previous == cells:
+            return
+        _, width = self.screen.getmaxyx()
+        if len(previous) != len(cells) or any(old[0] != new[0] for old, new in zip(previous, cells)):
+            # A different layout, start the line over
+            self.screen.move(y, 0)
+            self.screen.clrtoeol()
+            previous = ()
+        written = 0
+        for i, (x, text, attr) in enumerate(cells):
+            if i < len(previous) and previous[i] == (x, text, attr):
+                continue
+            if x >= width:
+                break
+            try:
+                self.screen.addstr(y, x, text[:width - x], attr)
+            except curses.error:
+                # Writing the last cell of the screen moves the cursor past its end, the text is drawn anyway
+                pass
+            written += 1
+        instrumentation.DASHBOARD_CELLS_WRITTEN.inc(written)
+        self._frame[y] = cells
+
+    def _header(self):
+        if self.report is None:
+            return ["Collecting data...", "", ""]
+        fleet_data = self.report['fleet']
+        state_line = f"check_bot  {self.updated_at:%Y-%m-%d %H:%M:%S}"
+        if self.interval:
+            state_line += f"  refresh every {self.interval:g}s"
+        if self.report['balance'] is not None:
+            state_line += f"  Balance: ${self.report['balance']:.2f}"
+
+        def number(value, format_spec):
+            return format(value, format_spec) if value is not None else "N/A"
+
+        totals = (f"GPU's: {self.report['total_gpus']}, Difficulty: {number(fleet_data['mean_difficulty'], '.0f')}, "
+                  f"Total DPH: {number(self.report['total_dph'], '.4f')}$, "
+                  f"Total Hash: {number(fleet_data['total_hash_rate'], '.2f')} h/s, "
+                  f"Avg_$/Block: {number(fleet_data['average_dollars_per_normal_block'], '.4f')}$, "
+                  f"Total Blocks/h: {number(fleet_data['sum_normal_block_per_hour'], '.2f')}")
+
+        view = [f"{len(self.view)} of {len(self.rows)} rows"]
+        if self.show_top:
+            view.append(f"top {self.top_n}")
+        if self.gpu_filter is not None:
+            view.append(f"GPU {self.gpu_filter}")
+        if self.label_filter is not None:
+            view.append(f"label {self.label_filter}")
+        if self.outliers_only:
+            view.append("outliers only")
+        view.append(f"sorted by {COLUMNS[self.sort_column][0]} {'descending' if self.descending else 'ascending'}")
+        if self.view:
+            last = min(len(self.view), self.scroll + self._body_height())
+            view.append(f"showing {self.scroll + 1}-{last}")
+        return [state_line, totals, "View: " + ", ".join(view)]
+
+    def draw(self, full=False):
+        """Draw the current view. Only cells that changed since the last frame are written, unless full is True."""
+        if full:
+            self.screen.erase()
+            self._frame = {}
+        height, _ = self.screen.getmaxyx()
+        body_height = self._body_height()
+        self.scroll = max(0, min(self.scroll, len(self.view) - body_height))
+
+        for y, text in enumerate(self._header()):
+            self._put_line(y, ((0, text, curses.A_BOLD if y == 0 else curses.A_NORMAL),))
+
+        columns = self._columns()
+        positions = []
+        x = 0
+        for _, width, _ in columns:
+            positions.append(x)
+            x += width + 1
+        titles = []
+        for i, ((title, width, right), x) in enumerate(zip(columns, positions)):
+            if i == self.sort_column:
+                title = title[:width - 1] + ('v' if self.descending else '^')
+            titles.append((x, _cell(title, width, right), curses.A_REVERSE))
+        self._put_line(HEADER_LINES, tuple(titles))
+
+        ages = self.report['ages'] if self.report is not None else {}
+        first_body_line = HEADER_LINES + 1
+        # Only the rows on screen are formatted
+        for offset in range(body_height):
+            index = self.scroll + offset
+            if index >= len(self.view):
+                self._put_line(first_body_line + offset, ())
+                continue
+            row = self.view[index]
+            flags = self.flags.get(row[0], '')
+            attr = self.flagged_attr if flags else (self.cached_attr if row[0] in ages else curses.A_NORMAL)
+            values = list(row)
+            if AGE_COLUMN in columns:
+                values.append(format_age(ages[row[0]]) if row[0] in ages else '')
+            values.append(flags)
+            self._put_line(first_body_line + offset,
+                           tuple((x, _cell(value, width, right), attr) for (_, width, right), x, value in zip(columns, positions, values)))
+
+        warnings = len(self.report['warnings']) + sum(len(messages) for messages in self.report['regressions'].values()) if self.report else 0
+        footer = KEY_HELP + (f"   {warnings} warnings, see script_output.log" if warnings else "")
+        self._put_line(height - 1, ((0, footer, curses.A_REVERSE),))
+
+        self.screen.noutrefresh()
+        curses.doupdate()
+
+    def handle_key(self, key):
+        """Apply a key press. Returns False when the dashboard should close."""
+        body_height = self._body_height()
+        if key in (ord('q'), ord('Q')):
+            return False
+        if key == curses.KEY_RESIZE:
+            self.draw(full=True)
+            return True
+        if key in (curses.KEY_UP, ord('k')):
+            self.scroll -= 1
+        elif key in (curses.KEY_DOWN, ord('j')):
+            self.scroll += 1
+        elif key == curses.KEY_PPAGE:
+            self.scroll -= body_height
+        elif key in (curses.KEY_NPAGE, ord(' ')):
+            self.scroll += body_height
+        elif key == curses.KEY_HOME:
+            self.scroll = 0
+        elif key == curses.KEY_END:
+            self.scroll = len(self.view)
+        elif key in (ord('s'), ord('S'), ord('r')):
+            if key == ord('r'):
+                self.descending = not self.descending
+            else:
+                self.sort_column = (self.sort_column + (1 if key == ord('s') else -1)) % len(COLUMNS)
+            sort_rows(self.rows, self.sort_column, self.descending)
+            self._filter()
+        elif key == ord('t'):
+            self.show_top = not self.show_top
+            self._filter()
+        elif key == ord('g'):
+            self.gpu_filter = self._next_value(self.gpu_filter, 1)
+            self.scroll = 0
+            self._filter()
+        elif key == ord('l'):
+            self.label_filter = self._next_value(self.label_filter, 13)
+            self.scroll = 0
+            self._filter()
+        elif key == ord('o'):
+            self.outliers_only = not self.outliers_only
+            self.scroll = 0
+            self._filter()
+        else:
+            return True
+        self.draw()
+        return True
+
+    def _next_value(self, current, column):
+        """The value of column after current in the rows, or None (no filter) after the last one."""
+        values = sorted({row[column] for row in self.rows} - {None}, key=str)
+        if current not in values:
+            return values[0] if values and current is None else None
+        index = values.index(current) + 1
+        return values[index] if index < len(values) else None
+
+    def wait(self, seconds):
+        """Handle key presses for the given number of seconds. Returns False if the user quit."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            self.screen.timeout(max(1, int(remaining * 1000)))
+            key = self.screen.getch()
+            if key != -1 and not self.handle_key(key):
+                return False
@@ -0,0 +1,248 @@
+"""Cost efficiency of the fleet over the metrics history.
+
+The performance table shows what each instance costs and finds right now. This module answers the
+same questions over a window of the history (see MetricsStore.hourly_rollup()): what a block cost per
+GPU type and per instance, how many H/s a dollar bought, how fast the balance actually goes down, and
+which instances make blocks more expensive for the whole fleet.
+
+Every (instance, hour) of the window becomes one entry of a set of flat arrays. An hour is charged
+for the time since the previous sampled hour of the same instance (at most max_gap_hours; after a
+longer gap the tracking starts over) and is credited with the increase of the block counter since
+then, so USD/Block is total spend over total blocks instead of a mean of per-row ratios. Totals per
+instance and per GPU type are np.bincount sums over those arrays, and trailing windows are
+differences of cumulative sums, so the cost grows with the number of instance-hours, not with the
+number of questions asked.
+
+The spend rate behind the runway comes from the balance stored with each cycle: the drops of the
+balance over the time they took. Intervals in which the balance went up (a deposit) are left out.
+"""
+import datetime
+
+import numpy as np
+
+from .instances import calculate_time_covered_by_balance
+
+
+# An instance that was not sampled for longer than this starts a new stretch: the gap is not charged
+MAX_GAP_HOURS = 6
+
+COST_COLUMNS = ('hours', 'spend', 'blocks', 'hash_hours', 'gpu_hours')
+
+
+def hourly_costs(rollup, max_gap_hours=MAX_GAP_HOURS):
+    """Return the spend and blocks of every (instance, hour) of a rollup, ordered by instance and hour.
+
+    The result has the keys of the rollup plus hours (time charged to the hour), spend (USD), blocks,
+    hash_hours (H/s times hours) and gpu_hours.
+    """
+    # The rollup is ordered by instance and hour within each day, a stable sort by instance merges the days
+    order = np.argsort(rollup['instance_id'], kind='stable')
+    costs = {name: values[order] for name, values in rollup.items() if name not in ('balance_ts', 'balance')}
+    instance_ids, hours, blocks = costs['instance_id'], costs['hour'], costs['normal_blocks']
+
+    continued = np.zeros(instance_ids.size, dtype=bool)
+    elapsed = np.zeros(instance_ids.size)
+    continued[1:] = instance_ids[1:] == instance_ids[:-1]
+    elapsed[1:] = (hours[1:] - hours[:-1]) / 3600
+    continued &= elapsed <= max_gap_hours
+    costs['hours'] = np.where(continued, elapsed, 0.0)
+
+    previous_blocks = np.full(instance_ids.size, np.nan)
+    previous_blocks[1:] = blocks[:-1]
+    with np.errstate(invalid='ignore'):
+        found = blocks - previous_blocks
+        # A counter that went down belongs to a restarted miner: everything it counted since is new
+        found = np.where(found < 0, blocks, found)
+    costs['blocks'] = np.where(continued & ~np.isnan(found), found, 0.0)
+    costs['spend'] = np.nan_to_num(costs['dph_total']) * costs['hours']
+    costs['hash_hours'] = np.nan_to_num(costs['hash_rate']) * costs['hours']
+    costs['gpu_hours'] = np.nan_to_num(costs['num_gpus']) * costs['hours']
+    return costs
+
+
+def group_totals(costs, groups, num_groups):
+    """Sum the cost columns per group and derive the efficiency figures.
+
+    Returns a dict of arrays indexed by group: the COST_COLUMNS sums, usd_per_block, hash_rate_per_usd
+    (mean H/s per USD/h), blocks_per_hour and blocks_per_gpu_hour. Ratios with a zero denominator are
+    NaN, except usd_per_block which is inf for spend without blocks.
+    """
+    totals = {name: np.bincount(groups, weights=costs[name], minlength=num_groups) for name in COST_COLUMNS}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        totals['usd_per_block'] = np.where(totals['spend'] > 0, totals['spend'] / totals['blocks'], np.nan)
+        totals['hash_rate_per_usd'] = np.where(totals['spend'] > 0, totals['hash_hours'] / totals['spend'], np.nan)
+        totals['blocks_per_hour'] = np.where(totals['hours'] > 0, totals['blocks'] / totals['hours'], np.nan)
+        totals['blocks_per_gpu_hour'] = np.where(totals['gpu_hours'] > 0, totals['blocks'] / totals['gpu_hours'], np.nan)
+    return totals
+
+
+def rolling_usd_per_block(costs, groups, num_groups, window_hours):
+    """Return (hour_starts, usd_per_block) with the USD/Block of each group over the window_hours ending with each hour.
+
+    usd_per_block has one row per group and one column per hour from the first to the last hour of costs.
+    """
+    if not costs['hour'].size:
+        return np.zeros(0, dtype=np.int64), np.zeros((num_groups, 0))
+    first_hour = int(costs['hour'].min())
+    num_hours = (int(costs['hour'].max()) - first_hour) // 3600 + 1
+    cells = groups * num_hours + (costs['hour'] - first_hour) // 3600
+    cumulative = {}
+    for name in ('spend', 'blocks'):
+        per_hour = np.bincount(cells, weights=costs[name], minlength=num_groups * num_hours).reshape(num_groups, num_hours)
+        cumulative[name] = np.concatenate((np.zeros((num_groups, 1)), np.cumsum(per_hour, axis=1)), axis=1)
+    ends = np.arange(1, num_hours + 1)
+    starts = np.maximum(ends - int(window_hours), 0)
+    spend = cumulative['spend'][:, ends] - cumulative['spend'][:, starts]
+    blocks = cumulative['blocks'][:, ends] - cumulative['blocks'][:, starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        usd_per_block = np.where(spend > 0, spend / blocks, np.nan)
+    return first_hour + 3600 * np.arange(num_hours, dtype=np.int64), usd_per_block
+
+
+def burn_rate(timestamps, balances):
+    """Return (usd_per_hour, hours_observed, deposits) from the balance stored with each cycle.
+
+    usd_per_hour is None when the balance never went down.
+    """
+    drops = balances[:-1] - balances[1:]
+    elapsed = np.diff(timestamps) / 3600
+    spending = drops >= 0
+    hours_observed = float(elapsed[spending].sum())
+    deposits = float(-drops[~spending].sum())
+    if hours_observed <= 0 or drops[spending].sum() <= 0:
+        return None, hours_observed, deposits
+    return float(drops[spending].sum()) / hours_observed, hours_observed, deposits
+
+
+def rank_instances(totals, active):
+    """Rank the active instances by their marginal cost per block, most expensive first.
+
+    Removing an instance saves its spend and loses its blocks. Returns a dict with order (indices into
+    totals), the fleet USD/Block without each ranked instance (without_instance), the fleet USD/Block after
+    removing the first k ranked instances (after_removing, k = 1..n), and excess_per_hour: what the
+    instance costs per hour beyond what its blocks would cost at the fleet USD/Block.
+    """
+    candidates = np.flatnonzero(active & (totals['spend'] > 0))
+    spend, blocks, hours = totals['spend'][candidates], totals['blocks'][candidates], totals['hours'][candidates]
+    fleet_spend, fleet_blocks = spend.sum(), blocks.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        marginal = np.where(blocks > 0, spend / blocks, np.inf)
+        # Instances without blocks first, the more they spent the higher
+        order = np.lexsort((-spend, -marginal))
+        spend, blocks, hours = spend[order], blocks[order], hours[order]
+        fleet_usd_per_block = fleet_spend / fleet_blocks if fleet_blocks > 0 else np.nan
+        without_instance = (fleet_spend - spend) / (fleet_blocks - blocks)
+        after_removing = (fleet_spend - np.cumsum(spend)) / (fleet_blocks - np.cumsum(blocks))
+        excess_per_hour = (spend - blocks * fleet_usd_per_block) / hours
+    return {'order': candidates[order], 'without_instance': without_instance, 'after_removing': after_removing,
+            'excess_per_hour': excess_per_hour, 'fleet_usd_per_block': fleet_usd_per_block}
+
+
+def analyze(rollup, balance_timestamps, balances, recent_hours=24, max_gap_hours=MAX_GAP_HOURS):
+    """Return the cost efficiency of a window of history.
+
+    rollup comes from MetricsStore.hourly_rollup(), balance_timestamps and balances from
+    MetricsStore.balance_history() over the same window. Instances sampled within the last
+    max_gap_hours of the window count as active; recent_hours is the trailing window of the
+    recent_usd_per_block figures.
+    """
+    costs = hourly_costs(rollup, max_gap_hours)
+    instance_ids = costs['instance_id']
+    # The costs are ordered by instance, so each instance is one run of entries
+    new_instance = np.ones(instance_ids.size, dtype=bool)
+    new_instance[1:] = instance_ids[1:] != instance_ids[:-1]
+    starts = np.flatnonzero(new_instance)
+    ends = np.append(starts[1:], instance_ids.size) - 1
+    instance_index = np.cumsum(new_instance) - 1
+    # GPU name and label of the last sampled hour of each instance
+    gpu_names = costs['gpu_name'][ends].astype(str)
+    gpu_types, instance_type = np.unique(gpu_names, return_inverse=True)
+
+    instances = group_totals(costs, instance_index, starts.size)
+    instances['instance_id'] = instance_ids[starts]
+    instances['gpu_type'] = instance_type
+    instances['label'] = costs['label'][ends]
+    last_hour = int(costs['hour'].max()) if costs['hour'].size else 0
+    instances['active'] = costs['hour'][ends] >= last_hour - max_gap_hours * 3600
+
+    entry_type = instance_type[instance_index]
+    by_type = group_totals(costs, entry_type, gpu_types.size)
+    by_type['instances'] = np.bincount(instance_type, minlength=gpu_types.size)
+    fleet = {name: float(values[0]) for name, values in group_totals(costs, np.zeros(instance_ids.size, dtype=np.int64), 1).items()}
+
+    hour_starts, rolling = rolling_usd_per_block(costs, entry_type, gpu_types.size, recent_hours)
+    by_type['recent_usd_per_block'] = rolling[:, -1] if hour_starts.size else np.full(gpu_types.size, np.nan)
+    _, fleet_rolling = rolling_usd_per_block(costs, np.zeros(instance_ids.size, dtype=np.int64), 1, recent_hours)
+    fleet['recent_usd_per_block'] = float(fleet_rolling[0, -1]) if hour_starts.size else np.nan
+    # Every hour is charged for the time since the one before, so the spend covers the time from the first to the last hour
+    span_hours = (last_hour - int(costs['hour'].min())) / 3600 if costs['hour'].size else 0
+    # Spend per hour at the listed prices, for comparison with what the balance shows
+    fleet['listed_spend_per_hour'] = fleet['spend'] / span_hours if span_hours else np.nan
+    fleet['span_hours'] = span_hours
+
+    usd_per_hour, hours_observed, deposits = burn_rate(balance_timestamps, balances)
+    balance = float(balances[-1]) if balances.size else None
+    runway = {'balance': balance, 'balance_at': int(balance_timestamps[-1]) if balances.size else None, 'usd_per_hour': usd_per_hour,
+              'hours_observed': hours_observed, 'deposits': deposits,
+              'runway_hours': balance / usd_per_hour if usd_per_hour and balance is not None else None}
+
+    return {'fleet': fleet, 'gpu_types': gpu_types, 'by_type': by_type, 'instances': instances,
+            'ranking': rank_instances(instances, instances['active']), 'runway': runway}
+
+
+def _figure(value, format_spec):
+    if value is None or value != value:
+        return 'N/A'
+    if value == np.inf:
+        return 'no blocks'
+    return format(value, format_spec)
+
+
+# Function to print the result of analyze()
+def print_efficiency(result, hours, recent_hours=24, top=10):
+    fleet, runway = result['fleet'], result['runway']
+    print(f"Cost efficiency over the last {hours:g} hours ({result['instances']['instance_id'].size} instances, "
+          f"{fleet['hours']:.0f} instance-hours charged)")
+    print(f"Fleet: spend ${fleet['spend']:.2f}, {fleet['blocks']:.0f} blocks, USD/Block {_figure(fleet['usd_per_block'], '.4f')} "
+          f"(last {recent_hours:g}h: {_figure(fleet['recent_usd_per_block'], '.4f')}), "
+          f"H/s per USD/h {_figure(fleet['hash_rate_per_usd'], '.2f')}, Blocks/GPU-h {_figure(fleet['blocks_per_gpu_hour'], '.4f')}")
+
+    if runway['balance'] is not None:
+        line = f"Balance: ${runway['balance']:.2f} as of {datetime.datetime.fromtimestamp(runway['balance_at']):%Y-%m-%d %H:%M}"
+        if runway['usd_per_hour']:
+            line += (f", observed spend ${runway['usd_per_hour']:.4f}/h (${runway['usd_per_hour'] * 24:.2f}/day over "
+                     f"{runway['hours_observed']:.1f} hours)")
+            if fleet['listed_spend_per_hour'] > 0:
+                line += f", {runway['usd_per_hour'] / fleet['listed_spend_per_hour'] - 1:+.1%} over the listed DPH of the polled instances"
+            if runway['balance'] > 0:
+                days, hours_left, minutes = calculate_time_covered_by_balance(runway['balance'], runway['usd_per_hour'], fee=0)
+                line += f". Lasts approximately {days} days, {hours_left} hours and {minutes} minutes"
+        else:
+            line += ", no spending observed yet"
+        if runway['deposits'] > 0:
+            line += f" (deposits of ${runway['deposits']:.2f} left out)"
+        print(line)
+
+    by_type = result['by_type']
+    print()
+    print(f"{'GPU Name':<16} {'Inst.':>5} {'GPU-h':>9} {'Spend $':>10} {'Blocks':>9} {'USD/Block':>10} {f'last {recent_hours:g}h':>10} "
+          f"{'H/s/USD':>9} {'Blk/GPU-h':>9}")
+    for index in np.argsort(by_type['usd_per_block']):
+        print(f"{result['gpu_types'][index]:<16} {by_type['instances'][index]:>5} {by_type['gpu_hours'][index]:>9.1f} "
+              f"{by_type['spend'][index]:>10.2f} {by_type['blocks'][index]:>9.0f} {_figure(by_type['usd_per_block'][index], '.4f'):>10} "
+              f"{_figure(by_type['recent_usd_per_block'][index], '.4f'):>10} {_figure(by_type['hash_rate_per_usd'][index], '.2f'):>9} "
+              f"{_figure(by_type['blocks_per_gpu_hour'][index], '.4f'):>9}")
+
+    ranking, instances = result['ranking'], result['instances']
+    if not ranking['order'].size:
+        return
+    print()
+    print(f"Most expensive blocks among the active instances (fleet USD/Block {_figure(ranking['fleet_usd_per_block'], '.4f')}):")
+    print(f"{'Instance ID':>11} {'GPU Name':<16} {'USD/h':>7} {'Blocks/h':>8} {'USD/Block':>10} {'Fleet w/o':>10} {'Excess $/h':>10} "
+          f"{'Fleet after':>11}  Label")
+    for rank, index in enumerate(ranking['order'][:top].tolist()):
+        usd_per_hour = instances['spend'][index] / instances['hours'][index]
+        print(f"{instances['instance_id'][index]:>11} {result['gpu_types'][instances['gpu_type'][index]]:<16} {usd_per_hour:>7.4f} "
+              f"{_figure(instances['blocks_per_hour'][index], '.2f'):>8} {_figure(instances['usd_per_block'][index], '.4f'):>10} "
+              f"{_figure(ranking['without_instance'][rank], '.4f'):>10} {_figure(ranking['excess_per_hour'][rank], '.4f'):>10} "
+              f"{_figure(ranking['after_removing'][rank], '.4f'):>11}  {instances['label'][index] or ''}")
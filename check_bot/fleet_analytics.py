@@ -0,0 +1,292 @@
+"""Vectorized fleet analytics.
+
+The state of every instance in a cycle is held in one NumPy structured array (FLEET_DTYPE), with
+GPU types encoded as small integers. Derived table columns and per-GPU-type statistics are computed
+with whole-array operations and np.bincount instead of Python loops over instances, so a cycle stays
+fast with tens of thousands of instances. Missing values are NaN.
+
+In watch mode a FleetState keeps that array across cycles and updates it in place as instance lists
+and poll results arrive, instead of building a new one every cycle.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+FLEET_DTYPE = np.dtype([
+    ('instance_id', np.int64),
+    ('gpu_type', np.int32),          # index into the list of GPU type names
+    ('running', np.bool_),
+    ('parsed', np.bool_),            # True if the miner log of the instance could be read and parsed
+    ('num_gpus', np.float64),
+    ('gpu_util', np.float64),        # measured on the host where available, otherwise listed_gpu_util
+    ('listed_gpu_util', np.float64), # from the instance list
+    ('dph_total', np.float64),
+    ('runtime_hours', np.float64),
+    ('normal_blocks', np.float64),
+    ('hash_rate', np.float64),
+    ('difficulty', np.float64),
+    ('window_blocks_per_hour', np.float64),
+    ('read_at', np.float64),         # Unix time the log values were read
+    # Derived columns, filled in by derive_columns()
+    ('usd_per_gpu', np.float64),
+    ('hash_rate_per_gpu', np.float64),
+    ('normal_block_per_hour', np.float64),
+    ('hash_rate_per_usd', np.float64),
+    ('dollars_per_normal_block', np.float64),
+])
+
+# Scales the median absolute deviation so that it estimates the standard deviation of normally distributed data
+MAD_TO_STD = 1.4826
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def build_fleet(ssh_info_list, log_info_list, log_tails=None):
+    """Return (fleet, gpu_types, labels) for one cycle.
+
+    fleet is a FLEET_DTYPE array with one element per instance in ssh_info_list, gpu_types the list of GPU
+    type names that fleet['gpu_type'] indexes into, and labels the instance labels in fleet order. When a
+    LogTail has rates over its window, they replace the cumulative hash rate and Block/h of that instance,
+    and GPU utilization measured on the host replaces the one from the instance list.
+    """
+    fleet = np.zeros(len(ssh_info_list), dtype=FLEET_DTYPE)
+    gpu_type_codes = {}
+    columns = {name: [] for name in ('instance_id', 'gpu_type', 'running', 'parsed', 'num_gpus', 'gpu_util', 'listed_gpu_util', 'dph_total',
+                                     'runtime_hours', 'normal_blocks', 'hash_rate', 'difficulty', 'window_blocks_per_hour')}
+    labels = []
+    for ssh_info, log_info in zip(ssh_info_list, log_info_list):
+        hours, minutes, seconds, _, normal_blocks, xuni_blocks, hash_rate, difficulty = log_info
+        parsed = normal_blocks is not None and xuni_blocks is not None
+        log_tail = log_tails.get(ssh_info['instance_id']) if log_tails else None
+        window_rates = log_tail.rates() if parsed and log_tail is not None else None
+        measured_gpu_util = log_tail.gpu_util() if log_tail is not None else None
+        columns['instance_id'].append(ssh_info['instance_id'])
+        columns['gpu_type'].append(gpu_type_codes.setdefault(ssh_info['gpu_name'], len(gpu_type_codes)))
+        columns['running'].append(str(ssh_info['actual_status']).lower() == 'running')
+        columns['parsed'].append(parsed)
+        columns['num_gpus'].append(_float(ssh_info['num_gpus']))
+        columns['gpu_util'].append(measured_gpu_util if measured_gpu_util is not None else _float(ssh_info['gpu_util']))
+        columns['listed_gpu_util'].append(_float(ssh_info['gpu_util']))
+        columns['dph_total'].append(_float(ssh_info['dph_total']))
+        columns['runtime_hours'].append(hours + minutes / 60 + seconds / 3600 if parsed else np.nan)
+        columns['normal_blocks'].append(normal_blocks if parsed else np.nan)
+        columns['hash_rate'].append(_float(window_rates[0] if window_rates is not None else hash_rate))
+        columns['difficulty'].append(_float(difficulty))
+        columns['window_blocks_per_hour'].append(window_rates[1] if window_rates is not None else np.nan)
+        labels.append(ssh_info['label'] if ssh_info['label'] is not None else '')
+    for name, values in columns.items():
+        fleet[name] = values
+    fleet['read_at'] = np.nan
+    return fleet, list(gpu_type_codes), labels
+
+
+# Columns that come from the miner log, NaN until an instance's log has been read
+LOG_COLUMNS = ('runtime_hours', 'normal_blocks', 'hash_rate', 'difficulty', 'window_blocks_per_hour', 'read_at')
+
+
+class FleetState:
+    """The fleet array of watch mode, kept across cycles and updated in place.
+
+    Every instance of the instance list owns one slot of a preallocated FLEET_DTYPE array. The instance
+    list columns are written when the list is refreshed and the log columns when a poll of the instance
+    answers, so a failed or skipped poll keeps the last good values (with the time they were read in
+    read_at). When an instance leaves, the last slot moves into its place, so the instances always occupy
+    the first len(self) slots. The array doubles when it is full. With a steady fleet nothing is
+    allocated per poll or cycle apart from the derived columns.
+
+    set_log_info() is called from the collection threads; snapshot() copies the instances into a second
+    preallocated array under the same lock, so a cycle works on consistent values while late polls go on.
+    """
+
+    def __init__(self, capacity=1024):
+        self._array = np.zeros(capacity, dtype=FLEET_DTYPE)
+        self._snapshot = np.zeros(capacity, dtype=FLEET_DTYPE)
+        # Writing through a view of each column is much faster than through a record of the array
+        self._columns = {name: self._array[name] for name in FLEET_DTYPE.names}
+        self._size = 0
+        self.slots = {}       # instance_id -> slot
+        self.labels = []      # label of the instance in each slot
+        self.gpu_types = []   # GPU type names, indexed by the gpu_type column
+        self._gpu_type_codes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        array = np.zeros(len(self._array) * 2, dtype=FLEET_DTYPE)
+        array[:self._size] = self._array[:self._size]
+        self._array = array
+        self._snapshot = np.zeros(len(array), dtype=FLEET_DTYPE)
+        self._columns = {name: array[name] for name in FLEET_DTYPE.names}
+
+    def _remove(self, slot):
+        last = self._size - 1
+        if slot != last:
+            self._array[slot] = self._array[last]
+            self.labels[slot] = self.labels[last]
+            self.slots[int(self._columns['instance_id'][slot])] = slot
+        self.labels.pop()
+        self._size = last
+
+    def set_instances(self, ssh_info_list):
+        """Write the instance list. Instances that are not in it anymore lose their slot."""
+        current = {ssh_info['instance_id'] for ssh_info in ssh_info_list}
+        with self._lock:
+            for instance_id in [instance_id for instance_id in self.slots if instance_id not in current]:
+                self._remove(self.slots.pop(instance_id))
+            for ssh_info in ssh_info_list:
+                slot = self.slots.get(ssh_info['instance_id'])
+                if slot is None:
+                    if self._size == len(self._array):
+                        self._grow()
+                    slot = self.slots[ssh_info['instance_id']] = self._size
+                    self._size += 1
+                    self.labels.append('')
+                    self._array[slot] = 0
+                    self._columns['gpu_util'][slot] = np.nan
+                    for name in LOG_COLUMNS:
+                        self._columns[name][slot] = np.nan
+                columns = self._columns
+                gpu_name = ssh_info['gpu_name']
+                gpu_code = self._gpu_type_codes.get(gpu_name)
+                if gpu_code is None:
+                    gpu_code = self._gpu_type_codes[gpu_name] = len(self.gpu_types)
+                    self.gpu_types.append(gpu_name)
+                columns['instance_id'][slot] = ssh_info['instance_id']
+                columns['gpu_type'][slot] = gpu_code
+                columns['running'][slot] = str(ssh_info['actual_status']).lower() == 'running'
+                columns['num_gpus'][slot] = _float(ssh_info['num_gpus'])
+                columns['dph_total'][slot] = _float(ssh_info['dph_total'])
+                listed_gpu_util = _float(ssh_info['gpu_util'])
+                # GPU utilization measured on the host stays until the next poll
+                gpu_util = columns['gpu_util'][slot]
+                if gpu_util != gpu_util or gpu_util == columns['listed_gpu_util'][slot]:
+                    columns['gpu_util'][slot] = listed_gpu_util
+                columns['listed_gpu_util'][slot] = listed_gpu_util
+                self.labels[slot] = ssh_info['label'] if ssh_info['label'] is not None else ''
+
+    def set_log_info(self, instance_id, log_info, log_tail=None, read_at=None):
+        """Write the log values of one poll. Polls that failed or found no 'Mining:' line change nothing."""
+        hours, minutes, seconds, _, normal_blocks, xuni_blocks, hash_rate, difficulty = log_info
+        if normal_blocks is None or xuni_blocks is None:
+            return
+        window_rates = log_tail.rates() if log_tail is not None else None
+        measured_gpu_util = log_tail.gpu_util() if log_tail is not None else None
+        with self._lock:
+            slot = self.slots.get(instance_id)
+            if slot is None:
+                return
+            columns = self._columns
+            columns['parsed'][slot] = True
+            columns['runtime_hours'][slot] = hours + minutes / 60 + seconds / 3600
+            columns['normal_blocks'][slot] = normal_blocks
+            columns['hash_rate'][slot] = _float(window_rates[0] if window_rates is not None else hash_rate)
+            columns['difficulty'][slot] = _float(difficulty)
+            columns['window_blocks_per_hour'][slot] = window_rates[1] if window_rates is not None else np.nan
+            columns['gpu_util'][slot] = measured_gpu_util if measured_gpu_util is not None else columns['listed_gpu_util'][slot]
+            columns['read_at'][slot] = time.time() if read_at is None else read_at
+
+    def clear_log_info(self, instance_ids):
+        """Forget the log values of these instances, e.g. once they are too old to show."""
+        with self._lock:
+            for instance_id in instance_ids:
+                slot = self.slots.get(instance_id)
+                if slot is None:
+                    continue
+                self._columns['parsed'][slot] = False
+                for name in LOG_COLUMNS:
+                    self._columns[name][slot] = np.nan
+
+    def snapshot(self):
+        """Return (fleet, gpu_types, labels) as of now. fleet is a view of the second array, valid until the next call."""
+        with self._lock:
+            fleet = self._snapshot[:self._size]
+            fleet[...] = self._array[:self._size]
+            return fleet, list(self.gpu_types), list(self.labels)
+
+
+def derive_columns(fleet):
+    """Fill in the derived columns of fleet in place."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fleet['usd_per_gpu'] = fleet['dph_total'] / fleet['num_gpus']
+        fleet['hash_rate_per_usd'] = fleet['hash_rate'] / fleet['dph_total']
+        # Instances that report no hash rate are left out of the per-GPU statistics
+        fleet['hash_rate_per_gpu'] = np.where(fleet['hash_rate'] > 0, fleet['hash_rate'] / fleet['num_gpus'], np.nan)
+
+        # Block/h over the rate window where available, otherwise over the whole runtime (0 without runtime)
+        cumulative = np.where(fleet['runtime_hours'] > 0, fleet['normal_blocks'] / fleet['runtime_hours'], 0.0)
+        block_per_hour = np.where(np.isnan(fleet['window_blocks_per_hour']), cumulative, fleet['window_blocks_per_hour'])
+        fleet['normal_block_per_hour'] = np.where(fleet['parsed'], block_per_hour, np.nan)
+
+        # $/Block is 0 for instances that found no blocks
+        fleet['dollars_per_normal_block'] = np.where(fleet['normal_block_per_hour'] > 0,
+                                                     fleet['dph_total'] / fleet['normal_block_per_hour'],
+                                                     np.where(fleet['parsed'], 0.0, np.nan))
+    return fleet
+
+
+def _group_medians(values, groups, num_groups):
+    """Median of values per group, NaN for empty groups. values must not contain NaN."""
+    counts = np.bincount(groups, minlength=num_groups)
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(num_groups, np.nan)
+    present = counts > 0
+    lower = starts[present] + (counts[present] - 1) // 2
+    upper = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[lower] + sorted_values[upper]) / 2
+    return medians
+
+
+def group_stats(values, groups, num_groups, robust=False):
+    """Return (center, spread, counts) of values per group, ignoring NaN values.
+
+    center and spread are the mean and sample standard deviation, or with robust=True the median and
+    the scaled median absolute deviation. Both are NaN for groups with fewer than two values.
+    """
+    valid = ~np.isnan(values)
+    values = values[valid]
+    groups = groups[valid]
+    counts = np.bincount(groups, minlength=num_groups)
+    center = np.full(num_groups, np.nan)
+    spread = np.full(num_groups, np.nan)
+    enough = counts > 1
+    if robust:
+        medians = _group_medians(values, groups, num_groups)
+        mad = _group_medians(np.abs(values - medians[groups]), groups, num_groups)
+        center[enough] = medians[enough]
+        spread[enough] = MAD_TO_STD * mad[enough]
+    else:
+        sums = np.bincount(groups, weights=values, minlength=num_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / counts
+            squared_deviations = np.bincount(groups, weights=(values - means[groups]) ** 2, minlength=num_groups)
+            center[enough] = means[enough]
+            spread[enough] = np.sqrt(squared_deviations[enough] / (counts[enough] - 1))  # ddof=1
+    return center, spread, counts
+
+
+def z_scores(values, groups, center, spread):
+    """Distance of every value from the center of its group in units of the group spread (NaN if undefined)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(spread[groups] > 0, (values - center[groups]) / spread[groups], np.nan)
+
+
+def find_outliers(fleet, num_types, threshold, robust=False):
+    """Compare per-GPU hash rates within each GPU type.
+
+    Returns (center, spread, counts, z) where the first three are indexed by GPU type and z holds the
+    z-score of every instance in fleet. Instances with z < -threshold perform below their group.
+    """
+    center, spread, counts = group_stats(fleet['hash_rate_per_gpu'], fleet['gpu_type'], num_types, robust=robust)
+    z = z_scores(fleet['hash_rate_per_gpu'], fleet['gpu_type'], center, spread)
+    return center, spread, counts, z
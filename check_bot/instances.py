@@ -0,0 +1,161 @@
+"""Vast.ai instance list and account balance."""
+import logging
+
+import requests
+
+from . import instrumentation, profiling
+from .vast_api import VastApiError
+
+
+def test_api_connection(api_client):
+    """Function to test the API connection."""
+    try:
+        api_client.test_connection()
+        logging.info("Connection with API established and working fine.")
+    except VastApiError as e:
+        logging.error(f"Error connecting to API. Status code: {e.status_code}. Response: {e.text}")
+    except Exception as e:
+        logging.error(f"Error connecting to API: {e}")
+
+# Function to convert a numeric field of the API response, 0 when it is missing or null
+def number(value, convert=float):
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return convert(0)
+
+def instance_list(api_client):
+    """Function to list instances and get SSH information."""
+    ssh_info_list = []
+    total_dph_running_machines = 0  # Initialized at the start
+    total_gpus_running = 0  # Counter for total GPUs of running instances
+
+    # The client retries 429s, server errors and network errors with backoff
+    try:
+        response_json = api_client.instances()
+    except VastApiError as e:
+        if e.status_code == 401:
+            # Handle Unauthorized error
+            logging.error("Failed to retrieve instances. Status code: 401. Response: %s", e.text)
+            logging.error("This action requires a valid login. Please make sure that api_key.txt contains the correct API key and that the key is the only thing the file contains.")
+        else:
+            logging.error("Failed to retrieve instances. Status code: %s. Response: %s", e.status_code, e.text)
+        return ssh_info_list, total_dph_running_machines, total_gpus_running
+    except requests.exceptions.RequestException as e:
+        logging.error("A requests exception occurred: %s", str(e))
+        return ssh_info_list, total_dph_running_machines, total_gpus_running
+    except Exception as e:
+        logging.error("An unexpected error occurred: %s", str(e))
+        return ssh_info_list, total_dph_running_machines, total_gpus_running
+
+    if 'instances' not in response_json:
+        logging.error("'instances' key not found in response. Please check the API documentation for the correct structure.")
+        return ssh_info_list, total_dph_running_machines, total_gpus_running
+    instances = response_json['instances']
+    logging.info("Your Instances:")
+
+    for instance in instances:
+        try:
+            # Instance IDs are numbers everywhere downstream: the fleet array, shards and the metrics history
+            try:
+                instance_id = int(instance['id'])
+            except (KeyError, TypeError, ValueError):
+                logging.error("Skipping an instance without a numeric ID: %r", instance)
+                continue
+            gpu_name = instance.get('gpu_name', 'N/A')
+            dph_total = instance.get('dph_total', 'N/A')
+            ssh_host = instance.get('ssh_host', 'N/A')
+            ssh_port = instance.get('ssh_port', 'N/A')
+            num_gpus = instance.get('num_gpus', 'N/A')
+            gpu_util = instance.get('gpu_util', 'N/A')
+            label = instance.get('label', 'N/A')
+            actual_status = instance.get('actual_status', 'N/A')
+            if str(actual_status or '').lower() == 'running':
+                total_dph_running_machines += number(dph_total)
+                total_gpus_running += number(num_gpus, int)
+        except Exception as e:
+            # One malformed entry must not cost the whole list
+            logging.error("Skipping an instance that could not be parsed: %s (%r)", e, instance)
+            continue
+
+        logging.info(f"Instance ID: {instance_id}")
+        logging.info(f"GPU Name: {gpu_name}")
+        logging.info(f"Dollars Per Hour (DPH): {dph_total}")
+        logging.info(f"SSH Command: ssh -p {ssh_port} root@{ssh_host} -L 8080:localhost:8080")
+        logging.info(f"Number of GPUs: {num_gpus}")
+        logging.info(f"Current state: {actual_status}")
+        logging.info("-" * 30)
+
+        ssh_info = {
+            'instance_id': instance_id,
+            'gpu_name': gpu_name,
+            'dph_total': dph_total,
+            'ssh_host': ssh_host,
+            'ssh_port': ssh_port,
+            'num_gpus': num_gpus,
+            'gpu_util': gpu_util,
+            'actual_status': actual_status,
+            'label': label
+        }
+        ssh_info_list.append(ssh_info)
+
+    return ssh_info_list, total_dph_running_machines, total_gpus_running
+
+
+# Function to calculate time covered by balance. fee is added to the spend rate, pass 0 for a rate that already includes it
+def calculate_time_covered_by_balance(balance, total_dph, fee=0.01):
+    # Calculate the total daily cost by multiplying the hourly cost by 24
+    daily_cost = total_dph * 24
+    # Add a 1% fee disk space cost to the total daily cost
+    daily_cost_with_fee = daily_cost * (1 + fee)
+    # Calculate the number of days the balance will last
+    days_covered = balance / daily_cost_with_fee
+    # Extract the whole days
+    whole_days = int(days_covered)
+    # Calculate the remaining hours after whole days
+    remaining_hours = (days_covered - whole_days) * 24
+    # Extract the whole hours
+    whole_hours = int(remaining_hours)
+    # Calculate the remaining minutes after whole hours
+    remaining_minutes = (remaining_hours - whole_hours) * 60
+    # Extract the whole minutes
+    whole_minutes = int(remaining_minutes)
+
+    return whole_days, whole_hours, whole_minutes
+
+# Function to fetch the Vast.ai balance, returns the balance or None
+def get_vastai_balance(api_client):
+    try:
+        with instrumentation.PHASE_SECONDS.labels('balance').time(), profiling.phase('api'):
+            data = api_client.current_user()
+    except VastApiError as e:
+        logging.error(f"Failed to retrieve balance: {e.status_code}")
+        return None
+    except Exception as e:
+        logging.error(f"Failed to retrieve balance: {e}")
+        return None
+    balance = data.get('credit', None)
+    return float(balance) if balance is not None else None  # Ensure the balance is a float
+
+# Function to print the Vast.ai balance and how long it lasts at the current spend rate
+def print_vastai_balance(balance, total_dph_running_machines):
+    if balance is None:
+        print("Balance information was not available in the response.")
+        return
+    hourly_cost = total_dph_running_machines
+    daily_cost = hourly_cost * 24
+    daily_cost_with_fee = daily_cost * 1.01  
+    # Display the balance and estimated spend rate
+    print(f"Your Vast.ai balance is: ${balance:.2f}")
+    print(f"Your estimated spend rate: ${daily_cost_with_fee:.2f}/day")
+    if hourly_cost <= 0:
+        return
+    # Calculate the time covered by balance
+    days, hours, minutes = calculate_time_covered_by_balance(balance, hourly_cost)
+    print(f"Your balance with current total DPH value will last for approximately {days} days, {hours} hours, and {minutes} minutes.")
+
+# Function to check Vast.ai balance, returns the balance or None
+def check_vastai_balance(api_client, total_dph_running_machines):
+    balance = get_vastai_balance(api_client)
+    print_vastai_balance(balance, total_dph_running_machines)
+    return balance
@@ -0,0 +1,270 @@
+"""Counters, gauges and latency histograms for the collection hot paths.
+
+Metrics are kept in process and rendered in the Prometheus text exposition format, either served on a
+local /metrics HTTP endpoint or written to a file for the node_exporter textfile collector. Recording a
+value costs a dictionary lookup, a bisect over the bucket bounds and an uncontended lock, so the
+instrumentation stays on; the exporters are optional.
+
+Label values are kept to small fixed sets (phases, endpoints, error kinds). Per-host measurements go
+into fleet-wide histograms so the number of series does not grow with the fleet.
+"""
+import bisect
+import contextlib
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+
+# Seconds, from a fast parse of a few new log lines up to a slow SSH handshake or a whole cycle
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Bytes read per poll, from an idle log to log_max_bytes_per_poll
+BYTES_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _label_string(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Registry:
+    """The metrics rendered together by exposition()."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def exposition(self):
+        """Return all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = None
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, *values):
+        """Return the child metric for one combination of label values."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count. Name it with a _total suffix."""
+
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def get(self):
+        return self._default.value
+
+    def samples(self):
+        return [f"{self.name}{_label_string(self.labelnames, values)} {_format_value(child.value)}" for values, child in self._items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type = 'gauge'
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'bucket_counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observe the duration of the with block in seconds, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        lines = []
+        for values, child in self._items():
+            with child._lock:
+                bucket_counts, total, count = list(child.bucket_counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_label_string(self.labelnames, values, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_string(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_string(self.labelnames, values)} {count}")
+        return lines
+
+
+# Metrics recorded by the collector, the SSH pool and the API client
+
+PHASE_SECONDS = Histogram('checkbot_phase_duration_seconds', "Duration of the phases of a collection cycle.", ['phase'])
+LAST_CYCLE_TIMESTAMP = Gauge('checkbot_last_cycle_timestamp_seconds', "Unix time at which the last collection cycle finished.")
+INSTANCES = Gauge('checkbot_instances', "Instances in the last instance list.")
+
+API_REQUEST_SECONDS = Histogram('checkbot_api_request_duration_seconds', "Duration of single Vast.ai API requests, per endpoint.", ['endpoint'])
+API_RETRIES = Counter('checkbot_api_retries_total', "Vast.ai API requests that were retried, by reason.", ['reason'])
+API_RATE_LIMITED = Counter('checkbot_api_rate_limited_total', "Vast.ai API responses with status 429.")
+API_NOT_MODIFIED = Counter('checkbot_api_not_modified_total', "Conditional Vast.ai API requests answered from the cache (304).")
+
+SSH_CONNECT_SECONDS = Histogram('checkbot_ssh_connect_duration_seconds', "Duration of SSH connection setup including authentication.")
+SSH_EXEC_SECONDS = Histogram('checkbot_ssh_exec_duration_seconds', "Duration of remote commands until their output was read.")
+SSH_BYTES_READ = Counter('checkbot_ssh_bytes_read_total', "Bytes of remote command output read.")
+SSH_BYTES_PER_POLL = Histogram('checkbot_ssh_bytes_per_poll', "Bytes of remote command output per poll of one host.", buckets=BYTES_BUCKETS)
+SSH_ERRORS = Counter('checkbot_ssh_errors_total', "Failed SSH connection attempts and commands, by stage.", ['stage'])
+SSH_RECONNECTS = Counter('checkbot_ssh_reconnects_total', "Pooled SSH connections that had dropped and were re-established.")
+
+LOG_PARSE_SECONDS = Histogram('checkbot_log_parse_duration_seconds', "Duration of parsing the log output of one host.")
+LOG_PARSE_FAILURES = Counter('checkbot_log_parse_failures_total', "Polls whose log output held no usable 'Mining:' line.")
+
+POLLS_SKIPPED = Counter('checkbot_polls_skipped_total', "Instances left out of a cycle by the poll scheduler, by reason.", ['reason'])
+POLLS_PAST_DEADLINE = Counter('checkbot_polls_past_deadline_total', "Polls that had not finished when the cycle deadline was reached.")
+OPEN_CIRCUITS = Gauge('checkbot_open_circuits', "Instances polled only every backoff_max seconds after repeated failures.")
+
+SHARD_RECORDS_SENT = Counter('checkbot_shard_records_sent_total', "Records a worker sent to the coordinator.")
+SHARD_RECORDS_DROPPED = Counter('checkbot_shard_records_dropped_total', "Records a worker dropped because its queue to the coordinator was full.")
+SHARD_RECORDS_RECEIVED = Counter('checkbot_shard_records_received_total', "Records the coordinator received from the workers.")
+
+ALERTS = Counter('checkbot_alerts_total', "Alerts by kind and what became of them (raised, dropped, merged, cooling_down).", ['kind', 'outcome'])
+ALERT_DELIVERIES = Counter('checkbot_alert_deliveries_total', "Alert digests per sink, delivered or failed.", ['sink', 'outcome'])
+ALERT_DELIVERY_SECONDS = Histogram('checkbot_alert_delivery_duration_seconds', "Duration of delivering one alert digest, per sink.", ['sink'])
+
+DASHBOARD_CELLS_WRITTEN = Counter('checkbot_dashboard_cells_written_total', "Table cells written to the screen by the dashboard.")
+
+
+# Exporters
+
+def write_textfile(path, registry=REGISTRY):
+    """Write the metrics to path for the node_exporter textfile collector, replacing the file atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.' + os.path.basename(path), delete=False) as f:
+        f.write(registry.exposition())
+    os.replace(f.name, path)
+
+
+def start_http_server(port, address='127.0.0.1', registry=REGISTRY):
+    """Serve the metrics on http://address:port/metrics from a daemon thread and return the server."""
+    # Imported here because http.server is slow to import and most runs do not serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.exposition().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info("Serving metrics on http://%s:%d/metrics", address, server.server_address[1])
+    return server
@@ -0,0 +1,96 @@
+"""Batch parser for XENGPUMiner 'Mining:' log lines.
+
+Turns a whole buffer of miner.log content into columnar NumPy arrays in a few C-level passes
+instead of running the regex line by line, so backfills and incremental tailing can handle
+millions of lines.
+
+A strict pattern for the exact layout of the miner's progress lines runs over the raw buffer first.
+It needs no ANSI stripping, because colour codes around a line are outside the match and codes
+inside one make it fail. Only when some 'Mining:' line did not match are the 'Mining:' lines picked
+out one by one, stripped, and matched with the tolerant pattern the collector always used.
+"""
+import gc
+import re
+from collections import namedtuple
+
+import numpy as np
+
+
+# ANSI colour codes written by the miner
+ANSI_ESCAPE_PATTERN = re.compile(rb'\x1B[@-_][0-?]*[ -/]*[@-~]')
+
+# The 'Mining:' pattern that check_bot_1.py always used. Because the pattern starts with the literal
+# 'Mining:', the regex engine skips every other line with a fast substring search, and '.' never
+# crosses a line break, so a single findall() over a buffer yields one match per 'Mining:' line.
+MINING_PATTERN = re.compile(rb'Mining:.*\[(?:(\d+):)?(\d+):(\d+)(?:\.\d+)?,.*?(?:Details=(?:(?:super:(\d+)\s)?normal:(\d+)|xuni:(\d+)).*?)?HashRate:(\d+\.\d+).*Difficulty=(\d+)')
+
+# The same groups for the layout the miner writes, 'Mining: 12 Blocks [01:02:03.45, Details=super:0 normal:12,
+# HashRate:2560.23, Difficulty=2302]': every separator is literal, so there is no backtracking over the line
+STRICT_MINING_PATTERN = re.compile(rb'Mining:[^\[\n]*\[(?:(\d+):)?(\d+):(\d+)(?:\.\d+)?, (?:Details=(?:super:(\d+) )?(?:normal:(\d+)|xuni:(\d+)), )?'
+                                   rb'HashRate:(\d+\.\d+), Difficulty=(\d+)')
+
+# Groups that may not participate in a match and then count as 0
+OPTIONAL_GROUPS = (0, 3, 4, 5)
+
+MiningColumns = namedtuple('MiningColumns', ['runtime_seconds', 'super_blocks', 'normal_blocks', 'xuni_blocks', 'hash_rate', 'difficulty'])
+
+
+def empty_columns():
+    return MiningColumns(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                         np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+
+
+def parse_buffer(buffer):
+    """Parse every 'Mining:' line in buffer (bytes or str) into MiningColumns, in log order.
+
+    Carriage returns written by the miner's progress bar count as line breaks. Lines that do not
+    match are skipped.
+    """
+    if isinstance(buffer, str):
+        buffer = buffer.encode()
+    buffer = buffer.replace(b'\r', b'\n')
+    expected = buffer.count(b'Mining:')
+    if not expected:
+        return empty_columns()
+
+    # The matches are millions of tuples that hold only bytes. Left on, the garbage collector would walk
+    # all of them again and again while they are created, which took a fifth of the time on 1M lines.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        matches = STRICT_MINING_PATTERN.findall(buffer)
+        if len(matches) < expected:
+            # Colour codes inside a line, or a layout the strict pattern does not know
+            if b'\x1b' in buffer:
+                buffer = ANSI_ESCAPE_PATTERN.sub(b'', buffer)
+            lines = b'\n'.join([line for line in buffer.split(b'\n') if b'Mining:' in line])
+            matches = MINING_PATTERN.findall(lines)
+        if not matches:
+            return empty_columns()
+
+        # One column of byte strings per group, parsed by NumPy in one call each
+        fields = []
+        for group, values in enumerate(zip(*matches)):
+            if group in OPTIONAL_GROUPS:
+                values = [value or b'0' for value in values]
+            fields.append(np.fromstring(b' '.join(values), dtype=np.float64 if group == 6 else np.int64, sep=' '))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    hours, minutes, seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty = fields
+    return MiningColumns(runtime_seconds=hours * 3600 + minutes * 60 + seconds, super_blocks=super_blocks, normal_blocks=normal_blocks,
+                         xuni_blocks=xuni_blocks, hash_rate=hash_rate, difficulty=difficulty)
+
+
+def parse_lines(lines):
+    """Parse an iterable of log lines (bytes or str) into MiningColumns."""
+    lines = list(lines)
+    if not lines:
+        return empty_columns()
+    separator = b'\n' if isinstance(lines[0], bytes) else '\n'
+    return parse_buffer(separator.join(lines))
+
+
+def iter_rows(columns):
+    """Yield (runtime_seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty) tuples as Python numbers."""
+    return zip(*(column.tolist() for column in columns))
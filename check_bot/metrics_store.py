@@ -0,0 +1,351 @@
+"""Time-series store for the per-instance metrics shown in the performance table.
+
+One row is kept per (timestamp, instance_id). Rows are written to one SQLite segment file per UTC day.
+Within a segment, rows are clustered by (instance_id, ts) and GPU names and labels are dictionary
+encoded. Segments older than compress_after_days are gzip-compressed, and segments older than
+retention_days are deleted. Queries over recent data only touch the uncompressed daily segments
+they overlap.
+
+The hourly rollup of a past day, which cost analyses over weeks of history read (see efficiency.py),
+is computed once and cached next to its segment in a .rollup.npz file. The cache records the size and
+modification time of the segment and is recomputed when they change, e.g. after a backfill.
+"""
+import contextlib
+import datetime
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+
+# Numeric columns that can be queried, in the order of the performance table plus difficulty and balance
+NUMERIC_COLUMNS = ['num_gpus', 'gpu_util', 'dph_total', 'usd_per_gpu', 'hash_rate', 'hash_rate_per_gpu', 'normal_blocks',
+                   'runtime_hours', 'normal_block_per_hour', 'hash_rate_per_usd', 'dollars_per_normal_block', 'difficulty', 'balance']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS samples (
+    ts INTEGER NOT NULL,
+    instance_id INTEGER NOT NULL,
+    gpu_name_id INTEGER,
+    label_id INTEGER,
+    {', '.join(f'{column} REAL' for column in NUMERIC_COLUMNS)},
+    PRIMARY KEY (instance_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+"""
+
+SEGMENT_NAME = re.compile(r'^metrics-(\d{4}-\d{2}-\d{2})\.sqlite(\.gz)?$')
+
+# Per (instance, hour): its GPU name and label (as string IDs of the segment), samples, hourly means and the largest block count.
+# Scanning the table in (instance_id, ts) order is faster here than the ts index, which +ts keeps SQLite from using.
+ROLLUP_SQL = ("SELECT instance_id, ts / 3600 * 3600 AS hour, gpu_name_id, label_id, COUNT(*), AVG(num_gpus), AVG(dph_total), AVG(hash_rate), "
+              "MAX(normal_blocks) FROM samples WHERE +ts >= ? AND +ts < ? GROUP BY instance_id, hour ORDER BY instance_id, hour")
+ROLLUP_COLUMNS = ('instance_id', 'hour', 'gpu_name', 'label', 'samples', 'num_gpus', 'dph_total', 'hash_rate', 'normal_blocks')
+BALANCE_SQL = "SELECT ts, MAX(balance) FROM samples WHERE ts >= ? AND ts < ? AND balance IS NOT NULL GROUP BY ts ORDER BY ts"
+
+
+def _number(value):
+    # The performance table uses NaN for values that could not be computed
+    if value is None or value != value:
+        return None
+    return float(value)
+
+
+class MetricsStore:
+    """Append table rows each cycle and query them back as NumPy arrays."""
+
+    def __init__(self, directory='metrics', retention_days=90, compress_after_days=7):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.compress_after_days = compress_after_days
+        self._connections = {}  # day -> open connection of a segment being written
+        self._current_day = None
+        self._string_ids = {}   # (day, value) -> id in that segment's strings table
+        os.makedirs(directory, exist_ok=True)
+        self.rotate()
+
+    # Segments
+
+    def _segment_path(self, day, compressed=False):
+        return os.path.join(self.directory, f"metrics-{day.isoformat()}.sqlite" + (".gz" if compressed else ""))
+
+    def _rollup_path(self, day):
+        return os.path.join(self.directory, f"metrics-{day.isoformat()}.rollup.npz")
+
+    def _segments(self):
+        """Return {day: compressed} for every segment file in the directory."""
+        segments = {}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                segments[datetime.date.fromisoformat(match.group(1))] = match.group(2) is not None
+        return segments
+
+    def _connection(self, day):
+        connection = self._connections.get(day)
+        if connection is None:
+            path = self._segment_path(day)
+            if not os.path.exists(path) and os.path.exists(self._segment_path(day, compressed=True)):
+                # Writing into a compressed day (a backfill): decompress it, rotate() compresses it again
+                with gzip.open(self._segment_path(day, compressed=True), 'rb') as source, open(path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(self._segment_path(day, compressed=True))
+            # The cached rollup of the day is about to be out of date
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._rollup_path(day))
+            connection = sqlite3.connect(path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connections[day] = connection
+        return connection
+
+    def _close_segment(self, day):
+        connection = self._connections.pop(day, None)
+        if connection is not None:
+            # Switching back from WAL folds the write-ahead log into the segment file
+            connection.execute("PRAGMA journal_mode=DELETE")
+            connection.close()
+        for key in [key for key in self._string_ids if key[0] == day]:
+            del self._string_ids[key]
+
+    def rotate(self):
+        """Compress segments older than compress_after_days and delete those older than retention_days."""
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        for day, compressed in sorted(self._segments().items()):
+            if day == self._current_day:
+                continue
+            age_days = (today - day).days
+            if self.retention_days is not None and age_days > self.retention_days:
+                self._close_segment(day)
+                os.remove(self._segment_path(day, compressed))
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._rollup_path(day))
+                logging.info("Deleted metrics segment %s (older than %d days)", day, self.retention_days)
+            elif not compressed and self.compress_after_days is not None and age_days > self.compress_after_days:
+                self._close_segment(day)
+                path = self._segment_path(day)
+                with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(path)
+                logging.info("Compressed metrics segment %s", day)
+
+    # Writing
+
+    def _string_id(self, connection, day, value):
+        if value is None:
+            return None
+        key = (day, value)
+        string_id = self._string_ids.get(key)
+        if string_id is None:
+            connection.execute("INSERT OR IGNORE INTO strings (value) VALUES (?)", (value,))
+            string_id = connection.execute("SELECT id FROM strings WHERE value = ?", (value,)).fetchone()[0]
+            self._string_ids[key] = string_id
+        return string_id
+
+    def append(self, timestamp, table_data, difficulty_by_instance=None, balance=None):
+        """Store the rows of one cycle.
+
+        table_data holds rows in the column order of print_table(). difficulty_by_instance maps
+        instance IDs to the difficulty read from their log, balance is the account balance.
+        """
+        if not table_data:
+            return
+        day = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date()
+        self._current_day = day
+        connection = self._connection(day)
+        difficulty_by_instance = difficulty_by_instance or {}
+        records = []
+        for (instance_id, gpu_name, num_gpus, gpu_util, dph_total, usd_per_gpu, hash_rate, hash_rate_per_gpu, normal_blocks,
+             runtime_hours, normal_block_per_hour, hash_rate_per_usd, dollars_per_normal_block, label) in table_data:
+            records.append((int(timestamp), instance_id,
+                            self._string_id(connection, day, gpu_name), self._string_id(connection, day, label or None),
+                            _number(num_gpus), _number(gpu_util), _number(dph_total), _number(usd_per_gpu), _number(hash_rate),
+                            _number(hash_rate_per_gpu), _number(normal_blocks), _number(runtime_hours), _number(normal_block_per_hour),
+                            _number(hash_rate_per_usd), _number(dollars_per_normal_block),
+                            _number(difficulty_by_instance.get(instance_id)), _number(balance)))
+        with connection:
+            connection.executemany(f"INSERT OR REPLACE INTO samples VALUES ({', '.join('?' * (4 + len(NUMERIC_COLUMNS)))})", records)
+
+        # A new day started: close the segments of previous days and compress or expire old ones
+        previous_days = [open_day for open_day in self._connections if open_day < day]
+        if previous_days:
+            for open_day in previous_days:
+                self._close_segment(open_day)
+            self.rotate()
+
+    def append_history(self, instance_id, gpu_name, label, rows):
+        """Store past samples of one instance, e.g. read from its miner.log by a backfill.
+
+        rows are (timestamp, *values) tuples with one value (or None) per NUMERIC_COLUMNS entry.
+        Samples already in the history for the same instance and timestamp are kept.
+        """
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(datetime.datetime.fromtimestamp(row[0], datetime.timezone.utc).date(), []).append(row)
+        for day, day_rows in by_day.items():
+            connection = self._connection(day)
+            gpu_name_id = self._string_id(connection, day, gpu_name)
+            label_id = self._string_id(connection, day, label or None)
+            with connection:
+                connection.executemany(f"INSERT OR IGNORE INTO samples VALUES ({', '.join('?' * (4 + len(NUMERIC_COLUMNS)))})",
+                                       [(int(row[0]), instance_id, gpu_name_id, label_id, *row[1:]) for row in day_rows])
+
+    # Querying
+
+    def _days(self, since, until):
+        """Return (day, compressed) of every segment overlapping [since, until), oldest first."""
+        first_day = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).date()
+        last_day = datetime.datetime.fromtimestamp(until, datetime.timezone.utc).date()
+        return [(day, compressed) for day, compressed in sorted(self._segments().items()) if first_day <= day <= last_day]
+
+    def _with_segment(self, day, compressed, function):
+        """Call function(connection) on the segment of day and return its result."""
+        if day in self._connections:
+            return function(self._connections[day])
+        if not compressed:
+            connection = sqlite3.connect(f"file:{self._segment_path(day)}?mode=ro", uri=True)
+            try:
+                return function(connection)
+            finally:
+                connection.close()
+        # Older segments are decompressed into a temporary file for the duration of the query
+        with tempfile.NamedTemporaryFile(suffix='.sqlite') as temporary:
+            with gzip.open(self._segment_path(day, compressed=True), 'rb') as source:
+                shutil.copyfileobj(source, temporary)
+            temporary.flush()
+            connection = sqlite3.connect(temporary.name)
+            try:
+                return function(connection)
+            finally:
+                connection.close()
+
+    def _query(self, sql, parameters, since, until):
+        """Run sql on every segment overlapping [since, until) and return all result rows."""
+        rows = []
+        for day, compressed in self._days(since, until):
+            rows.extend(self._with_segment(day, compressed, lambda connection: connection.execute(sql, parameters).fetchall()))
+        return rows
+
+    @staticmethod
+    def _window(since, until):
+        until = time.time() if until is None else until
+        since = until - 24 * 3600 if since is None else since
+        return int(since), int(until)
+
+    def series(self, column, instance_id, since=None, until=None):
+        """Return (timestamps, values) of one column for one instance, oldest first. Defaults to the last 24 hours."""
+        if column not in NUMERIC_COLUMNS:
+            raise ValueError(f"Unknown metrics column '{column}'. Must be one of: {', '.join(NUMERIC_COLUMNS)}")
+        since, until = self._window(since, until)
+        rows = self._query(f"SELECT ts, {column} FROM samples WHERE instance_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                           (instance_id, since, until), since, until)
+        values = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return values[:, 0].astype(np.int64), values[:, 1]
+
+    def hash_rate(self, instance_id, since=None, until=None):
+        """Hash rate of one instance over time, e.g. hash_rate(1234567, since=time.time() - 86400)."""
+        return self.series('hash_rate', instance_id, since, until)
+
+    def fleet_usd_per_block_hourly(self, since=None, until=None):
+        """Return (hour_starts, usd_per_block): fleet-wide spend divided by blocks found, per hour."""
+        since, until = self._window(since, until)
+        rows = self._query("SELECT ts / 3600 * 3600 AS hour, SUM(dph_total), SUM(normal_block_per_hour) FROM samples "
+                           "WHERE ts >= ? AND ts < ? AND normal_block_per_hour IS NOT NULL GROUP BY hour ORDER BY hour",
+                           (since, until), since, until)
+        values = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            usd_per_block = np.where(values[:, 2] > 0, values[:, 1] / values[:, 2], np.nan)
+        return values[:, 0].astype(np.int64), usd_per_block
+
+    @staticmethod
+    def _rollup_arrays(rows, strings, balance_rows):
+        columns = list(zip(*rows)) if rows else [()] * len(ROLLUP_COLUMNS)
+        rollup = {'instance_id': np.array(columns[0], dtype=np.int64), 'hour': np.array(columns[1], dtype=np.int64),
+                  'samples': np.array(columns[4], dtype=np.int64)}
+        # String IDs are only valid within their segment
+        rollup['gpu_name'] = np.array([strings.get(string_id) for string_id in columns[2]], dtype=object)
+        rollup['label'] = np.array([strings.get(string_id) for string_id in columns[3]], dtype=object)
+        for name, values in zip(ROLLUP_COLUMNS[5:], columns[5:]):
+            rollup[name] = np.array(values, dtype=np.float64)
+        balances = np.array(balance_rows, dtype=np.float64).reshape(-1, 2)
+        rollup['balance_ts'] = balances[:, 0].astype(np.int64)
+        rollup['balance'] = balances[:, 1]
+        return rollup
+
+    def _rollup(self, connection, since, until):
+        """Hourly rollup and balances of one segment over [since, until), see hourly_rollup()."""
+        return self._rollup_arrays(connection.execute(ROLLUP_SQL, (since, until)).fetchall(),
+                                   dict(connection.execute("SELECT id, value FROM strings").fetchall()),
+                                   connection.execute(BALANCE_SQL, (since, until)).fetchall())
+
+    def _day_rollup(self, day, compressed):
+        """Rollup of a whole past day, from its cache file where that is still valid."""
+        path = self._segment_path(day, compressed)
+        # A day still being written, in this process or another one (its write-ahead log exists), is not cached
+        cacheable = day not in self._connections and not os.path.exists(self._segment_path(day) + '-wal')
+        stat = os.stat(path)
+        stamp = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        rollup_path = self._rollup_path(day)
+        if cacheable and os.path.exists(rollup_path):
+            try:
+                with np.load(rollup_path) as cached:
+                    if np.array_equal(cached['stamp'], stamp):
+                        rollup = {name: cached[name] for name in cached.files if name != 'stamp'}
+                        # Strings are stored as text, '' for None
+                        for name in ('gpu_name', 'label'):
+                            rollup[name] = np.where(rollup[name] == '', None, rollup[name].astype(object))
+                        return rollup
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning("Ignoring the unreadable metrics rollup %s: %s", rollup_path, e)
+        start = int(datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc).timestamp())
+        rollup = self._with_segment(day, compressed, lambda connection: self._rollup(connection, start, start + 86400))
+        if cacheable:
+            stored = dict(rollup, stamp=stamp)
+            for name in ('gpu_name', 'label'):
+                stored[name] = np.array(['' if value is None else value for value in rollup[name]], dtype=str)
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix='.' + os.path.basename(rollup_path), delete=False) as temporary:
+                np.savez(temporary, **stored)
+            os.replace(temporary.name, rollup_path)
+        return rollup
+
+    def hourly_rollup(self, since=None, until=None, with_balance=False):
+        """Return the samples of every instance aggregated per hour, as a dict of arrays with one entry per (instance, hour).
+
+        Keys: instance_id, hour (start of the hour), gpu_name and label (object arrays), samples, and the hourly
+        means of num_gpus, dph_total and hash_rate. normal_blocks is the largest block count seen in the hour.
+        The rows of each day are ordered by instance and hour, the days follow each other. since is rounded
+        down to a whole hour. With with_balance=True the result also has balance_ts and balance, the
+        balance stored with each cycle (see balance_history()).
+        """
+        since, until = self._window(since, until)
+        since -= since % 3600
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        parts = []
+        for day, compressed in self._days(since, until):
+            start = int(datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc).timestamp())
+            if day < today and since <= start and start + 86400 <= until:
+                parts.append(self._day_rollup(day, compressed))
+            else:
+                parts.append(self._with_segment(day, compressed, lambda connection: self._rollup(connection, since, until)))
+        names = ROLLUP_COLUMNS + (('balance_ts', 'balance') if with_balance else ())
+        if not parts:
+            parts = [self._rollup_arrays([], {}, [])]
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def balance_history(self, since=None, until=None):
+        """Return (timestamps, balances) of the account balance stored with each cycle, oldest first."""
+        since, until = self._window(since, until)
+        values = np.array(self._query(BALANCE_SQL, (since, until), since, until), dtype=np.float64).reshape(-1, 2)
+        return values[:, 0].astype(np.int64), values[:, 1]
+
+    def close(self):
+        for day in list(self._connections):
+            self._close_segment(day)
@@ -0,0 +1,252 @@
+"""State kept between cycles and one full collection and report cycle."""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import config, fleet_analytics, instrumentation, profiling
+from .alerts import Alert, poll_alerts
+from .anomaly import AnomalyTracker
+from .collector import collect_log_info, make_log_tail
+from .fleet_analytics import FleetState
+from .instances import get_vastai_balance, instance_list, number, print_vastai_balance
+from .report import TableRows, fleet_table_data, print_table, report_outliers
+from .scheduler import PollScheduler
+from .shard import in_shard
+from .state_cache import StateCache
+
+
+# Shown for instances that have not answered any poll yet
+NO_LOG_INFO = (None,) * 8
+
+
+class MonitorState:
+    """State kept between cycles so that watch mode does not rebuild everything on each refresh."""
+
+    def __init__(self, rate_window_seconds=3600, cache=None, shard=None, on_log_info=None, alerts=None):
+        self.ssh_info_list = []
+        self.total_dph_running_machines = 0
+        self.total_gpus_running = 0
+        self.instances_refreshed_at = None
+        self.rate_window_seconds = rate_window_seconds
+        # (index, count): only poll the instances whose ID modulo count is index (see shard.py)
+        self.shard = shard
+        # Called with (ssh_info, log_info, log_tail) after every poll, e.g. to stream the results to the coordinator
+        self.on_log_info = on_log_info
+        # AlertDispatcher that problems are submitted to as soon as they are seen, or None
+        self.alerts = alerts
+        # instance_id -> LogTail or RemoteSummary with the latest state of that instance's miner.log
+        self.log_tails = {}
+        # Last good log_info of every instance, shown for instances that were not polled or failed in a cycle.
+        # The cache keeps them on disk, the fleet state as the array the table and statistics are computed from.
+        self.cache = cache if cache is not None else StateCache()
+        self.fleet = FleetState()
+        # Table rows of the last cycle, only those of changed instances are built again
+        self.table = TableRows()
+        self.scheduler = PollScheduler(steady_interval=config.poll_steady_interval, hot_seconds=config.poll_hot_seconds,
+                                       change_tolerance=config.poll_change_tolerance, backoff_base=config.poll_backoff_base,
+                                       backoff_max=config.poll_backoff_max, failure_threshold=config.poll_failure_threshold)
+        self.anomaly_tracker = AnomalyTracker(drop_tolerance=config.anomaly_drop_tolerance, drop_limit=config.anomaly_drop_limit,
+                                              group_slack=config.threshold, group_limit=config.anomaly_group_limit, util_polls=config.anomaly_util_polls,
+                                              stalled_polls=config.anomaly_stalled_polls)
+
+    def record_log_info(self, ssh_info, log_info):
+        # Called from the collection threads, also for answers that arrive after the cycle deadline
+        if log_info is not None and log_info[4] is not None and log_info[5] is not None:
+            self.cache.put_log_info(ssh_info['instance_id'], log_info)
+            self.fleet.set_log_info(ssh_info['instance_id'], log_info, self.log_tails.get(ssh_info['instance_id']))
+        self.scheduler.record(ssh_info['instance_id'], log_info[6] if log_info is not None else None, answered=log_info is not None)
+        if self.alerts is not None:
+            for alert in poll_alerts(ssh_info, log_info, self.log_tails.get(ssh_info['instance_id']),
+                                     failures=self.scheduler.failures(ssh_info['instance_id']),
+                                     failure_threshold=self.scheduler.failure_threshold, stalled_polls=config.anomaly_stalled_polls):
+                self.alerts.submit(alert)
+        if self.on_log_info is not None:
+            self.on_log_info(ssh_info, log_info, self.log_tails.get(ssh_info['instance_id']))
+
+
+# Function to refresh the instance list once it is older than max_age seconds
+def refresh_instances(state, api_client, max_age=0):
+    now = time.monotonic()
+    if state.instances_refreshed_at is not None and now - state.instances_refreshed_at < max_age:
+        return
+    with instrumentation.PHASE_SECONDS.labels('instance_list').time():
+        ssh_info_list, total_dph_running_machines, total_gpus_running = instance_list(api_client)
+    if state.shard is not None:
+        ssh_info_list = [ssh_info for ssh_info in ssh_info_list if in_shard(ssh_info['instance_id'], state.shard)]
+        running = [ssh_info for ssh_info in ssh_info_list if str(ssh_info['actual_status']).lower() == 'running']
+        total_dph_running_machines = sum(number(ssh_info['dph_total']) for ssh_info in running)
+        total_gpus_running = sum(number(ssh_info['num_gpus'], int) for ssh_info in running)
+    instrumentation.INSTANCES.set(len(ssh_info_list))
+    if not ssh_info_list and state.ssh_info_list:
+        logging.warning("Instance list came back empty, keeping the previous list of %d instances.", len(state.ssh_info_list))
+        return
+    state.ssh_info_list = ssh_info_list
+    state.total_dph_running_machines = total_dph_running_machines
+    state.total_gpus_running = total_gpus_running
+    state.instances_refreshed_at = now
+    state.cache.put_instances(ssh_info_list, total_dph_running_machines, total_gpus_running)
+    state.fleet.set_instances(ssh_info_list)
+
+    # Forget the logs of instances that no longer exist
+    current_ids = {ssh_info['instance_id'] for ssh_info in ssh_info_list}
+    for instance_id in list(state.log_tails):
+        if instance_id not in current_ids:
+            del state.log_tails[instance_id]
+    state.cache.forget(current_ids)
+    state.scheduler.forget(current_ids)
+    state.anomaly_tracker.forget(current_ids)
+
+
+# Function to return the cached log_info of every instance and the age in seconds of those not in fresh.
+# Used where there is no fleet state, like on the coordinator.
+def cached_log_infos(state, fresh=()):
+    now = time.time()
+    log_info_list = []
+    ages = {}
+    for ssh_info in state.ssh_info_list:
+        cached = state.cache.get_log_info(ssh_info['instance_id'])
+        if cached is None:
+            log_info_list.append(NO_LOG_INFO)
+            continue
+        read_at, log_info = cached
+        log_info_list.append(log_info)
+        if ssh_info['instance_id'] not in fresh:
+            ages[ssh_info['instance_id']] = now - read_at
+    return log_info_list, ages
+
+
+# Function to build the table data from the fleet state, and the age in seconds of the values of instances not in fresh
+def fleet_data(state, fresh=()):
+    fleet, gpu_types, labels = state.fleet.snapshot()
+    stale = fleet['parsed'] & ~np.isin(fleet['instance_id'], np.fromiter(fresh, np.int64, len(fresh)))
+    ages = dict(zip(fleet['instance_id'][stale].tolist(), (time.time() - fleet['read_at'][stale]).tolist()))
+    return fleet_table_data(fleet, gpu_types, labels, state.table), ages
+
+
+def print_fleet_table(state, fleet, ages=None):
+    print_table(fleet['table_data'], fleet['mean_difficulty'], fleet['average_dollars_per_normal_block'], state.total_dph_running_machines,
+                fleet['usd_per_gpu'], fleet['hash_rate_per_gpu'], fleet['hash_rate_per_usd'], fleet['label'],
+                fleet['sum_normal_block_per_hour'], fleet['total_hash_rate'], state.total_gpus_running,
+                output_file=config.table_output_file, ages=ages)
+
+
+# Function to load the state cache and print the table it holds before the first poll has finished
+def warm_start(state, print_cached=True):
+    if not state.cache.load():
+        return False
+    if state.cache.instances is not None:
+        _, state.ssh_info_list, state.total_dph_running_machines, state.total_gpus_running = state.cache.instances
+    state.fleet.set_instances(state.ssh_info_list)
+    for instance_id, (read_at, log_info) in list(state.cache.log_infos.items()):
+        state.fleet.set_log_info(instance_id, log_info, read_at=read_at)
+    logging.info("Loaded cached values of %d instances from %s.", len(state.cache.log_infos), state.cache.path)
+    if print_cached and state.ssh_info_list:
+        report = cached_report(state)
+        print_fleet_table(state, report['fleet'], report['ages'])
+        print("Cached values, collecting fresh data...")
+    return True
+
+
+# Function to build the report of run_cycle() from the cached values alone, without polling
+def cached_report(state):
+    fleet, ages = fleet_data(state)
+    return {'fleet': fleet, 'ages': ages, 'balance': None, 'warnings': set(fleet['gpu_util_warnings_set']), 'regressions': {},
+            'anomalous': set(), 'total_dph': state.total_dph_running_machines, 'total_gpus': state.total_gpus_running}
+
+
+# Function to raise an alert for every freshly polled instance whose hash rate is an outlier below its GPU type
+def submit_outlier_alerts(alerts, fleet, gpu_types, fresh):
+    center, _, _, z_scores = fleet_analytics.find_outliers(fleet, len(gpu_types), config.threshold, robust=config.outlier_statistics == 'median')
+    below = (z_scores < -config.threshold) & np.isin(fleet['instance_id'], np.fromiter(fresh, np.int64, len(fresh)))
+    for instance_id, gpu_code, hash_rate_per_gpu, z_score in zip(fleet['instance_id'][below].tolist(), fleet['gpu_type'][below].tolist(),
+                                                                   fleet['hash_rate_per_gpu'][below].tolist(), z_scores[below].tolist()):
+        mean = center[gpu_code]
+        alerts.submit(Alert('outlier', instance_id, f"Instance ID {instance_id}: {hash_rate_per_gpu:.2f}H/s, {(mean - hash_rate_per_gpu) / mean * 100:.2f}% "
+                                                    f"below the {gpu_types[gpu_code]} average, Variance: {z_score:.2f} Z-Score"))
+
+
+# Function to run one full collection and report cycle. The collection ends by deadline (a time.monotonic() value) if given.
+# Returns what was collected as a dict, for the dashboard, which prints nothing (quiet=True) and draws it instead.
+def run_cycle(state, api_client, ssh_pool, username="root", metrics_store=None, deadline=None, quiet=False):
+    # The balance does not depend on the instance list, so both are fetched at the same time.
+    # Of the shards of an account only the first one fetches it.
+    fetch_balance = config.print_balance_check and (state.shard is None or state.shard[0] == 0)
+    with profiling.phase('api'), ThreadPoolExecutor(max_workers=1) as executor:
+        balance_future = executor.submit(get_vastai_balance, api_client) if fetch_balance else None
+        refresh_instances(state, api_client, max_age=config.instance_list_refresh_interval)
+        balance = balance_future.result() if balance_future is not None else None
+
+    for ssh_info in state.ssh_info_list:
+        if ssh_info['instance_id'] not in state.log_tails:
+            state.log_tails[ssh_info['instance_id']] = make_log_tail(window_seconds=state.rate_window_seconds)
+
+    # Fetch Log Information concurrently from the instances that are due, most overdue first
+    due = state.scheduler.plan(state.ssh_info_list)
+    with instrumentation.PHASE_SECONDS.labels('collect_log_info').time(), profiling.phase('ssh'):
+        results = collect_log_info(due, username, ssh_pool,
+                                   max_workers=config.max_concurrent_connections,
+                                   command_timeout=config.ssh_command_timeout,
+                                   log_tails=state.log_tails, deadline=deadline,
+                                   on_result=state.record_log_info)
+    fresh = {ssh_info['instance_id'] for ssh_info, log_info in zip(due, results) if log_info is not None and log_info[4] is not None}
+    # The others are shown with their last good values, unless those are too old
+    state.fleet.clear_log_info(state.cache.evict())
+
+    with instrumentation.PHASE_SECONDS.labels('build_table_data').time(), profiling.phase('analytics'):
+        fleet, ages = fleet_data(state, fresh)
+
+    # Those still being polled are left out of log_tails, which their worker threads are still updating
+    in_flight = state.scheduler.in_flight()
+    log_tails = {instance_id: log_tail for instance_id, log_tail in state.log_tails.items() if instance_id not in in_flight}
+
+    # Streaming detectors: sustained low utilization and stalled logs join the warnings,
+    # hash rate regressions are listed with the stats of their GPU type
+    warnings_set = set(fleet['gpu_util_warnings_set'])
+    regressions = {}
+    with instrumentation.PHASE_SECONDS.labels('anomaly_detection').time(), profiling.phase('analytics'):
+        anomalies = state.anomaly_tracker.update_fleet(fleet['fleet'], fleet['gpu_types'], log_tails, polled=fresh)
+        state.scheduler.mark_hot({instance_id for instance_id, _, _, _ in anomalies})
+        for instance_id, gpu_code, kind, message in anomalies:
+            if kind in ('utilization', 'stalled'):
+                warnings_set.add(message)
+            else:
+                regressions.setdefault(gpu_code, []).append(message)
+            if state.alerts is not None:
+                state.alerts.submit(Alert(kind, instance_id, message))
+        if state.alerts is not None:
+            submit_outlier_alerts(state.alerts, fleet['fleet'], fleet['gpu_types'], fresh)
+
+    if config.print_balance_check and not quiet:
+        with profiling.phase('render'):
+            print("\n" + "-" * 60 + "\n")
+            print_vastai_balance(balance, state.total_dph_running_machines)
+            print("\n" + "-" * 60)
+
+    # Print the table
+    if not quiet:
+        with instrumentation.PHASE_SECONDS.labels('print_table').time(), profiling.phase('render'):
+            print_fleet_table(state, fleet, ages)
+
+    # Store the rows in the metrics history. Cached rows are not new samples.
+    if metrics_store is not None:
+        try:
+            with instrumentation.PHASE_SECONDS.labels('metrics_store').time(), profiling.phase('store'):
+                metrics_store.append(time.time(), [row for row in fleet['table_data'] if row[0] in fresh], fleet['difficulty_by_instance'], balance)
+        except Exception as e:
+            logging.error("Failed to store metrics: %s", e)
+
+    try:
+        with profiling.phase('store'):
+            state.cache.save()
+    except OSError as e:
+        logging.error("Failed to save the state cache to %s: %s", state.cache.path, e)
+
+    if not quiet:
+        with instrumentation.PHASE_SECONDS.labels('report_outliers').time(), profiling.phase('render'):
+            report_outliers(fleet['fleet'], fleet['gpu_types'], warnings_set, regressions)
+
+    return {'fleet': fleet, 'ages': ages, 'balance': balance, 'warnings': warnings_set, 'regressions': regressions,
+            'anomalous': {instance_id for instance_id, _, _, _ in anomalies}, 'total_dph': state.total_dph_running_machines,
+            'total_gpus': state.total_gpus_running}
@@ -0,0 +1,300 @@
+"""CPU and allocation profiles per phase of the collection cycle (collect --profile).
+
+The code of a cycle marks its phases with `with profiling.phase('ssh'):`. That costs a global lookup
+unless a Profiler was started. While one is running, each thread gets one cProfile.Profile per phase,
+enabled only while the thread is inside that phase. The SSH and parse phases therefore cover the
+collection worker threads, not just the main thread that waits for them. Nested phases are
+exclusive: the outer phase is paused while the inner one runs.
+
+Python 3.12 and later allow one active profiler per process, and that profiler records every thread
+(PROCESS_WIDE). There the profile of the phase the main thread is in (ssh, while it waits for the
+workers) also holds the functions the worker threads run, including those of their nested parse
+phases. Entries that could not enable their own profile are only timed, and the report says so.
+
+Allocations are traced with tracemalloc. A snapshot is taken when the main thread enters and leaves its
+outermost phase. Their difference, summed per allocation site over all cycles, is what the phase left
+allocated, next to the peak of traced memory during the phase. Worker threads do not take snapshots,
+so what they allocate while parsing shows up in the ssh phase, which the main thread spends waiting
+for them.
+
+stop() merges the profiles. text() is a short report of the top functions and allocation sites per
+phase. data() has the same as a dict that is written as JSON, and compare() lists the phases and
+functions that got slower per cycle than in a baseline file of an earlier run.
+"""
+import contextlib
+import os
+import sys
+import threading
+import time
+
+
+PHASES = ('api', 'ssh', 'parse', 'analytics', 'render', 'store')
+
+# One profiler at a time per process, recording all threads (sys.monitoring)
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+_profiler = None
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STDLIB = os.path.dirname(os.__file__)
+
+
+def phase(name):
+    """Context manager marking a phase of the cycle, a no-op unless a Profiler is running."""
+    profiler = _profiler
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
+
+
+def _short_path(path):
+    """File names relative to the repository or to site-packages, so that reports of different machines compare."""
+    index = path.rfind('site-packages' + os.sep)
+    if index >= 0:
+        return path[index + len('site-packages' + os.sep):]
+    for root in (_PACKAGE_ROOT, _STDLIB):
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root)
+    return path
+
+
+def _function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        # Built-in functions have no file
+        return name
+    return f"{_short_path(filename)}:{line}({name})"
+
+
+class Profiler:
+    """Profiles and traces allocations of the phases marked with phase() between start() and stop()."""
+
+    def __init__(self, top_n=15, trace_allocations=True):
+        self.top_n = top_n
+        self.trace_allocations = trace_allocations
+        self.cycles = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []         # (phase, cProfile.Profile) of every thread
+        self._wall_seconds = dict.fromkeys(PHASES, 0.0)
+        self._entries = dict.fromkeys(PHASES, 0)
+        self._timed_only = dict.fromkeys(PHASES, 0)
+        self._allocations = {}      # phase -> {site: [size, count]}
+        self._peaks = {}            # phase -> bytes
+        self._snapshot = None
+        self._baseline_memory = 0
+        self._started_at = None
+        self._started = None
+        self._elapsed = None
+        self._stats = {}
+
+    def start(self):
+        global _profiler
+        import tracemalloc
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            # Compile the filter patterns now, they would otherwise count as allocations of the first phase
+            import fnmatch
+            for snapshot_filter in self._filters():
+                fnmatch.fnmatch(snapshot_filter.filename_pattern, snapshot_filter.filename_pattern)
+        self._started_at = time.time()
+        self._started = time.perf_counter()
+        _profiler = self
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        import cProfile
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.profiles = {}
+        profiles = self._local.profiles
+        outermost_on_main = not stack and threading.current_thread() is threading.main_thread()
+        if stack and stack[-1][1] is not None:
+            stack[-1][1].disable()
+        profile = profiles.get(name)
+        if profile is None:
+            profile = profiles[name] = cProfile.Profile()
+            with self._lock:
+                self._profiles.append((name, profile))
+        if outermost_on_main:
+            self._begin_allocations()
+        started = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            # PROCESS_WIDE: another thread's phase holds the profiler, which records this thread's functions too
+            profile = None
+            with self._lock:
+                self._timed_only[name] += 1
+        stack.append((name, profile))
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            stack.pop()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._wall_seconds[name] += elapsed
+                self._entries[name] += 1
+            if outermost_on_main:
+                self._end_allocations(name)
+            if stack and stack[-1][1] is not None:
+                try:
+                    stack[-1][1].enable()
+                except ValueError:
+                    pass
+
+    def _begin_allocations(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        self._snapshot = self._take_snapshot()
+        tracemalloc.reset_peak()
+        self._baseline_memory = tracemalloc.get_traced_memory()[0]
+
+    def _end_allocations(self, name):
+        import tracemalloc
+        if self._snapshot is None or not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1] - self._baseline_memory
+        self._peaks[name] = max(self._peaks.get(name, 0), peak)
+        sites = self._allocations.setdefault(name, {})
+        for difference in self._take_snapshot().compare_to(self._snapshot, 'lineno'):
+            if difference.size_diff or difference.count_diff:
+                frame = difference.traceback[0]
+                site = sites.setdefault(f"{_short_path(frame.filename)}:{frame.lineno}", [0, 0])
+                site[0] += difference.size_diff
+                site[1] += difference.count_diff
+        self._snapshot = None
+
+    @staticmethod
+    def _filters():
+        import tracemalloc
+        # The profiler's own bookkeeping is not part of any phase
+        return (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'), tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+                tracemalloc.Filter(False, '<unknown>'))
+
+    def _take_snapshot(self):
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces(self._filters())
+
+    def stop(self):
+        """Stop profiling and merge the profiles of all threads."""
+        global _profiler
+        import pstats
+        import tracemalloc
+        if _profiler is self:
+            _profiler = None
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._elapsed = time.perf_counter() - self._started
+        with self._lock:
+            profiles = list(self._profiles)
+        for name, profile in profiles:
+            # A profile that never collected anything cannot be loaded into pstats
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+
+    def data(self):
+        """The results as a dict of plain values (see the module docstring)."""
+        phases = {}
+        for name in PHASES:
+            if not self._entries[name]:
+                continue
+            entry = {'entries': self._entries[name], 'wall_seconds': round(self._wall_seconds[name], 6)}
+            if self._timed_only[name]:
+                entry['timed_only_entries'] = self._timed_only[name]
+            stats = self._stats.get(name)
+            if stats is not None:
+                entry['cpu_seconds'] = round(stats.total_tt, 6)
+                # By own time: the functions whose code is hot, not those that call it
+                functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top_n]
+                entry['functions'] = [{'function': _function_name(key), 'calls': calls, 'own_seconds': round(own, 6),
+                                       'cumulative_seconds': round(cumulative, 6)}
+                                      for key, (_, calls, own, cumulative, _) in functions]
+            if name in self._allocations:
+                sites = sorted(self._allocations[name].items(), key=lambda item: abs(item[1][0]), reverse=True)[:self.top_n]
+                entry['allocations'] = {'peak_bytes': self._peaks.get(name, 0),
+                                        'net_bytes': sum(size for size, _ in self._allocations[name].values()),
+                                        'sites': [{'site': site, 'net_bytes': size, 'net_blocks': count} for site, (size, count) in sites]}
+            phases[name] = entry
+        return {'version': 1, 'started_at': self._started_at, 'elapsed_seconds': round(self._elapsed or 0.0, 6), 'cycles': self.cycles,
+                'python': sys.version.split()[0], 'process_wide_profiler': PROCESS_WIDE, 'argv': sys.argv[1:], 'phases': phases}
+
+    def text(self):
+        """A short report of the top functions and allocation sites per phase."""
+        data = self.data()
+        lines = [f"Profile of {data['cycles']} cycle{'s' if data['cycles'] != 1 else ''} over {data['elapsed_seconds']:.1f} s "
+                 f"(wall time includes profiling overhead)"]
+        if any('timed_only_entries' in entry for entry in data['phases'].values()):
+            lines.append(f"Python {data['python']} runs one profiler for all threads. Entries 'timed only' could not enable their own profile,")
+            lines.append("their functions are counted in the phase that held it (the workers' parse functions under ssh).")
+        for name, entry in data['phases'].items():
+            lines.append("")
+            summary = f"== {name}: {entry['entries']} entries, {entry['wall_seconds']:.3f} s wall"
+            if 'cpu_seconds' in entry:
+                summary += f", {entry['cpu_seconds']:.3f} s profiled"
+            if 'timed_only_entries' in entry:
+                summary += f", {entry['timed_only_entries']} entries timed only"
+            lines.append(summary)
+            if entry.get('functions'):
+                lines.append(f"   {'calls':>9} {'own s':>9} {'cum s':>9}  function")
+                for function in entry['functions']:
+                    lines.append(f"   {function['calls']:>9} {function['own_seconds']:>9.4f} {function['cumulative_seconds']:>9.4f}  {function['function']}")
+            allocations = entry.get('allocations')
+            if allocations:
+                lines.append(f"   allocations: peak {allocations['peak_bytes'] / 1024:.1f} KiB, net {allocations['net_bytes'] / 1024:+.1f} KiB")
+                for site in allocations['sites']:
+                    lines.append(f"   {site['net_bytes'] / 1024:>+12.1f} KiB {site['net_blocks']:>+8} blocks  {site['site']}")
+        return "\n".join(lines)
+
+    def write(self, directory):
+        """Write the text report and the JSON data to directory, returns their paths."""
+        import datetime
+        import json
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"profile-{datetime.datetime.fromtimestamp(self._started_at):%Y%m%d-%H%M%S}")
+        with open(base + '.txt', 'w') as f:
+            f.write(self.text() + "\n")
+        with open(base + '.json', 'w') as f:
+            json.dump(self.data(), f, indent=1, sort_keys=True)
+        return base + '.txt', base + '.json'
+
+
+def compare(baseline, current, tolerance=0.2, min_seconds=0.005):
+    """Return lines describing what got slower per cycle in current than in baseline (both from Profiler.data()).
+
+    A phase or function is listed when its time per cycle grew by more than tolerance (relative) and by
+    more than min_seconds. Functions are compared by own time.
+    """
+    def per_cycle(data, seconds):
+        return seconds / max(1, data['cycles'])
+
+    lines = []
+    for name, entry in current['phases'].items():
+        old_entry = baseline['phases'].get(name)
+        if old_entry is None:
+            continue
+        for key in ('cpu_seconds', 'wall_seconds'):
+            if key in entry and key in old_entry:
+                old, new = per_cycle(baseline, old_entry[key]), per_cycle(current, entry[key])
+                if new - old > min_seconds and new > old * (1 + tolerance):
+                    lines.append(f"{name}: {key.replace('_seconds', '')} {old:.4f} s -> {new:.4f} s per cycle ({new / old - 1:+.0%})"
+                                 if old > 0 else f"{name}: {key.replace('_seconds', '')} 0 s -> {new:.4f} s per cycle")
+        old_functions = {function['function']: function for function in old_entry.get('functions', ())}
+        for function in entry.get('functions', ()):
+            new = per_cycle(current, function['own_seconds'])
+            old_function = old_functions.get(function['function'])
+            old = per_cycle(baseline, old_function['own_seconds']) if old_function is not None else 0.0
+            if new - old > min_seconds and new > old * (1 + tolerance):
+                lines.append(f"{name}: {function['function']} {old:.4f} s -> {new:.4f} s own time per cycle"
+                             + ("" if old_function is not None else " (not in the baseline's top functions)"))
+    return lines
@@ -0,0 +1,110 @@
+"""Collector that runs on an instance and prints one compact JSON summary of it.
+
+check_bot ships this file over the existing SSH connection as a compressed `python3 -c` command (see
+collector.agent_command()), so it only uses the standard library and runs on any Python 3. It reads
+the end of miner.log on the host, parses the 'Mining:' lines there and prints a single line:
+
+    {"v": 1, "inode": 1234, "size": 567890,
+     "latest": [runtime_seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty],
+     "window": [mean_hash_rate, normal_blocks_per_hour, covered_seconds, samples],
+     "gpus": [[index, utilization_percent, power_watts, sm_clock_mhz, memory_clock_mhz, temperature_c], ...]}
+
+"latest" is null when no 'Mining:' line was found, "window" when fewer than two samples cover it, and
+"gpus" when nvidia-smi is not available (a null reading is one nvidia-smi reported as N/A). If the log
+cannot be read, "error" holds the reason.
+
+Usage: python3 remote_agent.py LOG_PATH WINDOW_SECONDS SCAN_BYTES
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+ANSI_ESCAPE_PATTERN = re.compile(rb'\x1B[@-_][0-?]*[ -/]*[@-~]')
+
+# Kept identical to check_bot.log_parser.MINING_PATTERN, which cannot be imported on the host
+MINING_PATTERN = re.compile(rb'Mining:.*\[(?:(\d+):)?(\d+):(\d+)(?:\.\d+)?,.*?(?:Details=(?:(?:super:(\d+)\s)?normal:(\d+)|xuni:(\d+)).*?)?HashRate:(\d+\.\d+).*Difficulty=(\d+)')
+
+NVIDIA_SMI_QUERY = 'index,utilization.gpu,power.draw,clocks.sm,clocks.mem,temperature.gpu'
+
+
+def read_end(path, scan_bytes):
+    """Return (inode, size, data) with the complete lines among the last scan_bytes of the file."""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        start = max(0, stat.st_size - scan_bytes)
+        f.seek(start)
+        data = f.read(scan_bytes)
+    data = data.replace(b'\r', b'\n')
+    if start:
+        # The first line is cut off
+        data = data[data.find(b'\n') + 1:]
+    return stat.st_ino, stat.st_size, data[:data.rfind(b'\n') + 1]
+
+
+def parse(data):
+    """Return the samples in data as (runtime_seconds, super, normal, xuni, hash_rate, difficulty) tuples."""
+    if b'\x1b' in data:
+        data = ANSI_ESCAPE_PATTERN.sub(b'', data)
+    samples = []
+    for hours, minutes, seconds, super_blocks, normal_blocks, xuni_blocks, hash_rate, difficulty in MINING_PATTERN.findall(data):
+        samples.append((int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds), int(super_blocks or 0), int(normal_blocks or 0),
+                        int(xuni_blocks or 0), float(hash_rate), int(difficulty)))
+    return samples
+
+
+def window_rates(samples, window_seconds):
+    """Mean hash rate and normal blocks per hour over the last window_seconds of miner runtime, or None."""
+    # Only samples since the last miner restart, when the runtime started over
+    start = len(samples) - 1
+    while start > 0 and samples[start - 1][0] <= samples[start][0] and samples[start - 1][0] >= samples[-1][0] - window_seconds:
+        start -= 1
+    window = samples[start:]
+    elapsed = window[-1][0] - window[0][0]
+    if len(window) < 2 or elapsed <= 0:
+        return None
+    mean_hash_rate = sum(sample[4] for sample in window) / len(window)
+    return [mean_hash_rate, (window[-1][2] - window[0][2]) * 3600.0 / elapsed, elapsed, len(window)]
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None  # '[N/A]' or '[Not Supported]'
+
+
+def gpu_readings():
+    """Per-GPU readings from nvidia-smi, or None if it is missing or fails."""
+    try:
+        output = subprocess.check_output(['nvidia-smi', '--query-gpu=' + NVIDIA_SMI_QUERY, '--format=csv,noheader,nounits'],
+                                         stderr=subprocess.DEVNULL, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    gpus = []
+    for line in output.decode(errors='replace').splitlines():
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) == 6:
+            gpus.append([_number(field) for field in fields])
+    return gpus
+
+
+def main(argv):
+    log_path, window_seconds, scan_bytes = argv[0], int(argv[1]), int(argv[2])
+    record = {'v': 1}
+    try:
+        record['inode'], record['size'], data = read_end(log_path, scan_bytes)
+    except OSError as e:
+        record['error'] = '%s cannot be read: %s' % (log_path, e.strerror)
+        data = b''
+    samples = parse(data)
+    record['latest'] = list(samples[-1]) if samples else None
+    record['window'] = window_rates(samples, window_seconds) if samples else None
+    record['gpus'] = gpu_readings()
+    sys.stdout.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
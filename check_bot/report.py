@@ -0,0 +1,345 @@
+"""Performance table, fleet totals and hash rate outliers."""
+import bisect
+import datetime
+import logging
+
+import numpy as np
+from prettytable import PrettyTable
+
+from . import config, fleet_analytics
+
+
+def print_table(data, mean_difficulty, average_dollars_per_normal_block, total_dph_running_machines, usd_per_gpu, hash_rate_per_gpu, hash_rate_per_usd, label, sum_normal_block_per_hour, total_hash_rate, total_gpus_running, output_file=None, ages=None):
+    if not data:  # If data list is empty, do not proceed.
+        print("No data to print.")
+        return
+    # Define the table and its columns
+    table = PrettyTable()
+    field_names = ["Instance ID", "GPU Name", "GPU's", "Util.%", "USD/h", "USD/GPU", "Inst.H/s", "GPU H/s", "XNM Blocks", "Runtime", "Block/h", "H/s/USD", "USD/Block", "Label"]
+
+    # Rows with cached values (ages maps their instance IDs to the seconds since they were read) get an Age column
+    ages = ages or {}
+    show_ages = any(row[0] in ages for row in data)
+    table.field_names = field_names + ["Age"] if show_ages else field_names
+
+    # Add rows to the table, with missing values as 'N/A'
+    for row in data:
+        row = [display_value(value) for value in row]
+        table.add_row(row + [format_age(ages[row[0]]) if row[0] in ages else ''] if show_ages else row)
+
+    # Get current timestamp
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Print the table
+    try:
+        if mean_difficulty is not None:
+            difficulty = int(mean_difficulty)
+        else:
+            difficulty = "N/A"
+        
+        total_hash_rate_str = f"{total_hash_rate:.2f} h/s" if total_hash_rate is not None else "N/A"
+        total_dph_running_machines_str = f"{total_dph_running_machines:.4f}$" if total_dph_running_machines is not None else "N/A"
+        average_dollars_per_normal_block_str = f"{average_dollars_per_normal_block:.4f}$" if average_dollars_per_normal_block is not None else "N/A"
+        sum_normal_block_per_hour_str = f"{sum_normal_block_per_hour:.2f}" if sum_normal_block_per_hour is not None else "N/A"
+        
+        print("")
+        print(f"\nTimestamp: {timestamp}, GPU's: {total_gpus_running}, Difficulty: {difficulty}, Total Hash: {total_hash_rate_str}, Total DPH: {total_dph_running_machines_str}, Avg_$/Block: {average_dollars_per_normal_block_str}, Total Blocks/h: {sum_normal_block_per_hour_str}")
+        print(table)
+    except TypeError as e:
+        print(f"Error printing table: {e}")
+
+    # Write the table and timestamp to a text file
+    if output_file:
+        with open(output_file, 'a') as f:
+            try:
+                f.write(f"Timestamp: {timestamp}, GPU's: {total_gpus_running}, Difficulty: {difficulty}, Total Hash: {total_hash_rate_str}, Total DPH: {total_dph_running_machines_str}, Avg_$/Block: {average_dollars_per_normal_block_str}, Total Blocks/h: {sum_normal_block_per_hour_str}\n{table}\n")
+            except TypeError as e:
+                print(f"Error writing to file: {e}")
+
+        print(f"Table also written to {output_file}\n")
+
+
+# Function to format the age of cached values, e.g. '45s', '12m' or '3h'
+def format_age(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds / 3600:.0f}h"
+
+
+# Function to check for missing table values, which are NaN (or None)
+def is_missing(value):
+    return value is None or value != value
+
+
+# Function to show a table value, with missing values as 'N/A'
+def display_value(value):
+    return 'N/A' if is_missing(value) else value
+
+
+# Function to sort table rows in place by one column, numerically where possible, with missing values first
+def sort_rows(table_data, column, descending=False):
+    try:
+        # Convert the sort column to float if possible for proper numeric sorting
+        table_data.sort(key=lambda x: (float(x[column]) if not is_missing(x[column]) else float('-inf'), x[0]),
+                        reverse=descending)
+    except (ValueError, TypeError):
+        # Fallback to string sorting if conversion to float is not possible
+        table_data.sort(key=lambda x: (str(x[column]) if not is_missing(x[column]) else '', x[0]),
+                        reverse=descending)
+
+
+# Function to turn the instance list and log information into table rows and fleet totals
+def build_table_data(ssh_info_list, log_info_list, log_tails=None):
+    return fleet_table_data(*fleet_analytics.build_fleet(ssh_info_list, log_info_list, log_tails))
+
+
+# Fleet columns of the table rows, in the column order of print_table() (the label follows them)
+ROW_COLUMNS = ('instance_id', 'gpu_type', 'num_gpus', 'gpu_util', 'dph_total', 'usd_per_gpu', 'hash_rate', 'hash_rate_per_gpu', 'normal_blocks',
+               'runtime_hours', 'normal_block_per_hour', 'hash_rate_per_usd', 'dollars_per_normal_block')
+
+
+# Function to turn rows of a fleet array and their labels into table rows
+def table_rows(rows, labels, gpu_types):
+    row_columns = zip(*(rows[name].tolist() for name in ROW_COLUMNS))
+    table_data = []
+    for (instance_id, gpu_code, num_gpus, gpu_util, dph_total, usd_per_gpu, hash_rate, hash_rate_per_gpu, normal_blocks, runtime_hours,
+         normal_block_per_hour, hash_rate_per_usd, dollars_per_normal_block), label in zip(row_columns, labels):
+        table_data.append([instance_id, gpu_types[gpu_code], int(num_gpus) if num_gpus == num_gpus else num_gpus, round(gpu_util, 2),
+                           round(dph_total, 4), round(usd_per_gpu, 4), hash_rate, hash_rate_per_gpu,
+                           int(normal_blocks), round(runtime_hours, 2), round(normal_block_per_hour, 2), round(hash_rate_per_usd, 2),
+                           round(dollars_per_normal_block, 2), label])
+    return table_data
+
+
+# Function to return the sort key of sort_rows() for one row
+def sort_key(row, column, numeric):
+    if is_missing(row[column]):
+        return (float('-inf') if numeric else '', row[0])
+    return (float(row[column]) if numeric else str(row[column]), row[0])
+
+
+# Function to check whether sort_rows() can sort a table value numerically
+def is_numeric(value):
+    try:
+        float(value)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+class TableRows:
+    """The table rows of watch mode, kept sorted across cycles.
+
+    update() compares the rows of the fleet array with those of the last cycle and builds table rows only
+    for the instances whose values changed. Those are moved to their place in the sorted table by
+    bisection, the others keep their row and their place, so an unchanged instance costs neither
+    formatting nor a sort key. When many rows changed, or the sort did, the table is sorted again as a
+    whole. The order is the one of sort_rows().
+    """
+
+    def __init__(self):
+        self._values = None     # rows of the fleet array of the last cycle
+        self._labels = None     # their labels
+        self._gpu_types = []
+        self._rows = {}         # instance_id -> table row
+        self._keys = []         # sort keys of the sorted rows, ascending
+        self._sorted = []       # table rows in the order of _keys
+        self._sort = None       # (column, numeric) of the keys
+        self._text = set()      # instance IDs whose value in the sort column is not a number
+
+    def _unchanged(self, rows, labels, gpu_types):
+        """Return a mask of the rows whose table row of the last cycle is still valid."""
+        if self._values is None or gpu_types[:len(self._gpu_types)] != self._gpu_types:
+            return np.zeros(len(rows), dtype=bool)
+        ids = rows['instance_id']
+        if len(self._values) == len(rows) and np.array_equal(self._values['instance_id'], ids):
+            index = np.arange(len(rows))
+        else:
+            position = {instance_id: i for i, instance_id in enumerate(self._values['instance_id'].tolist())}
+            index = np.fromiter((position.get(instance_id, -1) for instance_id in ids.tolist()), np.intp, len(rows))
+        unchanged = index >= 0
+        index = np.where(unchanged, index, 0)
+        previous = self._values[index]
+        for name in ROW_COLUMNS:
+            same = rows[name] == previous[name]
+            if rows.dtype[name].kind == 'f':
+                same |= np.isnan(rows[name]) & np.isnan(previous[name])
+            unchanged &= same
+        return unchanged & (labels == self._labels[index])
+
+    def _sort_all(self, column):
+        rows = self._rows.values()
+        self._text = {row[0] for row in rows if not is_missing(row[column]) and not is_numeric(row[column])}
+        numeric = not self._text
+        keyed = sorted((sort_key(row, column, numeric), row) for row in rows)
+        self._keys = [key for key, _ in keyed]
+        self._sorted = [row for _, row in keyed]
+        self._sort = (column, numeric)
+
+    def update(self, rows, labels, gpu_types, column=None, descending=False):
+        """Return the table rows of rows (a fleet array of parsed instances), sorted by column unless it is None."""
+        labels = np.array(labels, dtype=object)
+        unchanged = self._unchanged(rows, labels, gpu_types)
+        changed = table_rows(rows[~unchanged], labels[~unchanged].tolist(), gpu_types)
+        ids = rows['instance_id'].tolist()
+        # The old rows of changed instances and those of instances that left
+        stale = [self._rows[instance_id] for instance_id in set(self._rows).difference(ids)]
+        stale += [self._rows[row[0]] for row in changed if row[0] in self._rows]
+        for row in stale:
+            del self._rows[row[0]]
+        for row in changed:
+            self._rows[row[0]] = row
+        self._values, self._labels, self._gpu_types = rows, labels, list(gpu_types)
+
+        if column is None:
+            self._sort = None
+            return [self._rows[instance_id] for instance_id in ids]
+
+        if self._sort is not None and self._sort[0] == column and len(stale) + len(changed) <= len(self._rows) // 8:
+            numeric = self._sort[1]
+            for row in stale:
+                index = bisect.bisect_left(self._keys, sort_key(row, column, numeric))
+                del self._keys[index]
+                del self._sorted[index]
+                self._text.discard(row[0])
+            for row in changed:
+                if not is_missing(row[column]) and not is_numeric(row[column]):
+                    self._text.add(row[0])
+            if numeric == (not self._text):
+                for row in changed:
+                    key = sort_key(row, column, numeric)
+                    index = bisect.bisect_left(self._keys, key)
+                    self._keys.insert(index, key)
+                    self._sorted.insert(index, row)
+            else:
+                # The sort column went from numbers to text or back
+                self._sort_all(column)
+        else:
+            self._sort_all(column)
+        return self._sorted[::-1] if descending else list(self._sorted)
+
+
+# Function to turn a fleet array (see fleet_analytics.py) into table rows and fleet totals. Missing values are NaN.
+# table is the TableRows of the last cycles in watch mode, None to build all rows.
+def fleet_table_data(fleet, gpu_types, labels, table=None):
+    fleet_analytics.derive_columns(fleet)
+    parsed = fleet['parsed']
+
+    for instance_id in fleet['instance_id'][~parsed].tolist():
+        logging.error("Failed to retrieve log information or normal blocks is None for instance ID: %s", instance_id)
+
+    # Warning if instance is running but GPU not fully utilized
+    underutilized = fleet['running'] & (fleet['gpu_util'] < 85)
+    gpu_util_warnings_set = {f"GPU Utilization for instance {instance_id} is at {gpu_util:.2f}% - Make sure XENGPUMiner is working!"
+                             for instance_id, gpu_util in zip(fleet['instance_id'][underutilized].tolist(), fleet['gpu_util'][underutilized].tolist())}
+
+    # Fleet totals over the instances whose log could be parsed
+    difficulties = fleet['difficulty'][parsed & (fleet['difficulty'] > 0)]
+    hash_rates = fleet['hash_rate'][parsed & (fleet['hash_rate'] > 0)]
+    dollars_per_normal_block_values = fleet['dollars_per_normal_block'][parsed & (fleet['dollars_per_normal_block'] > 0)]
+    mean_difficulty = float(difficulties.mean()) if difficulties.size else None
+    total_hash_rate = float(hash_rates.sum())
+    sum_normal_block_per_hour = float(fleet['normal_block_per_hour'][parsed].sum())
+    average_dollars_per_normal_block = float(dollars_per_normal_block_values.mean()) if dollars_per_normal_block_values.size else None
+    if mean_difficulty is None:
+        logging.info("No valid difficulties were found.")
+    if not hash_rates.size:
+        logging.info("No valid HashRate were found.")
+    if average_dollars_per_normal_block is None:
+        logging.info("No valid $/Block values were found.")
+    difficulty_by_instance = dict(zip(fleet['instance_id'][parsed].tolist(), fleet['difficulty'][parsed].tolist()))
+
+    # One table row per parsed instance, sorted by "<column_name>" in asc or desc order
+    rows = fleet[parsed]
+    row_labels = [label for label, ok in zip(labels, parsed.tolist()) if ok]
+    sort_column = config.sort_column_index
+    if not len(rows):
+        logging.error("table_data is empty!")
+    elif sort_column < 0 or sort_column > len(ROW_COLUMNS):
+        logging.error("Invalid sort_column_index: {}. Must be between 0 and {}.".format(sort_column, len(ROW_COLUMNS)))
+        sort_column = None
+    table = table if table is not None else TableRows()
+    table_data = table.update(rows, row_labels, gpu_types, sort_column, config.sort_order == 'descending')
+
+    last = table_data[-1] if table_data else None
+    return {
+        'table_data': table_data,
+        'fleet': fleet,
+        'gpu_types': gpu_types,
+        'gpu_util_warnings_set': gpu_util_warnings_set,
+        'mean_difficulty': mean_difficulty,
+        'average_dollars_per_normal_block': average_dollars_per_normal_block,
+        'sum_normal_block_per_hour': sum_normal_block_per_hour,
+        'total_hash_rate': total_hash_rate,
+        'usd_per_gpu': last[5] if last else None,
+        'hash_rate_per_gpu': last[7] if last else None,
+        'hash_rate_per_usd': last[11] if last else None,
+        'label': last[13] if last else None,
+        'difficulty_by_instance': difficulty_by_instance,
+    }
+
+
+# Function to print utilization warnings and hash rate outliers per GPU type
+def report_outliers(fleet, gpu_types, gpu_util_warnings_set, regressions=None):
+    """regressions optionally maps GPU type indices to messages of the streaming anomaly detectors."""
+    regressions = regressions or {}
+    # Calculate per-GPU hash rate statistics and Z-Scores for all GPU types in one pass
+    robust = config.outlier_statistics == 'median'
+    center, spread, counts, z_scores = fleet_analytics.find_outliers(fleet, len(gpu_types), config.threshold, robust=robust)
+    below = z_scores < -config.threshold
+
+    # Print Warnings if GPU not fully utilized
+    for warning in gpu_util_warnings_set:
+        logging.warning(warning)
+    print("\n" + "-" * 60 )  # Print a blank line for visual separation if there were any warnings     
+
+    # Print Outliers and Stats
+    insufficient_data_messages = []  # List to store messages for insufficient data
+    for gpu_code, gpu_type in enumerate(gpu_types):  # Iterate through all GPU types
+        if counts[gpu_code] == 0:
+            continue
+
+        if counts[gpu_code] > 1:
+            mean = center[gpu_code]
+            std_dev = spread[gpu_code]
+            print(f"\n** {gpu_type} Performance Stats: **")
+            if robust:
+                print(f"- Median hash rate: {mean:.2f} H/s, Deviation (scaled MAD): {std_dev:.2f} H/s")
+            else:
+                print(f"- Average hash rate: {mean:.2f} H/s, Standard deviation: {std_dev:.2f} H/s")
+
+            outlier_mask = below & (fleet['gpu_type'] == gpu_code)
+            if outlier_mask.any():
+                # Sort the highlighted outliers by Z-Score from lowest to highest (worst to best)
+                order = np.argsort(z_scores[outlier_mask], kind='stable')
+                sorted_outliers = zip(fleet['instance_id'][outlier_mask][order].tolist(),
+                                      fleet['hash_rate_per_gpu'][outlier_mask][order].tolist(),
+                                      z_scores[outlier_mask][order].tolist())
+                
+                print("- Note: Some instances are below the average hash rate:")
+                for ID, h_rate, z_score in sorted_outliers:
+                    percent_from_mean = (mean - h_rate) / mean * 100  # Calculate the percentage from the mean here
+                    print(f"  - Instance ID {ID}: {h_rate:.2f}H/s, {percent_from_mean:.2f}% below average, Variance: {z_score:.2f} Z-Score")
+                print()
+            else:
+                # Check the standard deviation and print an additional message if needed
+                print("- All instances are performing within expected range.")
+                if std_dev > 50:
+                    print(f"  (!) Warning: Alarming deviation for {gpu_type} above 50 H/s! Consider lowering the Z-Score threshold in User configuration and re-run script for more details.")
+        else:
+            insufficient_data_messages.append(f"** {gpu_type}: ** Not enough data to measure performance stats.")
+            if regressions.get(gpu_code):
+                print(f"\n** {gpu_type}: **")
+
+        if regressions.get(gpu_code):
+            print("- Sustained regressions over the last polls:")
+            for message in regressions[gpu_code]:
+                print(f"  - {message}")
+            print()
+
+    # Print messages for insufficient data at the end
+    print("\n" + "-" * 60 + "\n")
+    for message in insufficient_data_messages:
+        print(message)
@@ -0,0 +1,155 @@
+"""Which instances to poll in a cycle, and in which order.
+
+Each instance has a poll interval. Instances that were anomalous or whose hash rate changed within the
+last hot_seconds are hot and polled every cycle, steady ones every steady_interval seconds. Due instances
+are polled most overdue first, so when the cycle deadline cuts the collection short, the instances left
+out are the ones with the freshest data. Instances that are not running are not polled at all.
+
+Instances that fail to answer back off: after the n-th failed poll in a row the next one waits
+backoff_base * 2**(n-1) seconds (with jitter), at most backoff_max. After failure_threshold failures in a
+row the circuit of the instance opens and it is only tried every backoff_max seconds, one poll at a time,
+until it answers again.
+"""
+import logging
+import random
+import threading
+import time
+
+from . import instrumentation
+
+
+class HostSchedule:
+    """Polling state of one instance."""
+
+    def __init__(self):
+        self.last_polled = None  # time.monotonic() of the last answer, None before the first one
+        self.hot_until = 0.0     # polled every cycle until then
+        self.failures = 0        # failed polls in a row
+        self.retry_at = 0.0      # not polled before then while backing off
+        self.in_flight = False   # being polled, possibly beyond the deadline of the cycle that started it
+        self.hash_rate = None    # hash rate of the last answer, to notice changes
+
+
+class PollScheduler:
+    """Staleness-based poll planning with per-instance backoff and circuit breakers.
+
+    plan() picks the instances to poll in a cycle, record() is called with the result of every poll,
+    from the collection threads, and mark_hot() with the instances the anomaly detectors reported.
+    """
+
+    def __init__(self, steady_interval=300, hot_seconds=900, change_tolerance=0.05, backoff_base=30, backoff_max=600,
+                 failure_threshold=3):
+        self.steady_interval = steady_interval
+        self.hot_seconds = hot_seconds
+        self.change_tolerance = change_tolerance
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.hosts = {}  # instance_id -> HostSchedule
+        self.open_circuits = 0
+        self._lock = threading.Lock()
+
+    def _host(self, instance_id):
+        host = self.hosts.get(instance_id)
+        if host is None:
+            host = self.hosts[instance_id] = HostSchedule()
+        return host
+
+    def interval(self, host, now):
+        return 0 if now < host.hot_until else self.steady_interval
+
+    def plan(self, ssh_info_list, now=None):
+        """Return the instances of ssh_info_list to poll now, most overdue first, and mark them in flight."""
+        now = time.monotonic() if now is None else now
+        due = []
+        skipped = {}
+        with self._lock:
+            for ssh_info in ssh_info_list:
+                if str(ssh_info['actual_status']).lower() != 'running':
+                    skipped['not_running'] = skipped.get('not_running', 0) + 1
+                    continue
+                host = self._host(ssh_info['instance_id'])
+                if host.in_flight:
+                    reason = 'in_flight'
+                elif now < host.retry_at:
+                    reason = 'circuit_open' if host.failures >= self.failure_threshold else 'backoff'
+                elif host.last_polled is None:
+                    due.append((float('inf'), ssh_info))
+                    continue
+                elif host.failures:
+                    # Retried as soon as its backoff has passed
+                    due.append((now - host.retry_at, ssh_info))
+                    continue
+                elif now - host.last_polled >= self.interval(host, now):
+                    # Seconds overdue: a steady instance that keeps missing the deadline catches up with the hot ones
+                    due.append((now - host.last_polled - self.interval(host, now), ssh_info))
+                    continue
+                else:
+                    reason = 'not_due'
+                skipped[reason] = skipped.get(reason, 0) + 1
+            due.sort(key=lambda item: item[0], reverse=True)
+            for _, ssh_info in due:
+                self.hosts[ssh_info['instance_id']].in_flight = True
+        for reason, count in skipped.items():
+            instrumentation.POLLS_SKIPPED.labels(reason).inc(count)
+        if skipped:
+            logging.info("Polling %d instances, skipping %s", len(due), ", ".join(f"{count} {reason}" for reason, count in sorted(skipped.items())))
+        return [ssh_info for _, ssh_info in due]
+
+    def record(self, instance_id, hash_rate, answered=True, now=None):
+        """Record the end of a poll started by plan(). hash_rate is None when the poll failed, answered
+        is False when it was cancelled before it started."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            host = self._host(instance_id)
+            host.in_flight = False
+            if not answered:
+                return
+            host.last_polled = now
+            was_open = host.failures >= self.failure_threshold
+            if hash_rate is None:
+                host.failures += 1
+                if host.failures >= self.failure_threshold:
+                    delay = self.backoff_max
+                    if host.failures == self.failure_threshold:
+                        logging.warning("Instance %s failed %d polls in a row, polling it every %d seconds until it answers.",
+                                        instance_id, host.failures, self.backoff_max)
+                else:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (host.failures - 1))
+                # Jitter keeps instances that failed together from being retried together
+                host.retry_at = now + delay * random.uniform(0.5, 1.0)
+            else:
+                if host.failures >= self.failure_threshold:
+                    logging.info("Instance %s answers again after %d failed polls.", instance_id, host.failures)
+                host.failures = 0
+                host.retry_at = 0.0
+                if host.hash_rate is not None and abs(hash_rate - host.hash_rate) > self.change_tolerance * host.hash_rate:
+                    host.hot_until = now + self.hot_seconds
+                host.hash_rate = hash_rate
+            self.open_circuits += (host.failures >= self.failure_threshold) - was_open
+            instrumentation.OPEN_CIRCUITS.set(self.open_circuits)
+
+    def failures(self, instance_id):
+        """Failed polls of the instance in a row."""
+        host = self.hosts.get(instance_id)
+        return host.failures if host is not None else 0
+
+    def in_flight(self):
+        """Instance IDs whose poll has not ended yet."""
+        with self._lock:
+            return {instance_id for instance_id, host in self.hosts.items() if host.in_flight}
+
+    def mark_hot(self, instance_ids, now=None):
+        """Poll these instances every cycle for the next hot_seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for instance_id in instance_ids:
+                self._host(instance_id).hot_until = now + self.hot_seconds
+
+    def forget(self, current_instance_ids):
+        """Drop the state of instances that no longer exist."""
+        with self._lock:
+            for instance_id in list(self.hosts):
+                if instance_id not in current_instance_ids:
+                    self.open_circuits -= self.hosts.pop(instance_id).failures >= self.failure_threshold
+            instrumentation.OPEN_CIRCUITS.set(self.open_circuits)
@@ -0,0 +1,311 @@
+"""Sharded collection: several workers poll parts of the fleet, one coordinator merges their results.
+
+A worker is `collect --coordinator HOST:PORT`, optionally with --account (one of config.api_key_files)
+and --shard INDEX/COUNT, which polls only the instances whose ID modulo COUNT is INDEX (IDs that are not
+numbers go by their CRC-32). Workers can run as local processes or on separate machines. Instead of
+printing the table, a worker streams compact records to the coordinator over one TCP connection, as
+newline-delimited JSON:
+
+    {"t": "hello", "account": ..., "shard": [index, count], "token": ...}      first line of a connection
+    {"t": "instances", "dph": ..., "gpus": ..., "rows": [[id, gpu_name, dph_total, num_gpus, gpu_util, status, label], ...]}
+    {"t": "log", "id": ..., "v": [log_info], "r": [hash_rate, blocks_per_hour] or null, "u": gpu_util or null}
+    {"t": "cycle", "balance": ... or null, "warnings": [...], "regressions": {gpu_name: [...]}}
+
+The instance list of its partition is sent whenever the worker refreshes it, each log record as soon as
+the poll of that instance has finished, and a cycle record at the end of every cycle. Only shard 0 of
+each account fetches the balance. Records are sent from a background thread through a bounded queue, so
+a slow or unreachable coordinator never blocks collection; records that do not fit are dropped, and the
+instance list is sent again after reconnecting.
+
+The coordinator (`python -m check_bot coordinator`) keeps the last good values of every instance like
+the state cache does, and every --watch interval merges them into the same table, fleet totals,
+per-GPU-type stats and balance and runway, per account and for all accounts together, that a single
+collector prints. Shards that have not sent their instance list for state_cache_ttl seconds are dropped.
+"""
+import hmac
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+import zlib
+
+from . import instrumentation
+from .state_cache import StateCache
+
+
+def parse_address(address, default_port):
+    """Split 'host:port' (or 'host') into (host, port)."""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return port, default_port
+    return host, int(port)
+
+
+def parse_shard(shard):
+    """Split 'INDEX/COUNT' into (index, count)."""
+    index, _, count = shard.partition('/')
+    index, count = int(index), int(count or 1)
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be between 0 and {count - 1}, got {index}")
+    return index, count
+
+
+def in_shard(instance_id, shard):
+    if shard is None:
+        return True
+    try:
+        key = int(instance_id)
+    except (TypeError, ValueError):
+        # An instance without a numeric ID (instance_list() reports a missing one as 'N/A') still belongs to exactly one shard
+        key = zlib.crc32(str(instance_id).encode())
+    return key % shard[1] == shard[0]
+
+
+class ShardClient:
+    """Streams the results of one worker to the coordinator from a background thread."""
+
+    def __init__(self, address, account=None, shard=None, token=None, max_queued=10000, connect_timeout=10, retry_seconds=5):
+        self.address = address
+        self.hello = {'t': 'hello', 'account': account, 'shard': list(shard or (0, 1)), 'token': token}
+        self.connect_timeout = connect_timeout
+        self.retry_seconds = retry_seconds
+        self._queue = queue.Queue(max_queued)
+        self._instances_record = None  # sent again after reconnecting
+        self._instances_sent_for = None
+        self._socket = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='shard-client', daemon=True)
+        self._thread.start()
+
+    def _put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            instrumentation.SHARD_RECORDS_DROPPED.inc()
+
+    def send_instances(self, state):
+        """Send the instance list of the worker's partition if it was refreshed since it was last sent."""
+        if state.instances_refreshed_at is None or state.instances_refreshed_at == self._instances_sent_for:
+            return
+        self._instances_sent_for = state.instances_refreshed_at
+        rows = [[ssh_info['instance_id'], ssh_info['gpu_name'], ssh_info['dph_total'], ssh_info['num_gpus'], ssh_info['gpu_util'],
+                 ssh_info['actual_status'], ssh_info['label']] for ssh_info in state.ssh_info_list]
+        self._instances_record = {'t': 'instances', 'dph': state.total_dph_running_machines, 'gpus': state.total_gpus_running, 'rows': rows}
+        self._put(self._instances_record)
+
+    def send_log_info(self, ssh_info, log_info, log_tail=None):
+        """Send the result of one poll. Called from the collection threads."""
+        if log_info is None or log_info[4] is None or log_info[5] is None:
+            return
+        rates = log_tail.rates() if log_tail is not None else None
+        self._put({'t': 'log', 'id': ssh_info['instance_id'], 'v': list(log_info), 'r': list(rates) if rates is not None else None,
+                   'u': log_tail.gpu_util() if log_tail is not None else None})
+
+    def send_cycle(self, report):
+        """Send the balance and the warnings of a finished cycle (see monitor.run_cycle())."""
+        gpu_types = report['fleet']['gpu_types']
+        self._put({'t': 'cycle', 'balance': report['balance'], 'warnings': sorted(report['warnings']),
+                   'regressions': {gpu_types[gpu_code]: messages for gpu_code, messages in report['regressions'].items()}})
+
+    def _connect(self):
+        connection = socket.create_connection(self.address, timeout=self.connect_timeout)
+        connection.settimeout(None)
+        lines = [self.hello] + ([self._instances_record] if self._instances_record is not None else [])
+        connection.sendall(''.join(json.dumps(line, separators=(',', ':')) + '\n' for line in lines).encode())
+        logging.info("Connected to the coordinator at %s:%d.", *self.address)
+        return connection
+
+    def _run(self):
+        record = None
+        while True:
+            if record is None:
+                record = self._queue.get()
+                if record is None:
+                    break
+            try:
+                if self._socket is None:
+                    self._socket = self._connect()
+                    if record is self._instances_record:
+                        # Just sent along with the hello
+                        record = None
+                        continue
+                self._socket.sendall((json.dumps(record, separators=(',', ':')) + '\n').encode())
+                instrumentation.SHARD_RECORDS_SENT.inc()
+                record = None
+            except OSError as e:
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+                logging.warning("Failed to send to the coordinator at %s:%d: %s", self.address[0], self.address[1], e)
+                if self._stop.wait(self.retry_seconds):
+                    break
+        if self._socket is not None:
+            self._socket.close()
+
+    def close(self, timeout=5):
+        """Send what is queued, waiting at most timeout seconds, and disconnect."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._stop.set()
+
+
+class WindowRates:
+    """Window rates and GPU utilization that a worker measured, in place of its LogTail for build_table_data()."""
+
+    __slots__ = ('_rates', '_gpu_util')
+
+    def __init__(self, rates, gpu_util):
+        self._rates = tuple(rates) if rates is not None else None
+        self._gpu_util = gpu_util
+
+    def rates(self):
+        return self._rates
+
+    def gpu_util(self):
+        return self._gpu_util
+
+
+class Shard:
+    """What the coordinator knows about one worker."""
+
+    def __init__(self):
+        self.instances_at = None  # time.time() of the last instance list
+        self.ssh_info_list = []
+        self.total_dph_running_machines = 0
+        self.total_gpus_running = 0
+        self.warnings = ()
+        self.regressions = {}
+
+
+class Coordinator:
+    """Merges the records of the workers into one report per --watch interval.
+
+    Has the ssh_info_list, cache and totals attributes of MonitorState, so that the table functions of
+    monitor.py work on it.
+    """
+
+    def __init__(self, ttl=3600, token=None):
+        self.ttl = ttl
+        self.token = token
+        self.cache = StateCache(ttl=ttl)
+        self.shards = {}    # (account, (index, count)) -> Shard
+        self.balances = {}  # account -> balance
+        self.rates = {}     # instance_id -> WindowRates
+        self.received = set()  # instances with a log record since the last merge
+        self.ssh_info_list = []
+        self.total_dph_running_machines = 0
+        self.total_gpus_running = 0
+        self._lock = threading.Lock()
+
+    def accept(self, hello):
+        """Check the hello record of a new connection and return the key of its shard."""
+        if hello.get('t') != 'hello':
+            raise ValueError("the first record is not a hello")
+        if self.token is not None and not hmac.compare_digest(str(hello.get('token')), self.token):
+            raise ValueError("wrong shard_token")
+        index, count = hello['shard']
+        return hello['account'], (int(index), int(count))
+
+    def handle(self, key, record):
+        kind = record.get('t')
+        if kind == 'log':
+            self.cache.put_log_info(record['id'], record['v'])
+            with self._lock:
+                self.rates[record['id']] = WindowRates(record['r'], record['u'])
+                self.received.add(record['id'])
+            return
+        with self._lock:
+            shard = self.shards.get(key)
+            if shard is None:
+                shard = self.shards[key] = Shard()
+            if kind == 'instances':
+                previous_ids = {ssh_info['instance_id'] for ssh_info in shard.ssh_info_list}
+                shard.instances_at = time.time()
+                shard.ssh_info_list = [{'instance_id': instance_id, 'gpu_name': gpu_name, 'dph_total': dph_total, 'num_gpus': num_gpus,
+                                        'gpu_util': gpu_util, 'actual_status': actual_status, 'label': label, 'ssh_host': None, 'ssh_port': None}
+                                       for instance_id, gpu_name, dph_total, num_gpus, gpu_util, actual_status, label in record['rows']]
+                shard.total_dph_running_machines = record['dph']
+                shard.total_gpus_running = record['gpus']
+                gone = previous_ids - {ssh_info['instance_id'] for ssh_info in shard.ssh_info_list}
+            elif kind == 'cycle':
+                shard.warnings = tuple(record['warnings'])
+                shard.regressions = record['regressions']
+                if record['balance'] is not None:
+                    self.balances[key[0]] = record['balance']
+                return
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        if gone:
+            # Instances that left a shard are forgotten, unless another shard polls them now
+            with self._lock:
+                gone -= {ssh_info['instance_id'] for other in self.shards.values() for ssh_info in other.ssh_info_list}
+                for instance_id in gone:
+                    self.rates.pop(instance_id, None)
+            self.cache.discard(gone)
+
+    def merge(self):
+        """Merge the shards into the instance list and totals, dropping shards that went silent.
+
+        Returns (fresh, accounts, warnings, regressions): the instance IDs with a log record since the last
+        merge, account -> (balance, DPH of its running instances), and the warnings and regression
+        messages (by GPU type name) the workers reported in their last cycle.
+        """
+        oldest = time.time() - self.ttl
+        with self._lock:
+            for key, shard in list(self.shards.items()):
+                if shard.instances_at is None or shard.instances_at < oldest:
+                    if shard.instances_at is not None:
+                        logging.warning("No instance list from shard %s %d/%d for %d seconds, dropping it.", key[0], key[1][0], key[1][1], self.ttl)
+                    del self.shards[key]
+            self.ssh_info_list = [ssh_info for shard in self.shards.values() for ssh_info in shard.ssh_info_list]
+            self.total_dph_running_machines = sum(shard.total_dph_running_machines for shard in self.shards.values())
+            self.total_gpus_running = sum(shard.total_gpus_running for shard in self.shards.values())
+            accounts = {}
+            for (account, _), shard in self.shards.items():
+                balance, dph = accounts.get(account, (self.balances.get(account), 0))
+                accounts[account] = (balance, dph + shard.total_dph_running_machines)
+            warnings = {warning for shard in self.shards.values() for warning in shard.warnings}
+            regressions = {}
+            for shard in self.shards.values():
+                for gpu_name, messages in shard.regressions.items():
+                    regressions.setdefault(gpu_name, []).extend(messages)
+            fresh, self.received = self.received, set()
+        self.cache.evict()
+        return fresh, accounts, warnings, regressions
+
+
+def start_coordinator_server(coordinator, port, address='127.0.0.1'):
+    """Receive the records of the workers on address:port from daemon threads and return the server."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            peer = '%s:%d' % self.client_address[:2]
+            try:
+                key = coordinator.accept(json.loads(self.rfile.readline()))
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning("Rejected worker %s: %s", peer, e)
+                return
+            logging.info("Worker %s connected for shard %s %d/%d.", peer, key[0], key[1][0], key[1][1])
+            for line in self.rfile:
+                try:
+                    coordinator.handle(key, json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.warning("Ignoring a record from worker %s: %s", peer, e)
+                    continue
+                instrumentation.SHARD_RECORDS_RECEIVED.inc()
+            logging.info("Worker %s disconnected.", peer)
+
+    class Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    server = Server((address, port), Handler)
+    threading.Thread(target=server.serve_forever, name='coordinator', daemon=True).start()
+    logging.info("Coordinator listening on %s:%d", address, server.server_address[1])
+    return server
@@ -0,0 +1,184 @@
+"""Pool of authenticated SSH connections to the instances."""
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+import paramiko
+
+from . import instrumentation
+
+
+class SSHConnectionPool:
+    """Keeps authenticated SSH connections open between polls, keyed by (ssh_host, ssh_port, username).
+
+    The private key is loaded from disk once. Connections that dropped are re-established on the next
+    request, and idle ones are closed once they exceed idle_ttl or the pool grows past max_connections.
+    """
+
+    def __init__(self, private_key_path, passphrase=None, max_connections=1000, idle_ttl=900, keepalive_interval=30, connect_timeout=None,
+                 compress=False):
+        self.private_key_path = private_key_path
+        self.passphrase = passphrase
+        self.max_connections = max_connections
+        self.idle_ttl = idle_ttl
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.compress = compress  # zlib compression of the SSH transport, worth it for bulk transfers
+        self._key = None
+        self._lock = threading.Lock()
+        self._host_locks = {}  # pool_key -> [lock, threads holding or waiting for it], only while it has any
+        self._clients = OrderedDict()  # (ssh_host, ssh_port, username) -> (client, last_used), least recently used first
+
+    def _get_key(self):
+        # Raises paramiko's PasswordRequiredException / SSHException if the key cannot be loaded
+        with self._lock:
+            if self._key is None:
+                self._key = paramiko.Ed25519Key(filename=self.private_key_path, password=self.passphrase)
+            return self._key
+
+    @contextlib.contextmanager
+    def _host_lock(self, pool_key):
+        """Hold the lock that serializes the sessions to one host.
+
+        The lock is dropped when the last thread that used it is done, so hosts that left the fleet do not
+        keep an entry in a long-running process.
+        """
+        with self._lock:
+            entry = self._host_locks.get(pool_key)
+            if entry is None:
+                entry = self._host_locks[pool_key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._host_locks[pool_key]
+
+    def _connect(self, ssh_host, ssh_port, username):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            with instrumentation.SSH_CONNECT_SECONDS.time():
+                client.connect(ssh_host, port=ssh_port, username=username, pkey=self._get_key(),
+                               timeout=self.connect_timeout, banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout,
+                               allow_agent=False, look_for_keys=False, compress=self.compress)
+        except Exception:
+            instrumentation.SSH_ERRORS.labels('connect').inc()
+            client.close()
+            raise
+        if self.keepalive_interval:
+            client.get_transport().set_keepalive(self.keepalive_interval)
+        return client
+
+    def _checkout(self, pool_key):
+        """Return (client, reused) with a live connection for pool_key."""
+        self.evict_idle()
+        with self._lock:
+            entry = self._clients.pop(pool_key, None)
+        if entry is not None:
+            client = entry[0]
+            transport = client.get_transport()
+            if transport is not None and transport.is_active():
+                return client, True
+            client.close()
+        return self._connect(*pool_key), False
+
+    def _checkin(self, pool_key, client):
+        evicted = []
+        with self._lock:
+            self._clients[pool_key] = (client, time.monotonic())
+            while len(self._clients) > self.max_connections:
+                evicted.append(self._clients.popitem(last=False)[1][0])
+        for old_client in evicted:
+            old_client.close()
+
+    @staticmethod
+    def _run(client, command, timeout):
+        with instrumentation.SSH_EXEC_SECONDS.time():
+            _, stdout, _ = client.exec_command(command, timeout=timeout)
+            return stdout.read()
+
+    def exec_command(self, ssh_host, ssh_port, username, command, timeout=None):
+        """Run command on the host over a pooled connection and return its stdout as bytes."""
+        pool_key = (ssh_host, ssh_port, username)
+        with self._host_lock(pool_key):
+            client, reused = self._checkout(pool_key)
+            try:
+                try:
+                    output = self._run(client, command, timeout)
+                except (paramiko.ssh_exception.SSHException, EOFError, ConnectionError):
+                    # The pooled transport died since the last poll; reconnect once and try again
+                    client.close()
+                    if not reused:
+                        raise
+                    instrumentation.SSH_RECONNECTS.inc()
+                    client = self._connect(ssh_host, ssh_port, username)
+                    output = self._run(client, command, timeout)
+            except Exception as e:
+                if not isinstance(e, paramiko.ssh_exception.PasswordRequiredException):
+                    instrumentation.SSH_ERRORS.labels('exec').inc()
+                client.close()
+                raise
+            self._checkin(pool_key, client)
+            instrumentation.SSH_BYTES_READ.inc(len(output))
+            instrumentation.SSH_BYTES_PER_POLL.observe(len(output))
+            return output
+
+    @contextlib.contextmanager
+    def sftp(self, ssh_host, ssh_port, username):
+        """Open an SFTP session over a pooled connection, for use in a with statement.
+
+        The host's connection is held for the whole with block and returned to the pool afterwards.
+        """
+        pool_key = (ssh_host, ssh_port, username)
+        with self._host_lock(pool_key):
+            client, reused = self._checkout(pool_key)
+            try:
+                try:
+                    sftp = client.open_sftp()
+                except (paramiko.ssh_exception.SSHException, EOFError, ConnectionError):
+                    client.close()
+                    if not reused:
+                        raise
+                    instrumentation.SSH_RECONNECTS.inc()
+                    client = self._connect(ssh_host, ssh_port, username)
+                    sftp = client.open_sftp()
+            except Exception:
+                instrumentation.SSH_ERRORS.labels('sftp').inc()
+                client.close()
+                raise
+            try:
+                yield sftp
+            except Exception:
+                # The transfer may have left the connection in an unknown state
+                client.close()
+                raise
+            finally:
+                sftp.close()
+            self._checkin(pool_key, client)
+
+    def evict_idle(self):
+        """Close connections that have not been used for idle_ttl seconds."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = []
+        with self._lock:
+            # Entries are kept in least recently used order, so expired ones are at the front
+            while self._clients:
+                pool_key, (client, last_used) = next(iter(self._clients.items()))
+                if last_used > cutoff:
+                    break
+                del self._clients[pool_key]
+                evicted.append(client)
+        for client in evicted:
+            client.close()
+
+    def close_all(self):
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            client.close()
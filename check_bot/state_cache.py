@@ -0,0 +1,111 @@
+"""Last known good values of each instance, kept on disk between runs.
+
+The cache holds the last instance list and the last successfully parsed log_info of each instance,
+each with the Unix time it was read. Instances whose poll fails or is skipped are shown with their
+cached values and age instead of dropping out of the table and the fleet totals, and a restarted
+collector can print a full table before the first poll has finished. Entries older than ttl seconds
+are evicted.
+
+The file is JSON and replaced atomically on every save, so a crash never leaves half a cache behind.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+CACHE_VERSION = 1
+
+
+class StateCache:
+    """Last instance list and last good log_info per instance, with the time they were read."""
+
+    def __init__(self, path=None, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.instances = None  # (read at, ssh_info_list, total_dph_running_machines, total_gpus_running)
+        self.log_infos = {}    # instance_id -> (read at, log_info)
+        # Answers are recorded from the collection threads while the main thread reads or saves the cache
+        self._lock = threading.Lock()
+
+    def put_instances(self, ssh_info_list, total_dph_running_machines, total_gpus_running, now=None):
+        self.instances = (time.time() if now is None else now, ssh_info_list, total_dph_running_machines, total_gpus_running)
+
+    def put_log_info(self, instance_id, log_info, now=None):
+        with self._lock:
+            self.log_infos[instance_id] = (time.time() if now is None else now, tuple(log_info))
+
+    def get_log_info(self, instance_id):
+        """Return (read at, log_info) of the instance, or None."""
+        return self.log_infos.get(instance_id)
+
+    def forget(self, current_instance_ids):
+        """Drop the entries of instances that no longer exist."""
+        with self._lock:
+            for instance_id in list(self.log_infos):
+                if instance_id not in current_instance_ids:
+                    del self.log_infos[instance_id]
+
+    def discard(self, instance_ids):
+        """Drop the entries of these instances."""
+        with self._lock:
+            for instance_id in instance_ids:
+                self.log_infos.pop(instance_id, None)
+
+    def evict(self, now=None):
+        """Drop entries older than ttl seconds and return the IDs of the instances whose log_info was dropped."""
+        oldest = (time.time() if now is None else now) - self.ttl
+        with self._lock:
+            evicted = [instance_id for instance_id, (read_at, _) in self.log_infos.items() if read_at < oldest]
+            for instance_id in evicted:
+                del self.log_infos[instance_id]
+        if self.instances is not None and self.instances[0] < oldest:
+            self.instances = None
+        return evicted
+
+    def load(self):
+        """Read the cache file, if there is one. A missing or unreadable file leaves the cache empty."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('v') != CACHE_VERSION:
+                raise ValueError(f"unknown version {data.get('v')!r}")
+            instances = data.get('instances')
+            if instances:
+                # Caches of older versions could hold instances without a numeric ID
+                instances[1] = [ssh_info for ssh_info in instances[1] if isinstance(ssh_info.get('instance_id'), int)]
+            self.instances = tuple(instances) if instances else None
+            # Stored as a list because JSON object keys would turn the instance IDs into strings
+            self.log_infos = {instance_id: (read_at, tuple(log_info)) for instance_id, read_at, log_info in data.get('log_infos', [])}
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning("Ignoring the state cache %s: %s", self.path, e)
+            self.instances = None
+            self.log_infos = {}
+            return False
+        self.evict()
+        return self.instances is not None or bool(self.log_infos)
+
+    def save(self):
+        """Write the cache file, replacing it atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            log_infos = [[instance_id, read_at, list(log_info)] for instance_id, (read_at, log_info) in self.log_infos.items()]
+        data = {'v': CACHE_VERSION, 'instances': list(self.instances) if self.instances is not None else None, 'log_infos': log_infos}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        f = tempfile.NamedTemporaryFile('w', dir=directory, prefix='.' + os.path.basename(self.path), delete=False)
+        try:
+            with f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(f.name, self.path)
+        except BaseException:
+            # A full disk or an interrupted write must not leave the temporary file behind
+            try:
+                os.unlink(f.name)
+            except OSError:
+                pass
+            raise
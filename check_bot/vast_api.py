@@ -0,0 +1,146 @@
+"""Vast.ai API client.
+
+One pooled requests.Session is shared by all calls. Every request has explicit timeouts. 429s,
+5xx responses and connection errors are retried with exponential backoff and full jitter,
+honouring Retry-After. When the API sends ETag or Last-Modified, the next request for the same
+endpoint is conditional, and a 304 answer is served from the cached body.
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import instrumentation
+
+
+API_BASE_URL = 'https://console.vast.ai/api/v0'
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class VastApiError(Exception):
+    """The API answered with a status code that retrying does not fix (or retries ran out)."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Status code: {status_code}. Response: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def _retry_after_seconds(value):
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class VastClient:
+    """Client for the Vast.ai endpoints used by the script, safe to share between threads."""
+
+    def __init__(self, api_key, base_url=API_BASE_URL, connect_timeout=10, read_timeout=30, max_retries=4,
+                 backoff_base=1.0, backoff_max=60.0, pool_size=4):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/json'
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._cache = {}  # path -> (etag, last_modified, json body)
+        self._cache_lock = threading.Lock()
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: a random delay up to the exponential bound spreads out clients that failed together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get(self, path, authenticated=True, decode=True):
+        """GET base_url + path and return the decoded JSON body, or None when decode is False and only
+        the status matters.
+
+        Raises VastApiError for error responses and requests.exceptions.RequestException when the
+        API could not be reached, in both cases after retries where retrying makes sense.
+        """
+        params = {'api_key': self.api_key} if authenticated else None
+        headers = {}
+        with self._cache_lock:
+            cached = self._cache.get(path) if decode else None
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        request_seconds = instrumentation.API_REQUEST_SECONDS.labels(path)
+        for attempt in range(self.max_retries + 1):
+            retries_left = attempt < self.max_retries
+            try:
+                with request_seconds.time():
+                    response = self.session.get(self.base_url + path, params=params, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not retries_left:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning("Request to %s failed (%s), retrying in %.1f seconds...", path, e.__class__.__name__, delay)
+                instrumentation.API_RETRIES.labels('connection').inc()
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 429:
+                instrumentation.API_RATE_LIMITED.inc()
+            if response.status_code == 304 and cached is not None:
+                instrumentation.API_NOT_MODIFIED.inc()
+                return cached[2]
+            if response.status_code == 200:
+                if not decode:
+                    return None
+                body = response.json()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    with self._cache_lock:
+                        self._cache[path] = (etag, last_modified, body)
+                return body
+            if response.status_code in RETRY_STATUS_CODES and retries_left:
+                delay = self._backoff(attempt, _retry_after_seconds(response.headers.get('Retry-After')))
+                if response.status_code == 429:
+                    logging.error("Too many requests, retrying in %.1f seconds...", delay)
+                else:
+                    logging.warning("API returned %s for %s, retrying in %.1f seconds...", response.status_code, path, delay)
+                instrumentation.API_RETRIES.labels('429' if response.status_code == 429 else '5xx').inc()
+                time.sleep(delay)
+                continue
+            if response.status_code == 429:
+                logging.error("Maximum retries reached. Please try again later.")
+            raise VastApiError(response.status_code, response.text)
+
+    def test_connection(self):
+        # The root page is not JSON: a 200 is all that is checked
+        self.get('/', authenticated=False, decode=False)
+
+    def instances(self):
+        return self.get('/instances/')
+
+    def current_user(self):
+        return self.get('/users/current')
+
+    def close(self):
+        self.session.close()
+
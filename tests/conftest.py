@@ -0,0 +1,66 @@
+"""Fixtures shared by the tests."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class WebhookRecorder:
+    """HTTP server in a thread that records the JSON bodies POSTed to url.
+
+    Every request waits latency seconds, the first fail_first requests get a 503.
+    """
+
+    def __init__(self, latency=0.0, fail_first=0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.bodies = []   # decoded bodies of the accepted requests
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with recorder._lock:
+                    recorder.requests += 1
+                    failed = recorder.requests <= recorder.fail_first
+                time.sleep(recorder.latency)
+                if not failed:
+                    with recorder._lock:
+                        recorder.bodies.append(json.loads(body))
+                self.send_response(503 if failed else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/hook"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def webhook():
+    """Factory of WebhookRecorders, closed when the test ends."""
+    recorders = []
+
+    def start(latency=0.0, fail_first=0):
+        recorder = WebhookRecorder(latency, fail_first)
+        recorders.append(recorder)
+        return recorder
+
+    yield start
+    for recorder in recorders:
+        recorder.close()
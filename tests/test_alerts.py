@@ -0,0 +1,130 @@
+"""Tests of the alert pipeline: dedup, cooldown and batching of AlertDispatcher, and WebhookSink against
+a local webhook.
+
+Usage: python -m pytest
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+from check_bot.alerts import Alert, AlertDispatcher, Digest, WebhookSink
+
+
+class RecordingSink:
+    """Keeps the digests it was given and lets a test wait for them."""
+
+    name = 'recording'
+
+    def __init__(self):
+        self.digests = []
+        self._condition = threading.Condition()
+
+    def deliver(self, digest):
+        with self._condition:
+            self.digests.append(digest)
+            self._condition.notify_all()
+
+    def wait(self, count, timeout=5):
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.digests) >= count, timeout)
+
+    def keys(self):
+        return [alert.key for digest in self.digests for alert, _ in digest.entries]
+
+
+def test_dedup_merges_repeats_into_one_line():
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher([sink], batch_seconds=0.2)
+    for _ in range(3):
+        dispatcher.submit(Alert('stalled', 1, "miner.log of instance 1 has not advanced"))
+    dispatcher.submit(Alert('utilization', 1, "GPU Utilization for instance 1 is at 10.00%"))
+    dispatcher.close()
+
+    assert len(sink.digests) == 1
+    assert [(alert.key, count) for alert, count in sink.digests[0].entries] == [(('stalled', 1), 3), (('utilization', 1), 1)]
+    assert "(x3)" in sink.digests[0].text()
+
+
+def test_cooldown_suppresses_re_alerts_within_the_window():
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher([sink], cooldown=0.5, batch_seconds=0.05)
+    dispatcher.submit(Alert('unreachable', 7, "first"))
+    assert sink.wait(1)
+    dispatcher.submit(Alert('unreachable', 7, "within the cooldown"))
+    dispatcher.submit(Alert('unreachable', 8, "another instance"))
+    assert sink.wait(2)
+    time.sleep(0.6)
+    dispatcher.submit(Alert('unreachable', 7, "after the cooldown"))
+    dispatcher.close()
+
+    messages = [alert.message for digest in sink.digests for alert, _ in digest.entries]
+    assert messages == ["first", "another instance", "after the cooldown"]
+
+
+def test_digests_batch_alerts_up_to_max_batch():
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher([sink], batch_seconds=60, max_batch=2)
+    for instance_id in range(5):
+        dispatcher.submit(Alert('outlier', instance_id, f"instance {instance_id}"))
+    assert sink.wait(2)
+    dispatcher.close()
+
+    assert [len(digest.entries) for digest in sink.digests] == [2, 2, 1]
+    assert sink.keys() == [('outlier', instance_id) for instance_id in range(5)]
+
+
+def test_digests_batch_alerts_for_batch_seconds():
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher([sink], batch_seconds=0.3)
+    started = time.monotonic()
+    for instance_id in range(5):
+        dispatcher.submit(Alert('drop', instance_id, f"instance {instance_id}"))
+    assert sink.wait(1)
+    waited = time.monotonic() - started
+    dispatcher.close()
+
+    assert waited >= 0.25
+    assert [len(digest.entries) for digest in sink.digests] == [5]
+
+
+def test_webhook_sink_retries_503(webhook):
+    digest = Digest([(Alert('stalled', 3, "miner.log of instance 3 has not advanced"), 2)])
+    hook = webhook(fail_first=2)
+    WebhookSink(hook.url, max_retries=3, backoff_base=0.01).deliver(digest)
+    assert hook.requests == 3
+    assert len(hook.bodies) == 1
+    body = hook.bodies[0]
+    assert body['text'] == digest.text()
+    assert body['alerts'] == digest.records()
+
+
+def test_webhook_sink_gives_up_after_max_retries(webhook):
+    digest = Digest([(Alert('stalled', 3, "miner.log of instance 3 has not advanced"), 1)])
+    hook = webhook(fail_first=10)
+    with pytest.raises(requests.HTTPError):
+        WebhookSink(hook.url, max_retries=2, backoff_base=0.01).deliver(digest)
+    assert hook.requests == 3
+    assert not hook.bodies
+
+
+def test_slow_webhook_never_blocks_submit(webhook):
+    hook = webhook(latency=1.0)
+    dispatcher = AlertDispatcher([WebhookSink(hook.url, timeout=10, max_retries=0)], batch_seconds=0, max_batch=1, max_queued=100)
+    dispatcher.submit(Alert('outlier', 0, "instance 0"))
+    # Wait until the dispatcher thread is stuck in the slow POST
+    deadline = time.monotonic() + 5
+    while not hook.requests and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hook.requests == 1
+
+    slowest = 0.0
+    # More alerts than the queue holds: the surplus is dropped, not waited for
+    for instance_id in range(1, 1001):
+        started = time.perf_counter()
+        dispatcher.submit(Alert('outlier', instance_id, f"instance {instance_id}"))
+        slowest = max(slowest, time.perf_counter() - started)
+    assert slowest < 0.05
+    assert hook.requests == 1
+    dispatcher.close(timeout=0.1)